@@ -0,0 +1,290 @@
+#!/usr/bin/python
+# Encoding: ISO-8859-1
+# -----------------------------------------------------------------------------
+# Project           :   Tahchee                     <http://www.ivy.fr/tahchee>
+# -----------------------------------------------------------------------------
+# Author            :   Sebastien Pierre                     <sebastien@ivy.fr>
+# License           :   Revised BSD License
+# -----------------------------------------------------------------------------
+# Creation date     :   19-Oct-2026
+# Last mod.         :   19-Oct-2026
+# -----------------------------------------------------------------------------
+
+import os, re, glob
+
+try:
+	from hashlib import sha1 as hashfunc
+except ImportError,e:
+	import sha as hashfunc
+
+__doc__ = """\
+Concatenates the style sheets and scripts of a site into bundles, so that
+pages load fewer and smaller files. Bundles are declared with the BUNDLES
+option, which maps the path of each bundle to the list of its members (paths
+or globs relative to the pages directory):
+
+>   BUNDLES = {
+>       "all.css":["css/reset.css", "css/screen.css"],
+>       "all.js":["js/*.js"],
+>   }
+
+Members are minified (unless MINIFY is False), and the minified version of
+each member is cached in the `.minified` directory of the bundles directory,
+by the digest of its content. A bundle is only written again when one of its
+members changed, or when its members changed. Scripts are separated by
+semicolons, so that a script that does not end with one does not run into
+the next.
+
+The minifiers are conservative: they remove comments and whitespace, but do
+not rename anything, and keep the line breaks of scripts so that statements
+without semicolons still work."""
+
+CSS_EXTENSIONS = (".css",)
+JS_EXTENSIONS  = (".js",)
+
+# Comments and strings are matched together, so that comments within strings
+# are left as they are
+RE_CSS_TOKENS   = re.compile(r'("(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')|(/\*.*?\*/)', re.S)
+RE_CSS_SPACES   = re.compile(r"\s+")
+RE_CSS_PUNCTUATION = re.compile(r"\s*([{};,>])\s*")
+RE_CSS_COLON    = re.compile(r":\s+")
+
+def minifyCSS( text ):
+	"""Returns the given CSS text without its comments (except those starting
+	with `/*!`, which are usually licenses) and extra whitespace."""
+	res    = []
+	code   = []
+	offset = 0
+	# The code around removed comments is minified at once, and strings and
+	# kept comments are left as they are
+	for match in RE_CSS_TOKENS.finditer(text):
+		code.append(text[offset:match.start()])
+		string, comment = match.groups()
+		if string or comment.startswith("/*!"):
+			res.append(_minifyCSSCode("".join(code)))
+			code = []
+			if string: res.append(string)
+			else: res.append(comment + "\n")
+		offset = match.end()
+	code.append(text[offset:])
+	res.append(_minifyCSSCode("".join(code)))
+	# The only line breaks left are the ones after the kept comments
+	lines = map(lambda l:l.strip(), "".join(res).split("\n"))
+	return "\n".join(filter(None, lines))
+
+def _minifyCSSCode( code ):
+	code = RE_CSS_SPACES.sub(" ", code)
+	code = RE_CSS_PUNCTUATION.sub(r"\1", code)
+	return RE_CSS_COLON.sub(":", code).replace(";}", "}")
+
+# The characters after which a slash starts a regular expression rather than
+# a division
+JS_REGEXP_PREFIX = "(,=:[!&|?{};~+-*%^<>\n"
+# The keywords after which a slash starts a regular expression
+RE_JS_REGEXP_KEYWORD = re.compile(r"(?:^|[^\w$])(?:return|typeof|case|do|else|in|of|void|yield|throw|delete|new)$")
+# The tokens after which a slash may start a regular expression as well as a
+# division, like in `if (a) /b/.test(c)` and `(a) / b`
+RE_JS_AMBIGUOUS = re.compile(r"(?:[)}]|\+\+|--)$")
+
+def minifyJS( text ):
+	"""Returns the given JavaScript text without its comments (except those
+	starting with `/*!`), blank lines and indentation. Strings, template
+	strings and regular expressions are kept as they are. When a slash may
+	start a regular expression as well as a division, the rest of its line is
+	kept as it is."""
+	res   = []
+	i     = 0
+	n     = len(text)
+	last  = "\n"
+	while i < n:
+		c = text[i]
+		if c in "'\"`":
+			j = i + 1
+			while j < n and text[j] != c:
+				if text[j] == "\\": j += 1
+				j += 1
+			res.append(text[i:j+1])
+			i    = j + 1
+			last = c
+		elif text.startswith("//", i):
+			j = text.find("\n", i)
+			if j == -1: j = n
+			i = j
+		elif text.startswith("/*", i):
+			j = text.find("*/", i + 2)
+			if j == -1: j = n
+			if text.startswith("/*!", i): res.append(text[i:j+2] + "\n")
+			elif text[i:j].find("\n") != -1: res.append("\n")
+			i = j + 2
+		elif c == "/" and RE_JS_AMBIGUOUS.search("".join(res[-3:]).rstrip()):
+			j = text.find("\n", i)
+			if j == -1: j = n
+			res.append(text[i:j])
+			last = text[i:j].rstrip()[-1]
+			i    = j
+		elif c == "/" and (last in JS_REGEXP_PREFIX or \
+		RE_JS_REGEXP_KEYWORD.search("".join(res[-12:]))):
+			j = i + 1
+			in_class = False
+			while j < n and text[j] != "\n":
+				if text[j] == "\\": j += 1
+				elif text[j] == "[": in_class = True
+				elif text[j] == "]": in_class = False
+				elif text[j] == "/" and not in_class: break
+				j += 1
+			res.append(text[i:j+1])
+			i    = j + 1
+			last = "/"
+		elif c in " \t\r\n":
+			j = i
+			while j < n and text[j] in " \t\r\n": j += 1
+			if text[i:j].find("\n") != -1: res.append("\n")
+			elif res and res[-1] not in (" ", "\n"): res.append(" ")
+			i = j
+		else:
+			res.append(c)
+			last = c
+			i += 1
+	# We remove the spaces at the beginning and end of lines, and the blank
+	# lines
+	lines = map(lambda l:l.strip(), "".join(res).split("\n"))
+	return "\n".join(filter(None, lines))
+
+def joinScripts( scripts ):
+	"""Joins the given scripts, ending each of them with a semicolon, so that
+	a script whose last statement has no semicolon does not run into the
+	next one (which may start with a parenthesis)."""
+	res = []
+	for text in scripts:
+		text = text.rstrip()
+		if not text: continue
+		if not text.endswith(";"):
+			# The last line may end with a comment
+			if text[text.rfind("\n")+1:].find("//") != -1: text += "\n"
+			text += ";"
+		res.append(text)
+	return "\n".join(res)
+
+def minifyText( path, text ):
+	"""Minifies the given text according to the extension of the given path.
+	Other files are returned as they are."""
+	ext = os.path.splitext(path)[1].lower()
+	if ext in CSS_EXTENSIONS: return minifyCSS(text)
+	if ext in JS_EXTENSIONS: return minifyJS(text)
+	return text
+
+#------------------------------------------------------------------------------
+#
+#  Bundler
+#
+#------------------------------------------------------------------------------
+
+class Bundler:
+	"""Writes the bundles of the given site in the given directory. The given
+	state is a dictionary that keeps the members of each bundle with their
+	digest, and the keys of the minified members that are cached in the
+	`.minified` directory of the given directory (see `SiteBuilder.state`)."""
+
+	def __init__( self, site, directory, state=None ):
+		self.site      = site
+		self.directory = directory
+		if state is None: state = {}
+		self.state     = state
+		# Maps the bundles to a ((members, minify), digests) couple
+		self.members   = state.setdefault("members", {})
+		# Has the keys of the cached minified members (see `minifiedPath`)
+		self.minified  = state.setdefault("minified", {})
+
+	def expand( self, globs ):
+		"""Returns the absolute paths of the files matching the given globs
+		(relative to the site pages), in the given order, without
+		duplicates."""
+		pages = self.site.pages()
+		res   = []
+		for pattern in globs:
+			paths = glob.glob(os.path.join(pages, pattern))
+			paths.sort()
+			for path in paths:
+				path = os.path.abspath(path)
+				if path not in res and os.path.isfile(path): res.append(path)
+		return res
+
+	def path( self, name ):
+		"""Returns the path of the file for the bundle with the given name."""
+		return os.path.join(self.directory, name)
+
+	def minifiedPath( self, key ):
+		"""Returns the path of the cached minified member with the given key,
+		which is the digest of the member followed by its extension."""
+		return os.path.join(self.directory, ".minified", key)
+
+	def minify( self, path, data, digest ):
+		"""Returns the minified version of the given data of the member at the
+		given path, whose digest is given, from the cache when possible."""
+		key    = digest + os.path.splitext(path)[1].lower()
+		cached = self.minifiedPath(key)
+		if self.minified.has_key(key) and os.path.exists(cached):
+			fd  = open(cached, "rb")
+			res = fd.read()
+			fd.close()
+		else:
+			res = minifyText(path, data)
+			if not os.path.exists(os.path.dirname(cached)): os.makedirs(os.path.dirname(cached))
+			fd = open(cached, "wb")
+			fd.write(res)
+			fd.close()
+		self.minified[key] = True
+		return res
+
+	def update( self, bundles, hasChanged, minify=True ):
+		"""Writes the given bundles (a dictionary mapping the bundle names to
+		the globs of their members) that changed, which is the case when one
+		of their members changed according to the given hasChanged function,
+		when their members changed or when their file does not exist. Returns
+		the list of the names of the bundles that were written."""
+		written = []
+		used    = {}
+		for name, globs in bundles.items():
+			members = self.expand(globs)
+			# Every member is given to hasChanged, so that their change is
+			# registered
+			changed = filter(None, map(hasChanged, members))
+			key     = (tuple(members), minify)
+			known   = self.members.get(name)
+			if not changed and known and known[0] == key and \
+			os.path.exists(self.path(name)):
+				for member, digest in map(None, members, known[1]):
+					used[digest + os.path.splitext(member)[1].lower()] = True
+				continue
+			content = []
+			digests = []
+			for member in members:
+				fd     = open(member, "rb")
+				data   = fd.read()
+				fd.close()
+				digest = hashfunc(data).hexdigest()
+				digests.append(digest)
+				used[digest + os.path.splitext(member)[1].lower()] = True
+				if minify: content.append(self.minify(member, data, digest))
+				else: content.append(data)
+			path = self.path(name)
+			if not os.path.exists(os.path.dirname(path)): os.makedirs(os.path.dirname(path))
+			fd = open(path, "wb")
+			if os.path.splitext(name)[1].lower() in JS_EXTENSIONS: fd.write(joinScripts(content) + "\n")
+			else: fd.write("\n".join(content) + "\n")
+			fd.close()
+			self.members[name] = (key, tuple(digests))
+			written.append(name)
+		# We forget the bundles and minified members that are not used anymore
+		for name in self.members.keys():
+			if not bundles.has_key(name):
+				del self.members[name]
+				if os.path.exists(self.path(name)): os.unlink(self.path(name))
+		for key in self.minified.keys():
+			if used.has_key(key): continue
+			del self.minified[key]
+			if os.path.exists(self.minifiedPath(key)): os.unlink(self.minifiedPath(key))
+		written.sort()
+		return written
+
+# EOF - vim: tw=80 ts=4 sw=4 noet
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# Encoding: ISO-8859-1
+# -----------------------------------------------------------------------------
+# Project           :   Tahchee                     <http://www.ivy.fr/tahchee>
+# -----------------------------------------------------------------------------
+# Author            :   Sebastien Pierre                     <sebastien@ivy.fr>
+# License           :   Revised BSD License
+# -----------------------------------------------------------------------------
+# Creation date     :   19-Oct-2026
+# Last mod.         :   19-Oct-2026
+# -----------------------------------------------------------------------------
+
+import os, gzip
+
+try:
+	from hashlib import sha1 as hashfunc
+except ImportError,e:
+	import sha as hashfunc
+
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+
+try:
+	import brotli
+except ImportError:
+	brotli = None
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+__doc__ = """\
+Writes precompressed variants of the files of a generated website, so that
+web servers can serve them directly (like nginx `gzip_static` and
+`brotli_static`). Each file with one of the configured extensions gets a
+`.gz`, `.br` or `.zst` sidecar file next to it.
+
+The digest of each compressed file is cached, so that only the files whose
+content changed since the last build are compressed again. The digests of the
+generated files are given by the build manifest (see `tahchee.manifest`), and
+the other files are read when their size or modification time changed.
+Compression happens in worker processes when there are many files."""
+
+GZIP    = "gz"
+BROTLI  = "br"
+ZSTD    = "zst"
+FORMATS = (GZIP, BROTLI, ZSTD)
+
+# The extensions of the files that are compressed by default
+EXTENSIONS = (".html", ".htm", ".css", ".js", ".xml", ".txt", ".svg", ".json")
+
+# Files are only compressed in worker processes above this number of files
+POOL_THRESHOLD = 16
+
+def hasFormat( name ):
+	"""Tells if the given compression format is available."""
+	if name == GZIP: return True
+	if name == BROTLI: return brotli is not None
+	if name == ZSTD: return zstandard is not None
+	return False
+
+def compressData( name, data ):
+	"""Returns the given data compressed with the given format, using the
+	highest compression level, as files are only compressed once."""
+	if name == BROTLI:
+		return brotli.compress(data)
+	elif name == ZSTD:
+		return zstandard.ZstdCompressor(level=19).compress(data)
+	else:
+		return None
+
+def missingSidecars( path, formats ):
+	"""Returns the list of the given formats whose sidecar file does not exist
+	for the file at the given path."""
+	return [name for name in formats if not os.path.exists(path + "." + name)]
+
+def writeSidecar( name, path, data ):
+	"""Writes the sidecar file of the given format for the file at the given
+	path, whose content is given. The sidecar gets the same modification time
+	as the file."""
+	sidecar = path + "." + name
+	fd = open(sidecar, "wb")
+	try:
+		# The gzip header gets no file name and no time, so that the same
+		# content always gives the same sidecar
+		if name == GZIP:
+			gz = gzip.GzipFile("", "wb", 9, fd, 0)
+			gz.write(data)
+			gz.close()
+		else:
+			fd.write(compressData(name, data))
+	finally:
+		fd.close()
+	st = os.stat(path)
+	os.utime(sidecar, (st.st_atime, st.st_mtime))
+
+def compressFile( task ):
+	"""Compresses the file of the given (path, digest, formats) task, returning
+	a (path, digest, written, error) tuple. When the file digest is the given
+	digest and all its sidecars exist, nothing is written. This function is
+	run by the worker processes."""
+	path, known_digest, formats = task
+	try:
+		fd   = file(path, "rb")
+		data = fd.read()
+		fd.close()
+		digest = hashfunc(data).hexdigest()
+		if digest == known_digest and not missingSidecars(path, formats):
+			return (path, digest, False, None)
+		for name in formats:
+			writeSidecar(name, path, data)
+		return (path, digest, True, None)
+	except (IOError, OSError), e:
+		return (path, None, False, str(e))
+
+#------------------------------------------------------------------------------
+#
+#  Compressor
+#
+#------------------------------------------------------------------------------
+
+class Compressor:
+	"""Maintains the compressed sidecars of the files in the output of the
+	given site. The given cache is a dictionary that is updated with the
+	(size, mtime, digest, formats) of each compressed file, and should be
+	given again on the next build (see `SiteBuilder.state`)."""
+
+	def __init__( self, site, cache=None ):
+		self.site       = site
+		if cache is None: cache = {}
+		self.cache      = cache
+		self.compressed = []
+
+	def update( self, formats, extensions=EXTENSIONS, jobs=None, digests=None ):
+		"""Writes the sidecars of the given formats for the files of the site
+		output with the given extensions, when the file changed since the
+		last time. The given digests map the paths of the output files
+		(relative to the output directory) to the digest of their content,
+		when it is known. Sidecars of the files that do not exist anymore (or
+		of the formats that are not used anymore) are removed. Returns a list
+		of (path, error) couples for the files that could not be
+		compressed."""
+		if digests is None: digests = {}
+		output  = self.site.output()
+		formats = tuple(formats)
+		files   = {}
+		tasks   = []
+		for root, dirs, names in os.walk(output):
+			for name in names:
+				if os.path.splitext(name)[1].lower() not in extensions: continue
+				path     = os.path.join(root, name)
+				relative = path[len(output)+1:].replace(os.sep, "/")
+				st       = os.stat(path)
+				files[relative] = (st.st_size, st.st_mtime)
+				known  = self.cache.get(relative)
+				digest = digests.get(relative)
+				if known and known[3] != formats:
+					self._remove(path, filter(lambda n:n not in formats, known[3]))
+					known = None
+				# Files whose digest is given are compared by digest, and the
+				# others are not read when their size and time did not change
+				if digest is not None: unchanged = known and known[2] == digest
+				else: unchanged = known and known[:2] == files[relative]
+				if unchanged and not missingSidecars(path, formats):
+					continue
+				tasks.append((path, digest is None and known and known[2] or None, formats))
+		# We remove the sidecars of the files that do not exist anymore
+		for relative in self.cache.keys():
+			if files.has_key(relative): continue
+			self._remove(os.path.join(output, relative), self.cache[relative][3])
+			del self.cache[relative]
+		errors = []
+		self.compressed = []
+		for path, digest, written, error in self._compress(tasks, jobs):
+			relative = path[len(output)+1:].replace(os.sep, "/")
+			if error:
+				errors.append((relative, error))
+				if self.cache.has_key(relative): del self.cache[relative]
+				continue
+			size, mtime = files[relative]
+			if written: self.compressed.append(relative)
+			self.cache[relative] = (size, mtime, digests.get(relative) or digest, formats)
+		self.compressed.sort()
+		return errors
+
+	def _remove( self, path, formats ):
+		for name in formats:
+			if os.path.exists(path + "." + name): os.unlink(path + "." + name)
+
+	def _compress( self, tasks, jobs=None ):
+		if jobs is None and multiprocessing: jobs = multiprocessing.cpu_count()
+		if multiprocessing and jobs > 1 and len(tasks) > POOL_THRESHOLD:
+			pool = multiprocessing.Pool(jobs)
+			try:
+				for result in pool.imap_unordered(compressFile, tasks, 4):
+					yield result
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			for task in tasks:
+				yield compressFile(task)
+
+# EOF - vim: tw=80 ts=4 sw=4 noet
@@ -0,0 +1,483 @@
+#!/usr/bin/python
+# Encoding: ISO-8859-1
+# -----------------------------------------------------------------------------
+# Project           :   Tahchee                     <http://www.ivy.fr/tahchee>
+# -----------------------------------------------------------------------------
+# Author            :   Sebastien Pierre                     <sebastien@ivy.fr>
+# License           :   Revised BSD License
+# -----------------------------------------------------------------------------
+# Creation date     :   19-Oct-2026
+# Last mod.         :   19-Oct-2026
+# -----------------------------------------------------------------------------
+
+import os, sys, shutil, getopt, threading, mimetypes, posixpath, urlparse
+import tahchee.manifest as manifest
+
+try:
+	import json
+except ImportError:
+	import simplejson as json
+
+try:
+	from multiprocessing.pool import ThreadPool
+except ImportError:
+	ThreadPool = None
+
+try:
+	import paramiko
+except ImportError:
+	paramiko = None
+
+try:
+	import boto3
+except ImportError:
+	boto3 = None
+
+__doc__ = """\
+Deploys a generated website to a target, using the manifest of the build (see
+`manifest.Manifest`). The manifest of the last deployment is kept on the
+target, so that only the files that changed since the last deployment are
+uploaded, and the files that were removed are deleted, without walking or
+hashing the output directory.
+
+Targets are given as URLs, and each kind of target has its backend:
+
+- a directory (`/var/www/site` or `file:///var/www/site`)
+- an SFTP server (`sftp://user@host:port/var/www/site`), which requires the
+  `paramiko` module
+- an S3 compatible storage (`s3://bucket/prefix`), which requires the `boto3`
+  module. The endpoint of other services than Amazon S3 is given with the
+  `endpoint` parameter, as in `s3://bucket/prefix?endpoint=http://host:9000`.
+
+Files are uploaded on several connections in parallel. Pages are uploaded
+last, so that they do not link to resources that are not uploaded yet, and the
+manifest of the deployment is only written at the end, so that an interrupted
+deployment is resumed by the next one."""
+
+# The name of the manifest of the last deployment, on the target
+DEPLOY_MANIFEST = ".tahchee.manifest"
+# The number of parallel connections
+JOBS            = 4
+# The extensions of the files that are uploaded last
+PAGE_EXTENSIONS = (".html", ".htm")
+
+class DeployError(Exception):
+	pass
+
+#------------------------------------------------------------------------------
+#
+#  Backends
+#
+#------------------------------------------------------------------------------
+
+class Backend:
+	"""The base class for deployment targets. Each thread that uses the backend
+	gets its own connection (see `connect`), and the connections are closed
+	by `close`. Paths given to the backend are relative to the target, with
+	'/' as separator."""
+
+	def __init__( self ):
+		self._local       = threading.local()
+		self._connections = []
+		self._lock        = threading.Lock()
+
+	def connection( self ):
+		"""Returns the connection of the current thread."""
+		res = getattr(self._local, "connection", None)
+		if res is None:
+			res = self._local.connection = self.connect()
+			self._lock.acquire()
+			try:
+				self._connections.append(res)
+			finally:
+				self._lock.release()
+		return res
+
+	def connect( self ):
+		"""Returns a new connection to the target."""
+		return None
+
+	def disconnect( self, connection ):
+		"""Closes the given connection."""
+		pass
+
+	def close( self ):
+		for connection in self._connections: self.disconnect(connection)
+		self._connections = []
+		self._local       = threading.local()
+
+	def upload( self, source, path ):
+		"""Abstract method that uploads the given local file to the given path,
+		to be implemented by each backend."""
+		raise NotImplementedError
+
+	def remove( self, path ):
+		"""Abstract method that removes the file with the given path if it
+		exists, to be implemented by each backend."""
+		raise NotImplementedError
+
+	def read( self, path ):
+		"""Abstract method that returns the content of the file with the given
+		path, or None if it does not exist, to be implemented by each
+		backend."""
+		raise NotImplementedError
+
+	def write( self, path, data ):
+		"""Abstract method that writes the given data to the file with the
+		given path, to be implemented by each backend."""
+		raise NotImplementedError
+
+class LocalBackend(Backend):
+	"""Deploys to a local directory (which can be a mounted filesystem)."""
+
+	def __init__( self, directory ):
+		Backend.__init__(self)
+		self.directory = directory
+
+	def _path( self, path ):
+		res = os.path.join(self.directory, *path.split("/"))
+		if not os.path.exists(os.path.dirname(res)):
+			try:
+				os.makedirs(os.path.dirname(res))
+			except OSError:
+				# The directory may have been created by another thread
+				if not os.path.isdir(os.path.dirname(res)): raise
+		return res
+
+	def upload( self, source, path ):
+		shutil.copyfile(source, self._path(path))
+
+	def remove( self, path ):
+		path = os.path.join(self.directory, *path.split("/"))
+		if os.path.exists(path): os.unlink(path)
+
+	def read( self, path ):
+		path = os.path.join(self.directory, *path.split("/"))
+		if not os.path.exists(path): return None
+		fd = open(path, "rb")
+		try:
+			return fd.read()
+		finally:
+			fd.close()
+
+	def write( self, path, data ):
+		fd = open(self._path(path), "wb")
+		try:
+			fd.write(data)
+		finally:
+			fd.close()
+
+class SFTPBackend(Backend):
+	"""Deploys to a directory of an SFTP server. Connections are created with
+	`paramiko`, or with the given connect function, which must return an
+	object with the methods of `paramiko.SFTPClient`."""
+
+	def __init__( self, host, directory, user=None, port=22, password=None, connect=None ):
+		Backend.__init__(self)
+		self.host      = host
+		self.directory = directory.rstrip("/") or "/"
+		self.user      = user
+		self.port      = port or 22
+		self.password  = password
+		self._connect  = connect
+		if connect is None and paramiko is None:
+			raise DeployError("The 'paramiko' module is required to deploy with SFTP")
+
+	def connect( self ):
+		if self._connect: return self._connect()
+		client = paramiko.SSHClient()
+		client.load_system_host_keys()
+		client.connect(self.host, self.port, self.user, self.password)
+		sftp = client.open_sftp()
+		# We keep the client, so that the connection is not closed when it is
+		# garbage collected
+		sftp.tahchee_client = client
+		return sftp
+
+	def disconnect( self, connection ):
+		connection.close()
+		client = getattr(connection, "tahchee_client", None)
+		if client: client.close()
+
+	def _path( self, path ):
+		return posixpath.join(self.directory, path)
+
+	def _makedirs( self, sftp, directory ):
+		created = getattr(self._local, "directories", None)
+		if created is None: created = self._local.directories = {}
+		if created.has_key(directory) or directory in ("", "/"): return
+		try:
+			sftp.stat(directory)
+		except IOError:
+			self._makedirs(sftp, posixpath.dirname(directory))
+			try:
+				sftp.mkdir(directory)
+			except IOError:
+				# The directory may have been created by another connection
+				sftp.stat(directory)
+		created[directory] = True
+
+	def upload( self, source, path ):
+		sftp = self.connection()
+		path = self._path(path)
+		self._makedirs(sftp, posixpath.dirname(path))
+		sftp.put(source, path)
+
+	def remove( self, path ):
+		try:
+			self.connection().remove(self._path(path))
+		except IOError:
+			pass
+
+	def read( self, path ):
+		try:
+			fd = self.connection().open(self._path(path), "rb")
+		except IOError:
+			return None
+		try:
+			return fd.read()
+		finally:
+			fd.close()
+
+	def write( self, path, data ):
+		sftp = self.connection()
+		path = self._path(path)
+		self._makedirs(sftp, posixpath.dirname(path))
+		fd = sftp.open(path, "wb")
+		try:
+			fd.write(data)
+		finally:
+			fd.close()
+
+class S3Backend(Backend):
+	"""Deploys to a bucket of an S3 compatible storage, under the given
+	prefix. Clients are created with `boto3` (for the given endpoint URL, or
+	for Amazon S3), or with the given connect function, which must return an
+	object with the `put_object`, `get_object` and `delete_object` methods of
+	the `boto3` S3 client."""
+
+	def __init__( self, bucket, prefix="", endpoint=None, connect=None ):
+		Backend.__init__(self)
+		self.bucket   = bucket
+		self.prefix   = prefix.strip("/")
+		self.endpoint = endpoint
+		self._connect = connect
+		if connect is None and boto3 is None:
+			raise DeployError("The 'boto3' module is required to deploy to S3")
+
+	def connect( self ):
+		if self._connect: return self._connect()
+		# Sessions are not thread-safe, so each thread gets its own
+		return boto3.session.Session().client("s3", endpoint_url=self.endpoint)
+
+	def _key( self, path ):
+		if self.prefix: return self.prefix + "/" + path
+		return path
+
+	def upload( self, source, path ):
+		content_type, encoding = mimetypes.guess_type(path)
+		fd = open(source, "rb")
+		try:
+			self.connection().put_object(Bucket=self.bucket, Key=self._key(path),
+			Body=fd, ContentType=content_type or "application/octet-stream")
+		finally:
+			fd.close()
+
+	def remove( self, path ):
+		self.connection().delete_object(Bucket=self.bucket, Key=self._key(path))
+
+	def read( self, path ):
+		try:
+			res = self.connection().get_object(Bucket=self.bucket, Key=self._key(path))
+		except Exception, e:
+			code = getattr(e, "response", {}).get("Error", {}).get("Code")
+			if code in ("NoSuchKey", "404"): return None
+			raise
+		return res["Body"].read()
+
+	def write( self, path, data ):
+		self.connection().put_object(Bucket=self.bucket, Key=self._key(path),
+		Body=data, ContentType="application/json")
+
+def backend( target ):
+	"""Returns the backend for the given target URL (see the module
+	documentation)."""
+	url = urlparse.urlparse(target)
+	if url.scheme in ("", "file"):
+		return LocalBackend(url.path or target)
+	elif url.scheme == "sftp":
+		return SFTPBackend(url.hostname, url.path, url.username, url.port, url.password)
+	elif url.scheme == "s3":
+		endpoint = urlparse.parse_qs(url.query).get("endpoint")
+		return S3Backend(url.netloc, url.path, endpoint and endpoint[0])
+	else:
+		raise DeployError("Unsupported deployment target: " + target)
+
+#------------------------------------------------------------------------------
+#
+#  Deployer
+#
+#------------------------------------------------------------------------------
+
+class Deployer:
+	"""Deploys the files of the given output directory, listed in the given
+	build manifest, with the given backend."""
+
+	def __init__( self, output, manifestPath, backend, jobs=JOBS ):
+		self.output       = output
+		self.manifestPath = manifestPath
+		self.backend      = backend
+		self.jobs         = jobs or 1
+
+	def deployed( self ):
+		"""Returns the files of the manifest of the last deployment."""
+		data = self.backend.read(DEPLOY_MANIFEST)
+		if not data: return {}
+		try:
+			data = json.loads(data)
+		except ValueError:
+			return {}
+		if type(data) is not dict or data.get("version") != manifest.VERSION: return {}
+		return data.get("files", {})
+
+	def plan( self ):
+		"""Returns an (uploads, removals, files, deployed) tuple, where uploads
+		and removals are the lists of the paths to upload and remove, files the
+		files of the build manifest and deployed the files of the last
+		deployment."""
+		current = manifest.Manifest(self.manifestPath).load().previous
+		if not current and not os.path.exists(self.manifestPath):
+			raise DeployError("No build manifest, please build the site first: " + self.manifestPath)
+		deployed = self.deployed()
+		uploads, removals = manifest.diff(deployed, current)
+		# Pages are uploaded last
+		uploads.sort(lambda a,b:cmp(self._isPage(a), self._isPage(b)) or cmp(a, b))
+		return uploads, removals, current, deployed
+
+	def _isPage( self, path ):
+		return os.path.splitext(path)[1].lower() in PAGE_EXTENSIONS
+
+	def deploy( self, dryRun=False, log=None ):
+		"""Uploads the changed files and removes the removed ones, then writes
+		the manifest of the deployment. Returns an (uploaded, removed, errors)
+		tuple, where errors is a list of (path, message) couples. Files that
+		could not be uploaded or removed are deployed again the next time."""
+		uploads, removals, current, deployed = self.plan()
+		if dryRun: return uploads, removals, []
+		errors   = []
+		uploaded = []
+		removed  = []
+		def upload( path ):
+			try:
+				self.backend.upload(os.path.join(self.output, *path.split("/")), path)
+				return (path, None)
+			except Exception, e:
+				return (path, str(e))
+		def remove( path ):
+			try:
+				self.backend.remove(path)
+				return (path, None)
+			except Exception, e:
+				return (path, str(e))
+		pool = None
+		if ThreadPool and self.jobs > 1 and len(uploads) + len(removals) > 1:
+			pool = ThreadPool(self.jobs)
+		try:
+			# Pages are only uploaded once the resources are
+			for group in (filter(lambda p:not self._isPage(p), uploads), filter(self._isPage, uploads)):
+				if pool: results = pool.map(upload, group)
+				else: results = map(upload, group)
+				for path, error in results:
+					if error: errors.append((path, error))
+					else:
+						uploaded.append(path)
+						if log: log("Uploaded '%s'" % (path))
+			if pool: results = pool.map(remove, removals)
+			else: results = map(remove, removals)
+			for path, error in results:
+				if error: errors.append((path, error))
+				else:
+					removed.append(path)
+					if log: log("Removed  '%s'" % (path))
+		finally:
+			if pool:
+				pool.close()
+				pool.join()
+		# The manifest lists what was actually deployed
+		files = dict(deployed)
+		for path in uploaded: files[path] = current[path]
+		for path in removed: del files[path]
+		self.backend.write(DEPLOY_MANIFEST, json.dumps({"version":manifest.VERSION, "files":files},
+		indent=1, sort_keys=True) + "\n")
+		self.backend.close()
+		return uploaded, removed, errors
+
+#------------------------------------------------------------------------------
+#
+#  Command
+#
+#------------------------------------------------------------------------------
+
+HELP_DEPLOY = """\
+tahchee deploy [OPTIONS] TARGET [DIRECTORY]
+
+   Deploys the site built in the given directory (or the current directory)
+   to the given target, uploading only the files that changed since the
+   last deployment, and removing the files that were removed.
+
+   TARGET      a directory, sftp://user@host:port/path or s3://bucket/prefix
+               (with ?endpoint=URL for other storages than Amazon S3)
+   DIRECTORY   the directory of the site project
+
+   -l, --local      deploys Site/Local instead of Site/Remote
+   -j, --jobs N     uses N parallel connections (%d by default)
+   -n, --dry-run    only lists the files that would be uploaded or removed
+""" % (JOBS)
+
+def run( args ):
+	"""Runs the deploy command with the given arguments, returning the number
+	of errors."""
+	try:
+		options, args = getopt.getopt(args, "lj:n", ["local", "jobs=", "dry-run"])
+	except getopt.GetoptError, e:
+		print HELP_DEPLOY
+		return 1
+	if len(args) not in (1, 2):
+		print HELP_DEPLOY
+		return 1
+	mode   = "Remote"
+	jobs   = JOBS
+	dryRun = False
+	for option, value in options:
+		if option in ("-l", "--local"): mode = "Local"
+		elif option in ("-j", "--jobs"):
+			try:
+				jobs = int(value)
+			except ValueError:
+				jobs = 0
+			if jobs < 1:
+				print " [!] The number of jobs must be a positive number, not '%s'" % (value)
+				print HELP_DEPLOY
+				return 1
+		elif option in ("-n", "--dry-run"): dryRun = True
+	directory = os.getcwd()
+	if len(args) == 2: directory = args[1]
+	output = os.path.join(directory, "Site", mode)
+	def log( message ): print " [ ] " + message
+	try:
+		deployer = Deployer(output, output + ".manifest", backend(args[0]), jobs)
+		uploaded, removed, errors = deployer.deploy(dryRun, log)
+	except DeployError, e:
+		print " [!] " + str(e)
+		return 1
+	for path, error in errors:
+		print " [!] %s: %s" % (path, error)
+	if dryRun:
+		for path in uploaded: print "Upload %s" % (path)
+		for path in removed: print "Remove %s" % (path)
+		print "%d files would be uploaded, %d files would be removed" % (len(uploaded), len(removed))
+	else:
+		print "%d files uploaded, %d files removed, %d errors" % (len(uploaded), len(removed), len(errors))
+	return len(errors)
+
+# EOF - vim: tw=80 ts=4 sw=4 noet
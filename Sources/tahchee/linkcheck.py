@@ -0,0 +1,251 @@
+#!/usr/bin/python
+# Encoding: ISO-8859-1
+# -----------------------------------------------------------------------------
+# Project           :   Tahchee                     <http://www.ivy.fr/tahchee>
+# -----------------------------------------------------------------------------
+# Author            :   Sebastien Pierre                     <sebastien@ivy.fr>
+# License           :   Revised BSD License
+# -----------------------------------------------------------------------------
+# Creation date     :   19-Oct-2026
+# Last mod.         :   19-Oct-2026
+# -----------------------------------------------------------------------------
+
+import os, re, posixpath, urllib, HTMLParser
+
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+
+__doc__ = """\
+Checks the links of a generated website. Every HTML file of the site output
+is tokenized to collect its links and its anchors (`id` attributes and `name`
+of `<a>` elements), and links to missing files or to missing anchors are
+reported.
+
+The links and anchors of each file are cached with the digest of the file, so
+that only the files that changed since the last check are scanned again. The
+digests of the generated files are given by the build manifest (see
+`tahchee.manifest`), so that the unchanged files are not even read."""
+
+# The extensions of the files that are scanned
+HTML_EXTENSIONS = (".html", ".htm")
+
+# The attributes that hold links, for each element
+LINK_ATTRIBUTES = {
+	"a":("href",),
+	"area":("href",),
+	"link":("href",),
+	"img":("src",),
+	"script":("src",),
+	"iframe":("src",),
+	"frame":("src",),
+	"embed":("src",),
+	"input":("src",),
+}
+
+# Links with a scheme (like "http:" or "mailto:") are not checked, unless they
+# start with the site URL
+RE_SCHEME = re.compile("^[a-zA-Z][a-zA-Z0-9+.\-]*:")
+
+# Files are only scanned in worker processes above this number of files
+POOL_THRESHOLD = 16
+
+# The size of the chunks in which files are hashed and parsed
+CHUNK_SIZE = 64 * 1024
+
+#------------------------------------------------------------------------------
+#
+#  Scanning
+#
+#------------------------------------------------------------------------------
+
+class LinkParser(HTMLParser.HTMLParser):
+	"""Collects the links and the anchors of an HTML file as it is fed."""
+
+	def __init__( self ):
+		HTMLParser.HTMLParser.__init__(self)
+		self.links   = []
+		self.anchors = []
+
+	def handle_starttag( self, tag, attrs ):
+		names = LINK_ATTRIBUTES.get(tag, ())
+		for name, value in attrs:
+			if value is None: continue
+			if name in names:
+				self.links.append(value.strip())
+			elif name == "id" or name == "name" and tag == "a":
+				self.anchors.append(value)
+
+	handle_startendtag = handle_starttag
+
+def readFile( path ):
+	"""Yields the content of the file at the given path by chunks, so that
+	large files are not loaded in memory."""
+	fd = file(path, "rb")
+	try:
+		while True:
+			data = fd.read(CHUNK_SIZE)
+			if not data: break
+			yield data
+	finally:
+		fd.close()
+
+def scanFile( task ):
+	"""Scans the given (path, known digest, digest, algorithm) task, returning
+	a (path, digest, links, anchors, error) tuple. The digest of the file is
+	computed with the given algorithm when it is None, and is tagged with it
+	like the digests of the build manifest (see `SiteBuilder.tag`). When it
+	is the known digest, the file is not parsed and links and anchors are
+	None. This function is run by the worker processes."""
+	path, known_digest, digest, algorithm = task
+	if digest is None:
+		from tahchee.main import hashFile
+		digest = "%s:%s" % (algorithm, hashFile(path, algorithm))
+	if digest == known_digest:
+		return (path, digest, None, None, None)
+	parser = LinkParser()
+	error  = None
+	try:
+		for data in readFile(path): parser.feed(data)
+		parser.close()
+	except HTMLParser.HTMLParseError, e:
+		error = str(e)
+	return (path, digest, parser.links, parser.anchors, error)
+
+#------------------------------------------------------------------------------
+#
+#  Checking
+#
+#------------------------------------------------------------------------------
+
+class LinkChecker:
+	"""Checks the links of the HTML files in the output of the given site. The
+	given cache is a dictionary that is updated with the (digest, links,
+	anchors) of each scanned file, and should be given again on the next
+	check (see `SiteBuilder.state`)."""
+
+	def __init__( self, site, cache=None ):
+		self.site    = site
+		if cache is None: cache = {}
+		self.cache   = cache
+		self.scanned = 0
+
+	def check( self, jobs=None, digests=None ):
+		"""Scans the site output and returns the list of problems as (page,
+		link, message) triples, where page is relative to the site output.
+		The given digests map the paths of the output files (relative to the
+		site output) to their tagged digest, when it is known, in which case
+		the files whose digest did not change are not read."""
+		if digests is None: digests = {}
+		algorithm = self.site.hash()
+		output = self.site.output()
+		files  = {}
+		tasks  = []
+		for root, dirs, names in os.walk(output):
+			for name in names:
+				path     = os.path.join(root, name)
+				relative = path[len(output)+1:].replace(os.sep, "/")
+				files[relative] = path
+				if os.path.splitext(name)[1].lower() in HTML_EXTENSIONS:
+					known  = self.cache.get(relative)
+					digest = digests.get(relative)
+					if digest is not None and known and known[0] == digest: continue
+					tasks.append((path, known and known[0], digest, algorithm))
+		# We forget the pages that do not exist anymore
+		for relative in self.cache.keys():
+			if not files.has_key(relative): del self.cache[relative]
+		problems = []
+		self.scanned = 0
+		for path, digest, links, anchors, error in self._scan(tasks, jobs):
+			relative = path[len(output)+1:].replace(os.sep, "/")
+			if links is None: continue
+			self.scanned += 1
+			if error: problems.append((relative, None, "Unable to parse: " + error))
+			self.cache[relative] = (digest, links, anchors)
+		# And now that we have all the anchors, we can check the links
+		anchors = {}
+		for relative, (digest, page_links, page_anchors) in self.cache.items():
+			anchors[relative] = dict.fromkeys(page_anchors)
+		pages = self.cache.keys()
+		pages.sort()
+		for page in pages:
+			checked = {}
+			for link in self.cache[page][1]:
+				if checked.has_key(link): continue
+				checked[link] = True
+				message = self.checkLink(page, link, files, anchors)
+				if message: problems.append((page, link, message))
+		return problems
+
+	def _scan( self, tasks, jobs=None ):
+		if jobs is None and multiprocessing: jobs = multiprocessing.cpu_count()
+		if multiprocessing and jobs > 1 and len(tasks) > POOL_THRESHOLD:
+			pool = multiprocessing.Pool(jobs)
+			try:
+				for result in pool.imap_unordered(scanFile, tasks, 8):
+					yield result
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			for task in tasks:
+				yield scanFile(task)
+
+	def resolve( self, page, link ):
+		"""Returns a (path, anchor) couple for the given link found in the
+		given page (both relative to the site output), where path is relative
+		to the site output as well. Returns None for external links, and
+		(None, anchor) for links outside of the site output."""
+		url = self.site.url()
+		if url and link.startswith(url + "/"):
+			link = link[len(url):]
+		elif RE_SCHEME.match(link) or link.startswith("//"):
+			return None
+		path, anchor = (link.split("#", 1) + [None])[:2]
+		path = urllib.unquote(path.split("?", 1)[0])
+		if not path:
+			return (page, anchor)
+		if path.startswith("/"):
+			path = path[1:]
+		else:
+			path = posixpath.join(posixpath.dirname(page), path)
+		trailing = path.endswith("/")
+		path = posixpath.normpath(path)
+		if path == ".." or path.startswith("../"): return (None, anchor)
+		if path == ".": path = ""
+		if trailing and path: path += "/"
+		return (path, anchor)
+
+	def checkLink( self, page, link, files, anchors ):
+		"""Returns None if the given link from the given page is valid, or a
+		message describing the problem. Files maps the paths of the files of
+		the site output to their absolute path, and anchors maps the HTML
+		pages to their anchors."""
+		if not link or link == "#": return None
+		resolved = self.resolve(page, link)
+		if resolved is None: return None
+		path, anchor = resolved
+		if path is None:
+			return "Link goes outside of the site"
+		if not files.has_key(path):
+			directory = os.path.join(self.site.output(), path)
+			if os.path.isdir(directory):
+				index = self._index(directory)
+				if index is None: return "Directory has no index"
+				path = (path.rstrip("/") + "/" + index).lstrip("/")
+			else:
+				return "Missing file"
+		if anchor and anchors.has_key(path) and not anchors[path].has_key(urllib.unquote(anchor)):
+			return "Missing anchor '%s' in '%s'" % (anchor, path)
+		return None
+
+	def _index( self, directory ):
+		names = os.listdir(directory)
+		names.sort()
+		for name in names:
+			if self.site.isDirectoryIndex(name) and os.path.isfile(os.path.join(directory, name)):
+				return name
+		return None
+
+# EOF - vim: tw=80 ts=4 sw=4 noet
@@ -20,13 +20,40 @@ __version__ = "1.0.1"
 
 def version(): return __version__
 
-import os, sys, time, shutil, stat, pickle, glob, fnmatch, re, StringIO, webbrowser
+import os, sys, time, shutil, stat, pickle, glob, fnmatch, re, getopt, StringIO, webbrowser
 
 try:
 	from hashlib import sha1 as hashfunc
 except ImportError,e:
 	import sha as hashfunc
 
+# BLAKE2 is part of hashlib for Python 3.6+, and is available as the
+# 'pyblake2' module for older versions
+try:
+	from hashlib import blake2b
+except ImportError:
+	try:
+		from pyblake2 import blake2b
+	except ImportError:
+		blake2b = None
+
+try:
+	from xxhash import xxh3_64 as xxh3
+except ImportError:
+	xxh3 = None
+
+try:
+	import mmap
+except ImportError:
+	mmap = None
+
+try:
+	from multiprocessing.pool import ThreadPool
+	from multiprocessing import cpu_count
+except ImportError:
+	ThreadPool = None
+	cpu_count  = None
+
 try:
 	import Cheetah
 	from Cheetah.Template import Template
@@ -39,10 +66,83 @@ except:
 	print "Cheetah 0.9.17+ is required. See <http://www.cheetahtemplate.org>"
 	sys.exit()
 
+import tahchee.linkcheck as linkcheck
+import tahchee.sitemap as sitemap
+import tahchee.walker as walker
+import tahchee.compress as compress
+import tahchee.bundle as bundle
+import tahchee.manifest as manifest
+import tahchee.deploy as deploy
+import tahchee.sharding as sharding
+
 CHANGE_CHECKSUM   ="signature"
 CHANGE_DATE       ="date"
+HASH_SHA1         ="sha1"
+HASH_BLAKE2B      ="blake2b"
+HASH_XXH3         ="xxh3"
 RE_ALWAYS_REBUILD = re.compile("^\s*##\s*ALWAYS_REBUILD\s*$")
 RE_DEPENDS        = re.compile("^\s*##\s*DEPENDS\s*=(.+)$")
+RE_META           = re.compile("^\s*##\s*([A-Za-z_][A-Za-z0-9_]*)\s*=(.*)$")
+RE_DEF_TITLE      = re.compile("^\s*#def\s+title\s*:(.*)$")
+
+# Files are hashed by chunks of this size, and files larger than
+# HASH_MMAP_SIZE are hashed from a memory map
+HASH_CHUNK_SIZE   = 1024 * 1024
+HASH_MMAP_SIZE    = 64 * 1024 * 1024
+
+# The resources that are fingerprinted when the FINGERPRINT option is True,
+# and the number of digest characters in their names. Images and fonts are
+# left out, as they are mostly referenced from style sheets, whose `url()`
+# are not rewritten.
+FINGERPRINT_GLOBS = ["*.css", "*.js"]
+FINGERPRINT_SIZE  = 8
+
+def compileGlobs( globs ):
+	"""Returns a regular expression that matches the file names matching any
+	of the given globs (see `fnmatch`), or None when there is no glob."""
+	if not globs: return None
+	return re.compile("|".join(map(lambda g:"(?:%s)" % (
+		fnmatch.translate(os.path.normcase(g))), globs)))
+
+def hasHash( algorithm ):
+	"""Tells if the given hash algorithm is available."""
+	if algorithm == HASH_SHA1: return True
+	if algorithm == HASH_BLAKE2B: return blake2b is not None
+	if algorithm == HASH_XXH3: return xxh3 is not None
+	return False
+
+def newHash( algorithm=HASH_SHA1 ):
+	"""Returns a new hash object for the given algorithm (which must be
+	available, see `hasHash`)."""
+	if algorithm == HASH_BLAKE2B: return blake2b()
+	if algorithm == HASH_XXH3: return xxh3()
+	try:
+		return hashfunc.new()
+	except AttributeError:
+		return hashfunc()
+
+def hashFile( path, algorithm=HASH_SHA1 ):
+	"""Returns the hexadecimal digest of the file at the given path, which is
+	read by chunks so that large files are not loaded in memory."""
+	h  = newHash(algorithm)
+	fd = open(path, "rb")
+	try:
+		size = os.fstat(fd.fileno()).st_size
+		if mmap and size >= HASH_MMAP_SIZE:
+			m = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				for offset in xrange(0, size, HASH_CHUNK_SIZE):
+					h.update(buffer(m, offset, HASH_CHUNK_SIZE))
+			finally:
+				m.close()
+		else:
+			while True:
+				data = fd.read(HASH_CHUNK_SIZE)
+				if not data: break
+				h.update(data)
+	finally:
+		fd.close()
+	return h.hexdigest()
 
 #------------------------------------------------------------------------------
 #
@@ -96,6 +196,15 @@ def shorten_path( path ):
 	if path.startswith(cwd): path = path[len(cwd) + 1:]
 	return path
 
+def ensure_directory( path ):
+	"""Creates the given directory if it does not exist. Other processes (like
+	the shards of a build) may create it at the same time."""
+	if os.path.isdir(path): return
+	try:
+		os.makedirs(path)
+	except OSError:
+		if not os.path.isdir(path): raise
+
 #------------------------------------------------------------------------------
 #
 #  Plugins Class
@@ -141,19 +250,66 @@ class Plugins:
 #
 #------------------------------------------------------------------------------
 
-class Page:
+class Page(object):
 	"""The Page object is created by Tahchee and made available to Pages when
-	each page is compiled. It holds information on the page content."""
+	each page is compiled. It holds information on the page content.
+
+	The page modification time, metadata and the values derived from them are
+	only computed when they are first used, from the page template (the
+	source) when it is given."""
+
+	__slots__ = ("_name", "_path", "_url", "_source", "_mtime", "_lastmod",
+	"_meta", "_title", "_parents", "_htmlPath")
+
+	def __init__(self, name, path, url, meta=None, source=None, mtime=None ):
+		self._name     = name
+		self._path     = path
+		self._url      = url
+		self._source   = source
+		self._mtime    = mtime
+		self._lastmod  = None
+		self._meta     = meta
+		self._title    = None
+		self._parents  = None
+		self._htmlPath = None
+
+	def _getMTime( self ):
+		if self._mtime is None and self._source:
+			self._mtime = os.stat(self._source)[stat.ST_MTIME]
+		return self._mtime
+	def _setMTime( self, mtime ):
+		self._mtime   = mtime
+		self._lastmod = None
+	mtime = property(_getMTime, _setMTime, doc="The page modification time")
+
+	def _getLastmod( self ):
+		if self._lastmod is None and self.mtime is not None:
+			self._lastmod = time.strftime("%d-%b-%Y", time.localtime(self.mtime))
+		return self._lastmod
+	def _setLastmod( self, lastmod ):
+		self._lastmod = lastmod
+	lastmod = property(_getLastmod, _setLastmod, doc="The page modification date, as a string")
+
+	def _getMeta( self ):
+		if self._meta is None:
+			if self._source: self._meta = readMetadata(self._source)
+			else: self._meta = {}
+		return self._meta
+	def _setMeta( self, meta ):
+		self._meta  = meta
+		self._title = None
+	meta = property(_getMeta, _setMeta, doc="The page metadata (see `readMetadata`)")
 
-	def __init__(self, name, path, url ):
-		self._name = name
-		self._path = path
-		self._url  = url
-		self.lastmod = None
-	
 	def name( self ):
 		"""Returns this page name (the filename without the directory name)"""
 		return self._name
+
+	def title( self ):
+		"""Returns this page title, as given in the page metadata (see
+		`readMetadata`), or the page name without its extension."""
+		if self._title is None:
+			self._title = self.meta.get("title") or os.path.splitext(self._name)[0]
+		return self._title
 	
 	def path( self ):
 		"""Returns the path to this page. The path is relative to the site
@@ -164,19 +320,290 @@ class Page:
 		"""This is the relative or absolute URL of the page."""
 		return self._url
 
+	def parents( self ):
+		"""Returns the list of the paths of the directories containing this
+		page, from the site root to the page directory."""
+		if self._parents is None:
+			self._parents = []
+			for directory in self._path.split("/")[:-1]:
+				if self._parents: directory = self._parents[-1] + "/" + directory
+				self._parents.append(directory)
+		return self._parents
+
 	def htmlPath( self, sep="/" ):
 		"""Returns an HTML string with links for the whole page path"""
-		components = self.path().split("/")
-		res        = []
-		for c in components:
-			link = "<a href='%s'>%s</a>" % (
-				"/".join(components[:len(c)-1]),
-				os.path.splitext(c)[0]
-			)
-			res.append("<span class='component'>%s</span>" % (link))
-		return "<span class='location'>%s</span>" % (
+		if self._htmlPath and self._htmlPath[0] == sep: return self._htmlPath[1]
+		# Links are absolute, the site URL being the page URL without the path
+		if self._url and self._url.endswith(self._path):
+			base = self._url[:len(self._url) - len(self._path)]
+		else:
+			base = "/"
+		res = []
+		for parent in self.parents():
+			res.append("<span class='component'><a href='%s'>%s</a></span>" % (
+				base + parent + "/", parent.split("/")[-1]
+			))
+		res.append("<span class='component'><a href='%s'>%s</a></span>" % (
+			base + self._path, os.path.splitext(self._name)[0]
+		))
+		res = "<span class='location'>%s</span>" % (
 			("<span class='sep'>%s</span>" % (sep)).join(res)
 		)
+		self._htmlPath = (sep, res)
+		return res
+
+def readMetadata( path ):
+	"""Returns a dictionary with the metadata given in the header of the
+	template at the given path. Metadata are given as `## KEY = value` lines,
+	and the title can also be given as a one-line `#def title: ...` directive.
+	Keys are returned in lower case. Only the header of the file is read, that
+	is the lines up to the first one that is not a Cheetah directive or
+	comment."""
+	res = {}
+	fd  = file(path, "r")
+	try:
+		for line in fd:
+			line = line.strip()
+			if not line: continue
+			if not line.startswith("#"): break
+			meta = RE_META.match(line)
+			if meta:
+				res[meta.group(1).lower()] = meta.group(2).strip()
+				continue
+			title = RE_DEF_TITLE.match(line)
+			if title: res["title"] = title.group(1).strip()
+	finally:
+		fd.close()
+	return res
+
+#------------------------------------------------------------------------------
+#
+#  Catalog Class
+#
+#------------------------------------------------------------------------------
+
+class Catalog:
+	"""The catalog lists the pages of a site, and is available to templates as
+	`$site.catalog`. It is built once per build by walking the pages directory,
+	each page template giving a Page object with its metadata (see
+	`readMetadata`).
+
+	Queries are answered using indexes that are built on their first use, and
+	the queries made by each template are tracked, so that the template is
+	only rebuilt when the result of one of its queries changes."""
+
+	def __init__( self, site, files=None ):
+		self.site     = site
+		# The function that returns the (path, stat) of the files of the
+		# pages directory, which walks the pages directory by default
+		self.files    = files
+		self._pages   = None
+		self._indexes = {}
+		self._ranks   = {}
+		self._tracked = None
+
+	def pages( self ):
+		"""Returns the list of pages of the site, sorted by path."""
+		if self._pages is None: self._build()
+		return self._pages
+
+	def page( self, path ):
+		"""Returns the page with the given path (relative to the pages
+		directory, without the template extension), or None."""
+		res = self._index("path").get(path)
+		return res and res[0]
+
+	def query( self, directory=None, sort="path", reverse=False, limit=None, **meta ):
+		"""Returns the pages of the given directory (relative to the pages
+		directory, subdirectories included) that have the given metadata
+		values, sorted by the given key and limited to the given number of
+		pages. The sort key is `path`, `lastmod`, `title` or a metadata key.
+
+		For instance, the five most recent pages of the `news` directory are
+		given by `$site.catalog.query("news", "lastmod", True, 5)`, and the
+		pages with a `## SECTION = about` header by
+		`$site.catalog.query(section="about")`."""
+		key = (directory, sort, reverse, limit, tuple(sorted(meta.items())))
+		res = self._query(*key)
+		if self._tracked is not None: self._tracked[key] = self.signature(res)
+		return res
+
+	def _query( self, directory, sort, reverse, limit, meta ):
+		candidates = [self._index("directory").get((directory or "").strip("/"), ())]
+		for name, value in meta:
+			candidates.append(self._index(name.lower()).get(value, ()))
+		# We start from the smallest set of pages, and keep those that are in
+		# the other sets
+		candidates.sort(lambda a,b:cmp(len(a), len(b)))
+		res = candidates[0]
+		for other in candidates[1:]:
+			paths = dict.fromkeys(map(lambda p:p.path(), other))
+			res   = filter(lambda p:paths.has_key(p.path()), res)
+		rank = self._rank(sort)
+		res  = list(res)
+		res.sort(lambda a,b:cmp(rank[a.path()], rank[b.path()]))
+		if reverse: res.reverse()
+		if limit is not None: res = res[:limit]
+		return res
+
+	def walk( self ):
+		"""Returns the list of (path, stat) couples of the files of the pages
+		directory, which are given by the builder during a build. Ignored
+		directories are not walked."""
+		if self.files: return self.files()
+		return walker.Walker(self.site.isIgnored).walk(os.path.abspath(self.site.pages()))
+
+	def _build( self ):
+		self._pages = []
+		pages = os.path.abspath(self.site.pages())
+		for template, st in self.walk():
+			name = os.path.basename(template)
+			if not self.site.isTemplate(name) or not self.site.isAccepted(name):
+				continue
+			path = self.site.isTemplate(template[len(pages)+1:])
+			path = path.replace(os.sep, "/")
+			self._pages.append(Page(os.path.basename(path), path,
+			self.site.url() + "/" + path, source=template, mtime=int(st.st_mtime)))
+		self._pages.sort(lambda a,b:cmp(a.path(), b.path()))
+
+	def _index( self, name ):
+		"""Returns the index with the given name, which maps the values of the
+		`path`, `directory` or metadata key to the list of pages with that
+		value, sorted by path. Pages are listed in the directory index for
+		their directory and all its parents."""
+		res = self._indexes.get(name)
+		if res is not None: return res
+		res = {}
+		for page in self.pages():
+			if name == "path":
+				values = (page.path(),)
+			elif name == "directory":
+				values = [""]
+				for directory in page.path().split("/")[:-1]:
+					values.append((values[-1] + "/" + directory).lstrip("/"))
+			elif page.meta.has_key(name):
+				values = (page.meta[name],)
+			else:
+				values = ()
+			for value in values:
+				res.setdefault(value, []).append(page)
+		self._indexes[name] = res
+		return res
+
+	def _rank( self, sort ):
+		"""Returns a dictionary that maps the path of each page to its rank when
+		sorted with the given key, ties being sorted by path."""
+		res = self._ranks.get(sort)
+		if res is not None: return res
+		if sort == "path": value = lambda p:p.path()
+		elif sort == "lastmod": value = lambda p:p.mtime
+		elif sort == "title": value = lambda p:p.title()
+		else: value = lambda p:p.meta.get(sort.lower(), "")
+		pages = list(self.pages())
+		pages.sort(lambda a,b:cmp(value(a), value(b)))
+		res = {}
+		for i in range(0, len(pages)): res[pages[i].path()] = i
+		self._ranks[sort] = res
+		return res
+
+	def signature( self, pages ):
+		"""Returns a signature of the given list of pages, which changes when
+		the list or the pages change."""
+		res = []
+		for page in pages:
+			meta = page.meta.items()
+			meta.sort()
+			res.append("%s\t%s\t%s" % (page.path(), page.mtime, meta))
+		h = newHash()
+		h.update("\n".join(res))
+		return h.hexdigest()
+
+	def track( self, enabled=True ):
+		"""Starts tracking the queries made to the catalog, or stops tracking
+		them when not enabled, in which case the dictionary mapping the queries
+		made since tracking started to their result signature is returned."""
+		res = self._tracked
+		if enabled: self._tracked = {}
+		else: self._tracked = None
+		return res or {}
+
+	def changed( self, queries ):
+		"""Tells if the result of any of the given tracked queries changed."""
+		for key, signature in queries.items():
+			if self.signature(self._query(*key)) != signature: return True
+		return False
+
+#------------------------------------------------------------------------------
+#
+#  Fingerprints Class
+#
+#------------------------------------------------------------------------------
+
+class Fingerprints:
+	"""Keeps the manifest that maps the paths of the fingerprinted resources
+	(relative to the pages directory) to the path of their copy in the site
+	output, whose name contains the digest of the resource (like
+	`screen.3f9a2c1b.css`), so that the copies can be cached forever.
+
+	Like for the catalog, the lookups made while a page is generated can be
+	tracked, so that the page is only rebuilt when the resources it links to
+	change."""
+
+	def __init__( self, site, manifest=None ):
+		self.site     = site
+		if manifest is None: manifest = {}
+		self.manifest = manifest
+		self._tracked = None
+
+	def name( self, path, digest ):
+		"""Returns the fingerprinted name of the given path for the given
+		digest."""
+		base, ext = os.path.splitext(path)
+		return "%s.%s%s" % (base, digest[:FINGERPRINT_SIZE], ext)
+
+	def update( self, path, digest ):
+		"""Registers the digest of the resource with the given path, returning
+		its fingerprinted path."""
+		res = self.manifest[path] = self.name(path, digest)
+		return res
+
+	def prune( self, paths ):
+		"""Removes the resources that are not in the given paths from the
+		manifest, returning their fingerprinted paths."""
+		res = []
+		for path in self.manifest.keys():
+			if not paths.has_key(path):
+				res.append(self.manifest[path])
+				del self.manifest[path]
+		return res
+
+	def get( self, path ):
+		"""Returns the fingerprinted path for the given path (relative to the
+		pages directory), or the path itself if it is not fingerprinted."""
+		key = path.replace("\\", "/")
+		while key.startswith("./"): key = key[2:]
+		key = key.lstrip("/")
+		res = self.manifest.get(key)
+		if res is None: return path
+		if self._tracked is not None: self._tracked[key] = res
+		return res
+
+	def track( self, enabled=True ):
+		"""Starts tracking the lookups made to the manifest, or stops tracking
+		them when not enabled, in which case the dictionary mapping the paths
+		looked up since tracking started to their fingerprinted path is
+		returned."""
+		res = self._tracked
+		if enabled: self._tracked = {}
+		else: self._tracked = None
+		return res or {}
+
+	def changed( self, lookups ):
+		"""Tells if the fingerprint of any of the given tracked lookups
+		changed."""
+		for path, name in lookups.items():
+			if self.manifest.get(path) != name: return True
+		return False
 
 #------------------------------------------------------------------------------
 #
@@ -204,6 +631,7 @@ class Site:
 		self.fontsDir     = os.path.join(self.rootDir, "Fonts")
 		self.pluginsDir   = os.path.join(self.rootDir, "Plugins")
 		self.sourcesDir   = os.path.join(self.rootDir, "Sources")
+		self.bundlesDir   = os.path.join(self.rootDir, "Bundles")
 		self._changeDetectionMethod = CHANGE_CHECKSUM
 		self._plugins     = []
 		self._accepts     = []
@@ -215,8 +643,23 @@ class Site:
 		self._tidyFlags   = os.environ.get("TIDYFLAGS") or ""
 		self._main        = "index.html"
 		self._showMain    = True
+		self._checkLinks  = False
+		self._threads     = 1
+		self._hashThreads = None
+		self._hash        = HASH_SHA1
+		self._sitemap     = False
+		self._feed        = None
+		self._feedSize    = sitemap.FEED_SIZE
+		self._compress    = []
+		self._fingerprints = []
+		self._bundles     = {}
+		self._minify      = True
+		self._compressExtensions = compress.EXTENSIONS
 		self._processOptions(locals)
 		self._processOptions(kwargs)
+		self._compileGlobs()
+		self.catalog      = Catalog(self)
+		self.fingerprints = Fingerprints(self)
 		# We insert the plugins directory into the Python modules path
 		sys.path.insert(0, self.pluginsDir)
 		sys.path.insert(0, self.sourcesDir)
@@ -275,6 +718,37 @@ class Site:
 		if has("MAIN"): self._main = has("MAIN")
 		if options.get("SHOW_MAIN") is False: self._showMain = False
 		if options.get("SHOW_MAIN") is True: self._showMain  = True
+		if options.get("CHECK_LINKS") is False: self._checkLinks = False
+		if options.get("CHECK_LINKS") is True: self._checkLinks  = True
+		if has("THREADS"): self._threads = int(has("THREADS"))
+		if has("HASH_THREADS"): self._hashThreads = int(has("HASH_THREADS"))
+		if has("HASH"):
+			self._hash = has("HASH").lower()
+			if not hasHash(self._hash):
+				warn("Hash algorithm '%s' is not available, using '%s'" % (self._hash, HASH_SHA1))
+				self._hash = HASH_SHA1
+		if options.get("SITEMAP") is False: self._sitemap = False
+		if options.get("SITEMAP") is True: self._sitemap  = True
+		if has("FEED"): self._feed = has("FEED")
+		if has("FEED_SIZE"): self._feedSize = int(has("FEED_SIZE"))
+		if options.get("COMPRESS") is False: self._compress = []
+		elif options.get("COMPRESS") is True: self._compress = [compress.GZIP]
+		elif has("COMPRESS"):
+			self._compress = []
+			names = has("COMPRESS")
+			if type(names) in (str, unicode): names = names.replace(",", " ").split()
+			for name in names:
+				name = name.lower().lstrip(".")
+				if compress.hasFormat(name): self._compress.append(name)
+				else: warn("Compression format '%s' is not available" % (name))
+		if options.get("FINGERPRINT") is True: self._fingerprints = list(FINGERPRINT_GLOBS)
+		elif options.get("FINGERPRINT") is False: self._fingerprints = []
+		elif has("FINGERPRINT"): self._fingerprints = list(has("FINGERPRINT"))
+		if has("BUNDLES"): self._bundles = dict(has("BUNDLES"))
+		if options.get("MINIFY") is False: self._minify = False
+		if options.get("MINIFY") is True: self._minify  = True
+		if has("COMPRESS_EXTENSIONS"):
+			self._compressExtensions = tuple(map(lambda e:e.lower(), has("COMPRESS_EXTENSIONS")))
 		if self._tidyEnabled is False:
 			warn("Tidy enables HTML file clean-up and compression but is disabled")
 			warn("See the TIDY and TIDY_USE options or check tidy is your path")
@@ -303,46 +777,96 @@ class Site:
 		"""Adds the glob and specifies that it is accepted as a file by this
 		site."""
 		self._accepts.extend(args)
+		self._compileGlobs()
 
 	def ignores( self, *args ):
 		"""The given globs idenitfy files that won't be accepted by this
 		site."""
 		self._ignores.extend(args)
+		self._compileGlobs()
 
 	def index( self, *args ):
 		"""Tells that the given globs match index files."""
 		self._indexes.extend(args)
+		self._compileGlobs()
+
+	def _compileGlobs( self ):
+		"""Compiles the accepts, ignores and indexes globs into one regular
+		expression each, and resets the results of `isAccepted`, `isIgnored`,
+		`isIndex` and `isTemplate` that are cached per path."""
+		self._acceptsRE  = compileGlobs(self._accepts)
+		self._ignoresRE  = compileGlobs(self._ignores)
+		self._indexesRE  = compileGlobs(self._indexes)
+		self._fingerprintsRE = compileGlobs(self._fingerprints)
+		self._accepted   = {}
+		self._ignored    = {}
+		self._isIndex    = {}
+		self._isTemplate = {}
+		self._isFingerprinted = {}
 
 	def isIndex( self, path ):
 		"""Tells wether the given path corresponds to an index or not."""
-		path = os.path.basename(path)
-		for index in self._indexes:
-			if fnmatch.fnmatch(path, index):
-				return True
-		return False
+		res = self._isIndex.get(path)
+		if res is None:
+			name = os.path.normcase(os.path.basename(path))
+			res  = self._indexesRE is not None and self._indexesRE.match(name) is not None
+			self._isIndex[path] = res
+		return res
+
+	def isDirectoryIndex( self, path ):
+		"""Tells if the given path is the index of its directory, which is the
+		case of the indexes and of the files named 'index' (see the linking
+		plugin and `linkcheck`)."""
+		return self.isIndex(path) or os.path.splitext(os.path.basename(path))[0] == "index"
 
 	def isAccepted( self, path ):
 		"""Tells wether this file is accepted or not."""
-		if path[-1] == "/": path = path[:-1]
-		path = os.path.basename(path)
-		if not path: path = os.path.basename(os.path.dirname(path))
-		for ignores in self._ignores:
-			if fnmatch.fnmatch(path, ignores): return False
-		if self._accepts:
-			for accepts in self._accepts:
-				if fnmatch.fnmatch(path, accepts): return True
-			return False
-		else:
-			return True
+		res = self._accepted.get(path)
+		if res is None:
+			if self.isIgnored(path):
+				res = False
+			elif self._acceptsRE is not None:
+				name = os.path.normcase(os.path.basename(path.rstrip("/")))
+				res  = self._acceptsRE.match(name) is not None
+			else:
+				res = True
+			self._accepted[path] = res
+		return res
+
+	def isIgnored( self, path ):
+		"""Tells wether this file or directory is ignored. Unlike accepted
+		globs, ignored globs also apply to directories, and the content of an
+		ignored directory is not processed."""
+		res = self._ignored.get(path)
+		if res is None:
+			name = os.path.normcase(os.path.basename(path.rstrip("/")))
+			res  = self._ignoresRE is not None and self._ignoresRE.match(name) is not None
+			self._ignored[path] = res
+		return res
+
+	def isFingerprinted( self, path ):
+		"""Tells if the given resource is copied under a fingerprinted name (see
+		`Fingerprints`), which is the case of the resources matching the
+		FINGERPRINT globs."""
+		res = self._isFingerprinted.get(path)
+		if res is None:
+			name = os.path.normcase(os.path.basename(path))
+			res  = self._fingerprintsRE is not None and not self.isTemplate(name) \
+			and self._fingerprintsRE.match(name) is not None
+			self._isFingerprinted[path] = res
+		return res
 
 	def isTemplate( self, path ):
 		"""Tells if the given path represents a template, and returns the
 		result."""
-		res = path.split(".tmpl")
-		if len(res) == 2:
-			return "".join(res)
-		else:
-			return None
+		try:
+			return self._isTemplate[path]
+		except KeyError:
+			res = path.split(".tmpl")
+			if len(res) == 2: res = "".join(res)
+			else: res = None
+			self._isTemplate[path] = res
+			return res
 
 	def templates( self ):
 		"""Returns a list of Cheetah templates (files ending in .tmpl or like
@@ -373,7 +897,7 @@ class Site:
 
 	def changeDetectionMethod( self ):
 		"""Returns the type of file change detection method. The 'cheksum'
-		method computes the SHA-1 signature for the file, while the
+		method computes the signature of the file (see `hash`), while the
 		'modification' method uses the file last modification time."""
 		return self._changeDetectionMethod
 
@@ -382,6 +906,60 @@ class Site:
 		templates."""
 		return self._tidyEnabled
 
+	def checkLinks( self ):
+		"""Tells wether the links of the generated pages should be checked after
+		each build."""
+		return self._checkLinks
+
+	def threads( self ):
+		"""Returns the number of threads used to walk the pages directory."""
+		return self._threads
+
+	def hashThreads( self ):
+		"""Returns the number of threads used to hash the files, which is the
+		number of processors by default."""
+		if self._hashThreads: return self._hashThreads
+		if cpu_count: return cpu_count()
+		return 1
+
+	def hash( self ):
+		"""Returns the name of the hash algorithm used by the 'signature'
+		change detection method ('sha1', 'blake2b' or 'xxh3')."""
+		return self._hash
+
+	def sitemap( self ):
+		"""Tells wether a `sitemap.xml` should be generated for this site."""
+		return self._sitemap
+
+	def feed( self ):
+		"""Returns the directory whose pages are listed in the Atom and RSS
+		feeds of this site, True if all the pages are listed, or None if
+		there are no feeds."""
+		return self._feed
+
+	def feedSize( self ):
+		"""Returns the number of pages listed in the feeds."""
+		return self._feedSize
+
+	def bundles( self ):
+		"""Returns the dictionary that maps the paths of the bundles (relative
+		to the site output) to the globs of their members (relative to the
+		pages directory). See `bundle.Bundler`."""
+		return self._bundles
+
+	def minify( self ):
+		"""Tells wether the members of the bundles are minified."""
+		return self._minify
+
+	def compress( self ):
+		"""Returns the list of formats ('gz', 'br' or 'zst') of the compressed
+		variants written for the generated files."""
+		return self._compress
+
+	def compressExtensions( self ):
+		"""Returns the extensions of the generated files that are compressed."""
+		return self._compressExtensions
+
 	def root( self ):
 		"""Returns the root directory for this site."""
 		return self.rootDir
@@ -457,6 +1035,23 @@ class SiteBuilder:
 		# The checksums allow to track changes made to resource and files
 		self.checksums = {}
 		self.changed   = {}
+		# The stat of the files, which are read once per build
+		self.stats     = {}
+		self.digests   = {}
+		self._pages    = None
+		self._dirs     = {}
+		# The copies of the resources made by this build, so that the outputs
+		# of the other modes can link to them (see `copyFile`)
+		self._copies   = {}
+		# The (index, count) of the shard being built, and the shard of each
+		# file (see `inShard`)
+		self.shard      = None
+		self._partition = None
+		# The (count, touched state keys) of the shards being merged
+		self._merge     = None
+		# The pages found when walking the pages directory, and their records
+		self.walked    = None
+		self._sitemap  = None
 		self.loadChecksums()
 
 	# ------------------------------------------------------------------------
@@ -519,16 +1114,27 @@ class SiteBuilder:
 				# And if this template has changed, then this one too
 				if self.hasChanged(template_path):
 					template_has_changed = True
+			# And so does the result of the catalog queries it made
+			queries = self.state("catalog").get(path)
+			if not template_has_changed and queries and self.site.catalog.changed(queries):
+				template_has_changed = True
+			# And of the fingerprinted resources it links to
+			lookups = self.state("assets").get(path)
+			if not template_has_changed and lookups and self.site.fingerprints.changed(lookups):
+				template_has_changed = True
 		# There is a SHA1 mode for real checksum change detection
 		if self.site.changeDetectionMethod() == CHANGE_CHECKSUM:
-			try:															# sha1
-				chksum = hashfunc.new(data or load_data(path)).hexdigest()
-			except:
-				chksum = hashfunc(data or load_data(path)).hexdigest() # hashlib
+			if data is not None:
+				h = newHash(self.site.hash())
+				h.update(data)
+				chksum = self.tag(h.hexdigest())
+			else:
+				chksum = self.digest(path)
 		# Default is modification time (faster)
 		else:
-			if os.path.exists(path):
-				chksum  = os.stat(path)[stat.ST_MTIME]
+			st = self.stat(path)
+			if st is not None:
+				chksum  = int(st.st_mtime)
 			else:
 				warn("Path does not exists: " + path)
 				chksum  = "0"
@@ -538,19 +1144,89 @@ class SiteBuilder:
 			old_checksum = checksums.get(path)
 		else:
 			old_checksum = None
+		# Signatures stored before they were tagged with their algorithm are
+		# SHA-1 signatures
+		if type(old_checksum) is str and old_checksum.find(":") == -1:
+			old_checksum = self.tag(old_checksum, HASH_SHA1)
 		# Then we compare to registered checksums
 		# If the checksum has changed
 		if template_has_changed or old_checksum != chksum:
-			# We take care of the mode
-			if not self.checksums.get(self.site.sig()):
-				self.checksums[self.site.sig()] = {}
-			self.checksums[self.site.sig()][path] = chksum
-			self.changed[path] = True
+			self.updateChecksum(path, chksum)
 			return True
 		else:
 			self.changed[path] = False
 			return False
 
+	def updateChecksum( self, path, chksum ):
+		"""Registers the checksum of the given absolute path, which is then
+		considered as changed."""
+		# We take care of the mode
+		if not self.checksums.get(self.site.sig()):
+			self.checksums[self.site.sig()] = {}
+		self.checksums[self.site.sig()][path] = chksum
+		self.changed[path] = True
+
+	def tag( self, digest, algorithm=None ):
+		"""Returns the given hexadecimal digest prefixed by the name of its
+		algorithm (the site hash algorithm by default), so that changing the
+		algorithm is detected as a change."""
+		return "%s:%s" % (algorithm or self.site.hash(), digest)
+
+	def digest( self, path ):
+		"""Returns the tagged digest of the file at the given absolute path,
+		which is only computed once per build (see `hashFiles`)."""
+		res = self.digests.get(path)
+		if res is None:
+			res = self.digests[path] = self.tag(hashFile(path, self.site.hash()))
+		return res
+
+	def hashFiles( self, paths ):
+		"""Computes the digests of the given files on a pool of threads, as
+		hashing releases the global interpreter lock."""
+		paths = filter(lambda p:not self.digests.has_key(p), paths)
+		if ThreadPool is None or len(paths) < 2:
+			map(self.digest, paths)
+			return
+		pool      = ThreadPool(self.site.hashThreads())
+		algorithm = self.site.hash()
+		try:
+			digests = pool.map(lambda p:hashFile(p, algorithm), paths)
+			for path, digest in zip(paths, digests):
+				self.digests[path] = self.tag(digest)
+		finally:
+			pool.close()
+			pool.join()
+
+	def stat( self, path ):
+		"""Returns the stat of the given absolute path, or None if it does not
+		exist. Paths are only stat'ed once per build, and the stat of the
+		pages is given by the pages walk (see `pageFiles`)."""
+		try:
+			return self.stats[path]
+		except KeyError:
+			try:
+				res = os.stat(path)
+			except OSError:
+				res = None
+			self.stats[path] = res
+			return res
+
+	def mtime( self, path ):
+		"""Returns the modification time of the given absolute path, or None."""
+		st = self.stat(path)
+		return st and int(st.st_mtime)
+
+	def walker( self ):
+		return walker.Walker(self.site.isIgnored, self.site.threads())
+
+	def pageFiles( self ):
+		"""Returns the list of (path, stat) couples of the files in the pages
+		directory, which is walked once per build."""
+		if self._pages is None:
+			self._pages = self.walker().walk(os.path.abspath(self.site.pages()))
+			for path, st in self._pages: self.stats[path] = st
+		return self._pages
+
 	def saveChecksums( self ):
 		"""Saves the cheksums to a file named 'site.checksums' in the site
 		root."""
@@ -570,25 +1246,301 @@ class SiteBuilder:
 			assert type(res) == type(self.checksums)
 			self.checksums = res
 
+	def state( self, name ):
+		"""Returns the dictionary where the build stage with the given name can
+		keep its state for this site. The state is saved with the checksums."""
+		key = "%s:%s" % (self.site.sig(), name)
+		if not self.checksums.has_key(key): self.checksums[key] = {}
+		return self.checksums[key]
+
 	# ------------------------------------------------------------------------
 	#
 	# Building the web site
 	#
 	# ------------------------------------------------------------------------
 
-	def build( self, paths=None):
-		"""Builds the website, or builds specifically the given paths."""
-		log("Mode is '%s', generating in '%s'" % (self.site.mode(),
-		shorten_path(self.site.output())))
-		log("Changes are detected by %s" % (self.site.changeDetectionMethod()))
+	def build( self, paths=None, modes=None, shard=None ):
+		"""Builds the website, or builds specifically the given paths. When
+		modes are given (like `("local", "remote")`), the site is built for
+		each mode in turn: the pages are walked, the files hashed and the
+		templates compiled only once, and the resources copied for the first
+		mode are hard linked in the output of the next ones.
+
+		When a shard is given as an (index, count) couple, only the files of
+		this shard are built, and the shard writes its partial manifests and
+		checksums delta instead of the site manifests and checksums, leaving
+		the steps that need the whole site to `merge` (see
+		`tahchee.sharding`)."""
+		mode  = self.site.mode()
+		modes = modes or [mode]
+		self.shard      = shard
+		self._partition = None
+		if shard:
+			log("Building shard %d/%d" % shard)
+			checksums  = sharding.flatten(self.checksums)
+			signatures = {}
 		self.usedResources = {}
-		self.precompileTemplates()
-		self.applyTemplates(paths)
-		self.copyCreatedFiles()
+		self.stats         = {}
+		self.digests       = {}
+		self._pages        = None
+		self._dirs         = {}
+		self._copies       = {}
+		# Plugins may cache things about the site that are only valid for
+		# one build
+		for plugin in self.site.plugins():
+			if hasattr(plugin, "reset"): plugin.reset()
+		try:
+			for i in range(len(modes)):
+				self.site.setMode(modes[i])
+				log("Mode is '%s', generating in '%s'" % (self.site.mode(),
+				shorten_path(self.site.output())))
+				if i == 0:
+					log("Changes are detected by %s" % (self.site.changeDetectionMethod()))
+				# Changes are detected against the checksums of each mode
+				self.changed       = {}
+				self._sitemap      = None
+				self.site.catalog  = Catalog(self.site, self.pageFiles)
+				self.site.fingerprints = Fingerprints(self.site, self.state("fingerprints"))
+				self._fingerprinted    = {}
+				self.outputs       = manifest.Manifest(self.site.output() + ".manifest").load()
+				if paths: self.walked = None
+				else: self.walked = {}
+				# Page templates are compiled once per process by Cheetah, and
+				# the site templates only need to be compiled once
+				if i == 0 and not self._merge: self.precompileTemplates()
+				if self._merge:
+					partials = self.mergeOutputs()
+					for path, st in self.pageFiles(): self.walkedPage(path)
+				# Bundles need every member, so they are left to the merge
+				if self.site.bundles() and not shard: self.updateBundles()
+				if not self._merge: self.applyTemplates(paths)
+				self.copyCreatedFiles()
+				if shard:
+					signatures[self.site.sig()] = self.site.mode()
+					self.outputs.save(False, self.site.output() + ".manifest" + sharding.suffix(*shard))
+					continue
+				if self.site.sitemap() or self.site.feed(): self.updateSitemap()
+				if self.walked is not None: self.pruneOutputs()
+				if self.site.compress(): self.compressFiles()
+				if self.site.checkLinks(): self.checkLinks()
+				self.outputs.save(self.walked is None)
+				if self._merge: map(os.unlink, partials)
+		finally:
+			self.site.setMode(mode)
+		if shard:
+			sharding.save(os.path.join(self.site.root(), "site.checksums" + sharding.suffix(*shard)),
+			sharding.delta(checksums, sharding.flatten(self.checksums)), self.site.root(), signatures)
+			return
 		self.saveChecksums()
 		if self.site._showMain:
 			webbrowser.open("file://" + os.path.join(self.site.output(), self.site._main))
 
+	def merge( self, count, modes=None ):
+		"""Merges the results of the given number of shards (see `build`): their
+		checksums deltas are applied to the checksums, their partial manifests
+		are combined in the manifest of each mode, and the steps that need the
+		whole site (bundles, sitemap, removal of the orphans, compression and
+		link checking) are run. The deltas and partial manifests are removed
+		once merged."""
+		deltas  = []
+		touched = {}
+		mode    = self.site.mode()
+		for index in range(1, count + 1):
+			path = os.path.join(self.site.root(), "site.checksums" + sharding.suffix(index, count))
+			if not os.path.exists(path):
+				fatal("Shard %d/%d was not built, '%s' is missing" % (index, count, shorten_path(path)))
+			data = sharding.load(path)
+			# The shard may have been built in another directory
+			signatures = {}
+			for signature, shardMode in data["signatures"].items():
+				self.site.setMode(shardMode)
+				signatures[signature] = self.site.sig()
+			self.site.setMode(mode)
+			changes = sharding.relocate(data["changes"], signatures, data["root"], self.site.root())
+			sharding.apply(self.checksums, changes)
+			for key in changes[0].keys() + changes[1]: touched[key[0]] = True
+			deltas.append(path)
+		log("Merging %d shards" % (count))
+		self._merge = (count, touched)
+		try:
+			self.build(None, modes)
+		finally:
+			self._merge = None
+		map(os.unlink, deltas)
+
+	def mergeOutputs( self ):
+		"""Registers the outputs of the shards being merged in the manifest of
+		the current mode, returning the paths of their partial manifests."""
+		count, touched = self._merge
+		res = []
+		for index in range(1, count + 1):
+			path = self.site.output() + ".manifest" + sharding.suffix(index, count)
+			if os.path.exists(path):
+				self.outputs.merge(path)
+				res.append(path)
+			else:
+				warn("Shard %d/%d has no manifest for mode '%s'" % (index, count, self.site.mode()))
+		# The sitemap is written again if a shard updated its records
+		if touched.has_key("%s:sitemap" % (self.site.sig())): self.sitemap().dirty = True
+		return res
+
+	def inShard( self, path ):
+		"""Tells if the given file is built by the shard being built, if any.
+		The files of the pages directory are partitioned between the shards
+		(see `sharding.partition`), and the other files are built by the first
+		shard."""
+		if self.shard is None: return True
+		pages = os.path.abspath(self.site.pages())
+		if self._partition is None:
+			templates = []
+			resources = []
+			for page, st in self.pageFiles():
+				if not self.site.isAccepted(page): continue
+				relative = page[len(pages)+1:].replace(os.sep, "/")
+				if self.site.isTemplate(page): templates.append((relative, sharding.extends(page)))
+				else: resources.append(relative)
+			self._partition = sharding.partition(templates, resources, self.shard[1])
+			log("Shard %d/%d builds %d of %d files" % (self.shard[0], self.shard[1],
+			len(filter(lambda i:i == self.shard[0], self._partition.values())),
+			len(self._partition)))
+		path = os.path.abspath(path)
+		if not path.startswith(pages + os.sep): return self.shard[0] == 1
+		return self._partition.get(path[len(pages)+1:].replace(os.sep, "/"), 1) == self.shard[0]
+
+	def sitemap( self ):
+		"""Returns the Sitemap object that keeps a record of the generated
+		pages, which is saved with the checksums."""
+		if self._sitemap is None:
+			self._sitemap = sitemap.Sitemap(self.site, self.state("sitemap"))
+		return self._sitemap
+
+	def updateSitemap( self ):
+		"""Writes the sitemap and feeds of the site, if they changed. When the
+		whole site was built, the records of the pages that do not exist
+		anymore are removed, and the pages that have no record yet are
+		added."""
+		records = self.sitemap()
+		if self.walked is not None:
+			records.prune(self.walked)
+			for path, template in self.walked.items():
+				if records.pages.has_key(path): continue
+				page = Page(os.path.basename(path), path, self.site.url() + "/" + path,
+				       source=template, mtime=self.mtime(template))
+				records.update(path, page.url(), page.mtime, page.title())
+		written = records.write(self.site.sitemap(), self.site.feed(), self.site.feedSize())
+		for name in written:
+			log("Writing '%s'" % (shorten_path(os.path.join(self.site.output(), name))))
+		for name in records.files.keys():
+			path = os.path.join(self.site.output(), name)
+			if name in written: self.recordOutput(path)
+			else: self.keepOutput(path)
+
+	def updateBundles( self ):
+		"""Writes the bundles whose members changed in the bundles directory,
+		and registers every bundle as a created file, so that it is copied to
+		the site output when it changed."""
+		bundler = bundle.Bundler(self.site, self.site.bundlesDir, self.state("bundles"))
+		for name in bundler.update(self.site.bundles(), self.hasChanged, self.site.minify()):
+			log("Bundling '%s'" % (name))
+		output = self.site.output()
+		for name in self.site.bundles().keys():
+			self.site.createdFiles.append((bundler.path(name), os.path.join(output, name)))
+
+	def compressFiles( self ):
+		"""Writes the compressed variants of the generated files whose content
+		changed since the last build, according to the digests of the build
+		manifest (see `compress.Compressor`)."""
+		compressor = compress.Compressor(self.site, self.state("compress"))
+		errors     = compressor.update(self.site.compress(),
+		self.site.compressExtensions(), None, self.outputDigests())
+		for path, error in errors:
+			warn("Unable to compress '%s': %s" % (path, error))
+		if compressor.compressed:
+			log("Compressed %d files (%s)" % (len(compressor.compressed),
+			", ".join(self.site.compress())))
+		# The sidecars are registered in the manifest, with the file they
+		# compress as source
+		output     = self.site.output()
+		compressed = dict.fromkeys(compressor.compressed)
+		for relative, entry in compressor.cache.items():
+			source = os.path.join(output, relative)
+			for name in entry[3]:
+				if compressed.has_key(relative): self.recordOutput(source + "." + name, source)
+				else: self.keepOutput(source + "." + name, source)
+
+	def outputDigests( self ):
+		"""Returns a dictionary that maps the output files registered in the
+		build manifest (relative to the site output) to their digest, so that
+		the files do not need to be read to know if they changed."""
+		res = {}
+		for relative, entry in self.outputs.files.items():
+			res[relative] = entry.get("hash")
+		return res
+
+	def _manifestPath( self, path, base ):
+		"""Returns the given path relative to the given base directory, with '/'
+		as separator, or the absolute path if it is not in the base
+		directory."""
+		path = os.path.abspath(path)
+		base = os.path.abspath(base) + os.sep
+		if path.startswith(base): path = path[len(base):]
+		return path.replace(os.sep, "/")
+
+	def recordOutput( self, path, source=None, digest=None ):
+		"""Registers the given output file in the build manifest (see
+		`manifest.Manifest`), with the given source file and digest, which is
+		computed if not given."""
+		if digest is None: digest = self.tag(hashFile(path, self.site.hash()))
+		if source is not None: source = self._manifestPath(source, self.site.root())
+		self.outputs.record(self._manifestPath(path, self.site.output()), source,
+		digest, os.path.getsize(path))
+
+	def keepOutput( self, path, source=None ):
+		"""Registers the given output file, which was not written again, in the
+		build manifest. Its entry comes from the previous manifest, or is
+		computed if it had none."""
+		relative = self._manifestPath(path, self.site.output())
+		if source is not None: source = self._manifestPath(source, self.site.root())
+		if not self.outputs.keep(relative, source) and os.path.exists(path):
+			self.recordOutput(path, source and os.path.join(self.site.root(), source))
+
+	def pruneOutputs( self ):
+		"""Removes the output files of the previous build that were not
+		produced by this build (because their source was removed or renamed),
+		along with the directories that become empty. The compressed sidecars
+		of the other files are left to `compressFiles`."""
+		output  = self.site.output()
+		prefix  = self._manifestPath(output, self.site.root()) + "/"
+		orphans = self.outputs.orphans()
+		removed = dict.fromkeys(orphans)
+		for relative in orphans:
+			source = self.outputs.previous[relative].get("source") or ""
+			if self.site.compress() and source.startswith(prefix) and \
+			not removed.has_key(source[len(prefix):]):
+				continue
+			path = os.path.join(output, relative)
+			if not os.path.exists(path): continue
+			log("Removing '%s'" % (shorten_path(path)))
+			os.unlink(path)
+			directory = os.path.dirname(path)
+			while directory != output and not os.listdir(directory):
+				os.rmdir(directory)
+				directory = os.path.dirname(directory)
+
+	def checkLinks( self ):
+		"""Checks the links of the generated HTML pages, warning about the links
+		to missing files or anchors. Only the pages that changed since the last
+		check are scanned. Returns the list of problems (see
+		`linkcheck.LinkChecker.check`)."""
+		checker  = linkcheck.LinkChecker(self.site, self.state("links"))
+		problems = checker.check(None, self.outputDigests())
+		for page, link, message in problems:
+			if link is None: warn("%s: %s" % (page, message))
+			else: warn("%s: %s (%s)" % (page, message, link))
+		log("Checked links of %d pages (%d scanned), %d problems" % (
+		len(checker.cache), checker.scanned, len(problems)))
+		return problems
+
 	def precompileTemplates( self ):
 		"""Looks for Cheetah templates and precompile them (into Python code)
 		if necessary"""
@@ -611,9 +1563,15 @@ class SiteBuilder:
 					fatal(e)
 					temp = None
 				if temp != None:
-					output = open(os.path.splitext(template)[0]+".py", "wb")
+					# The module is renamed once written, so that other
+					# processes (like the shards of a build) never import it
+					# partially written
+					path   = os.path.splitext(template)[0]+".py"
+					output = open(path + ".%d" % (os.getpid()), "wb")
 					output.write("# Encoding: ISO-8859-1\n" + str(temp))
 					output.close()
+					if os.path.exists(path) and sys.platform == "win32": os.unlink(path)
+					os.rename(path + ".%d" % (os.getpid()), path)
 
 	def applyTemplates( self, templatePaths=None):
 		"""Apply the templates to every page template present in the pages
@@ -622,6 +1580,7 @@ class SiteBuilder:
 		if templatePaths:
 			for path in templatePaths:
 				path = os.path.abspath(path)
+				if not self.inShard(path): continue
 				# If the path is not contained within the pages, it has no
 				# basedir, and we force the rebuild anyway
 				if not path.startswith(os.path.abspath(self.site.pages())):
@@ -629,10 +1588,36 @@ class SiteBuilder:
 				# Otherwise it is a page, and we rebuild it
 				else:
 					self.site.willProcess(path, None ,True)
+					if self.site.isFingerprinted(path) and os.path.isfile(path):
+						self.fingerprint(path)
 		# Otherwise we do that for the Pages
 		else:
-			for root, dirs, files in os.walk(os.path.join(self.site.pages())):
-				for f in files: self.site.willProcess(os.path.join(root, f))
+			pages     = os.path.abspath(self.site.pages())
+			resources = []
+			for path, st in self.pageFiles():
+				if not self.site.isTemplate(path) and self.site.isAccepted(path):
+					resources.append(path)
+				if not self.inShard(path): continue
+				self.site.willProcess(path)
+				self.walkedPage(path)
+			# Resources that were already copied are hashed beforehand, the
+			# others are hashed while they are copied (see `processFile`).
+			# Every shard fingerprints all the resources, so that the pages
+			# link to their current fingerprint.
+			fingerprinted = filter(self.site.isFingerprinted, resources)
+			resources     = filter(self.inShard, resources)
+			if self.site.changeDetectionMethod() == CHANGE_CHECKSUM:
+				output = self.site.output()
+				self.hashFiles(fingerprinted + filter(lambda p:os.path.exists(
+					os.path.join(output, p[len(pages)+1:])), resources))
+			# Resources are fingerprinted before the pages are generated, so
+			# that the pages link to their current fingerprint
+			map(self.fingerprint, fingerprinted)
+			relatives = {}
+			for path in fingerprinted:
+				relatives[path[len(pages)+1:].replace(os.sep, "/")] = True
+			for name in self.site.fingerprints.prune(relatives):
+				self.removeOutput(name)
 		# And we eventually process the pages we have to process
 		while self.site.hasToProcess():
 			input_path, output_path, force = self.site.nextToProcess()
@@ -643,9 +1628,28 @@ class SiteBuilder:
 			# We process the file
 			self.processFile( input_path, output_path, force )
 
+	def walkedPage( self, path ):
+		"""Remembers the given file of the pages directory when it is a page,
+		so that the sitemap can be updated."""
+		if self.walked is None or not self.site.isAccepted(path): return
+		local = self.site.isTemplate(path[len(os.path.abspath(self.site.pages()))+1:])
+		if local and sitemap.isPage(local):
+			self.walked[local.replace(os.sep, "/")] = path
+
 	def copyCreatedFiles( self ):
-		"""Copies the files created during the application of templates."""
-		map(self.processFile, self.site.createdFiles)
+		"""Copies the files created during the application of templates. Created
+		files are given as paths relative to the pages directory, or as (input,
+		output) couples of absolute paths."""
+		pages  = os.path.abspath(self.site.pages())
+		output = self.site.output()
+		for created in self.site.createdFiles:
+			if type(created) in (tuple, list):
+				input_path, output_path = created
+			else:
+				input_path  = os.path.join(pages, created)
+				output_path = os.path.join(output, created)
+			self.processFile(input_path, output_path)
+		self.site.createdFiles = []
 	
 	def processFile( self, inputpath, outputpath, force=False ):
 		"""Processes the given file, which is relative to the pages directory.
@@ -661,28 +1665,150 @@ class SiteBuilder:
 		if not force and not self.site.isAccepted(ifile):
 			log("Skipping '%s'" % (shorten_path(ifile)))
 			return False
-		# We ensure that it is not a directory
-		if not os.path.isdir(ifile):
+		# We ensure that it is not a directory (the pages walk only gives files)
+		st = self.stats.get(ifile)
+		if st is None: is_dir = os.path.isdir(ifile)
+		else: is_dir = stat.S_ISDIR(st.st_mode)
+		if not is_dir:
 			# If there is a page template, then we simply apply it
 			if self.site.isTemplate(filename):
 				self.applyTemplate(ifile, force)
-			# If it is a resource, we simply copy it
+			# If it is a fingerprinted resource, it is copied under its
+			# fingerprinted name, and under its name for the references that
+			# were not created by the linking plugin (like the `url()` of
+			# style sheets), the second copy being a hard link when possible
+			elif self.site.isFingerprinted(ifile) and \
+			os.path.abspath(ifile).startswith(os.path.abspath(self.site.pages()) + os.sep):
+				changed = force or self.hasChanged(ifile)
+				for path in (self.fingerprint(ifile), ofile):
+					if changed or not os.path.exists(path):
+						info("Copying  '%s'" % (path))
+						self.recordOutput(path, ifile, self.copyFile(ifile, path, True))
+					else:
+						self.keepOutput(path, ifile)
+			# If it is a resource that was not copied yet, we hash it while it
+			# is copied (unless it was hashed for another mode)
+			elif self.site.changeDetectionMethod() == CHANGE_CHECKSUM and \
+			(force or not os.path.exists(ofile)):
+				info("Copying  '%s'" % (ofile))
+				digest = self.copyFile(ifile, ofile, True)
+				self.updateChecksum(os.path.abspath(ifile), digest)
+				self.recordOutput(ofile, ifile, digest)
+			# Otherwise we copy it if it changed
 			elif force or self.hasChanged( ifile ):
 				info("Copying  '%s'" % (ofile))
-				dest_dir  = os.path.dirname(ofile)
-				if not os.path.exists(dest_dir): os.makedirs(dest_dir)
-				shutil.copyfile(ifile, ofile)
-		# If we found a directory, we recurse
+				self.recordOutput(ofile, ifile, self.copyFile(ifile, ofile, True))
+			else:
+				self.keepOutput(ofile, ifile)
+		# If we found a directory, we process its files
 		else:
-			if not os.path.exists(ofile):
+			if ofile and not os.path.exists(ofile):
 				os.makedirs(ofile)
 				log("Creating '%s'" % (shorten_path(ofile)))
-			self.applyTemplates(filepath)
+			for path, st in self.walker().walk(ifile):
+				self.stats[path] = st
+				self.site.willProcess(path, None, force)
+
+	def fingerprint( self, path ):
+		"""Updates the fingerprint of the resource at the given path when it
+		changed (see `Fingerprints`), removing its copy with the previous
+		fingerprint. Returns the path of the fingerprinted copy in the site
+		output."""
+		path     = os.path.abspath(path)
+		relative = path[len(os.path.abspath(self.site.pages()))+1:].replace(os.sep, "/")
+		manifest = self.site.fingerprints.manifest
+		if not self._fingerprinted.has_key(path):
+			self._fingerprinted[path] = True
+			previous = manifest.get(relative)
+			if previous is None or self.hasChanged(path):
+				name = self.site.fingerprints.update(relative, self.digest(path).split(":", 1)[-1])
+				if previous and previous != name: self.removeOutput(previous)
+		return os.path.join(self.site.output(), manifest[relative])
+
+	def removeOutput( self, path ):
+		"""Removes the file with the given path (relative to the site output)
+		from the site output."""
+		path = os.path.join(self.site.output(), path)
+		if os.path.exists(path):
+			log("Removing '%s'" % (shorten_path(path)))
+			try:
+				os.unlink(path)
+			except OSError:
+				# It may have been removed by another shard
+				pass
+
+	def copyFile( self, source, destination, digest=False ):
+		"""Copies the given source file to the given destination, creating the
+		destination directory if necessary. Unlike `shutil.copyfile`, this
+		does not stat the files. When digest is True, the source is hashed
+		while it is copied (unless its digest is known), and its digest is
+		returned.
+
+		When the source was already copied by this build (for another mode)
+		and did not change since, the destination is hard linked to that
+		copy, where the filesystem allows it."""
+		directory = os.path.dirname(destination)
+		if not self._dirs.has_key(directory):
+			ensure_directory(directory)
+			self._dirs[directory] = True
+		key = os.path.abspath(source)
+		self.unlinkOutput(destination)
+		copy = self._copies.get(key)
+		if copy and self.linkFile(source, destination, copy):
+			return digest and self.digest(key)
+		h = digest and not self.digests.has_key(key) and newHash(self.site.hash())
+		i = open(source, "rb")
+		try:
+			st = os.fstat(i.fileno())
+			self._copies[key] = (destination, st.st_size, st.st_mtime)
+			o = open(destination, "wb")
+			try:
+				while True:
+					data = i.read(HASH_CHUNK_SIZE)
+					if not data: break
+					if h: h.update(data)
+					o.write(data)
+			finally:
+				o.close()
+		finally:
+			i.close()
+		if h:
+			res = self.tag(h.hexdigest())
+			self.digests[key] = res
+			return res
+		elif digest:
+			return self.digests[key]
+
+	def unlinkOutput( self, path ):
+		"""Removes the given output file before it is written again, as it may
+		be a hard link to the output of another mode (see `copyFile`), which
+		must not change."""
+		try:
+			os.unlink(path)
+		except OSError:
+			pass
+
+	def linkFile( self, source, destination, copy ):
+		"""Hard links the given destination to the given (path, size, mtime)
+		copy of the given source, returning False when the source changed
+		since it was copied or when the link cannot be created (because
+		the filesystem does not support it, or the copy is on another
+		device)."""
+		path, size, mtime = copy
+		if path == destination or not hasattr(os, "link"): return False
+		try:
+			st = os.stat(source)
+			if st.st_size != size or st.st_mtime != mtime: return False
+			os.link(path, destination)
+		except OSError:
+			return False
+		return True
 
 	def applyTemplate( self, template, force=False ):
 		"""Expands the given template to a file (generally an HTML or CSS
 		file). The given path must be absolute."""
 		assert template == os.path.abspath(template), "Path must be absolute"
+		template_path       = template
 		# The local path is the path to the template that is relative to the
 		# site pages directory. The template extension is removed.
 		template_localpath  = self.site.isTemplate(template[len(self.site.pages())+1:])
@@ -695,6 +1821,7 @@ class SiteBuilder:
 		# We do nothing if the template was already applied
 		if not force and not self.hasChanged( template ) \
 		and os.path.exists(template_outputpath):
+			self.keepOutput(template_outputpath, template_path)
 			return
 
 		# And create a dictionary with the file attributes. This dictionnary
@@ -702,10 +1829,7 @@ class SiteBuilder:
 		path = template_localpath
 		name = os.path.basename(template_localpath)
 		url  = self.site.url() + "/" + template_url
-		page = Page(name, path, url)
-
-		lmod = time.localtime(os.stat(template)[stat.ST_MTIME])
-		page.lastmod = time.strftime("%d-%b-%Y", lmod)
+		page = Page(name, path, url, source=template, mtime=self.mtime(template))
 		localdict = {
 			"page" : page,
 			"site" : self.site
@@ -721,6 +1845,8 @@ class SiteBuilder:
 			err("Unable to compile template.")
 			err("This may be because an extended template did not compile.")
 			err("Python says: " + str(e))
+			# The previous output is not removed as an orphan
+			self.keepOutput(template_outputpath, template_path)
 			return
 
 		# template._searchList.append(localdict)
@@ -729,14 +1855,28 @@ class SiteBuilder:
 
 		# In case the template output path directories do not exist, we ensure
 		# that they are present.
-		if not os.path.exists(os.path.dirname(template_outputpath)):
-			os.makedirs(os.path.dirname(template_outputpath))
+		ensure_directory(os.path.dirname(template_outputpath))
 
 		def generate(template, template_outputpath):
 			assert isinstance(template, Template)
+			self.unlinkOutput(template_outputpath)
 			output = open(template_outputpath, "wb")
 			#try:
+			# We keep the catalog queries made by the template, so that it is
+			# rebuilt when their results change
+			self.site.catalog.track()
+			self.site.fingerprints.track()
 			template_text = str(template)
+			queries = self.site.catalog.track(False)
+			if queries: self.state("catalog")[template_path] = queries
+			elif self.state("catalog").has_key(template_path):
+				del self.state("catalog")[template_path]
+			lookups = self.site.fingerprints.track(False)
+			if lookups: self.state("assets")[template_path] = lookups
+			elif self.state("assets").has_key(template_path):
+				del self.state("assets")[template_path]
+			if self.site.sitemap() or self.site.feed():
+				self.sitemap().update(path, page.url(), page.mtime, page.title())
 			if not template_text:
 				warn("Template output is empty, you may want to check your template code.")
 			output.write(template_text)
@@ -753,6 +1893,7 @@ class SiteBuilder:
 		# post-process it
 		if os.path.splitext(template_outputpath)[1].lower() in (".html", ".htm"):
 			if generate(template, template_outputpath + ".tmp"):
+				self.unlinkOutput(template_outputpath)
 				if self.site.useTidy():
 					flags = ""
 					if self.site._tidyConf:  flags += " -f '%s'" % (self.site._tidyConf)
@@ -781,12 +1922,16 @@ class SiteBuilder:
 				else:
 					shutil.copy(template_outputpath+".tmp", template_outputpath)
 				os.unlink(template_outputpath+".tmp")
+				self.recordOutput(template_outputpath, template_path)
 				return True
 			else:
 				return False
 		# Otherwise we simply output the file
+		elif generate(template, template_outputpath):
+			self.recordOutput(template_outputpath, template_path)
+			return True
 		else:
-			return generate(template, template_outputpath)
+			return False
 
 #------------------------------------------------------------------------------
 #
@@ -799,6 +1944,8 @@ MAKEFILE_TEMPLATE = """\
 PYTHON  = /usr/bin/env python
 LOCAL   = Site/Local
 REMOTE  = Site/Remote
+# The deployment target, like sftp://user@host/var/www or s3://bucket
+TARGET  =
 
 local:
 	$(PYTHON) build.py local
@@ -806,15 +1953,24 @@ local:
 remote:
 	$(PYTHON) build.py remote
 
+all:
+	$(PYTHON) build.py local remote
+
+deploy: remote
+	tahchee deploy $(TARGET)
+
 clean:
 	find . -name "*~" -or -name "*.sw?" -or -name "*.pyc" -exec rm {} ';'
 	rm -rf $(LOCAL)/*
 	rm -rf $(REMOTE)/*
+	rm -f $(LOCAL).manifest $(REMOTE).manifest
 	rm site.checksums
 
 info:
 	@echo 'local    - builds local website'
 	@echo 'remote   - builds remote website'
+	@echo 'all      - builds local and remote websites in one pass'
+	@echo 'deploy   - builds and uploads remote website to $$(TARGET)'
 	@echo 'clean    - cleans build and removes temp files'
 
 archive: Pages Templates Makefile build.py 
@@ -823,7 +1979,7 @@ archive: Pages Templates Makefile build.py
 	tar cvfj tahchee-sources.tar.bz2 tahchee-sources
 	rm -rf tahchee-sources
 
-.PHONY: local remote archive info clean 
+.PHONY: local remote all deploy archive info clean 
 """ % ( __version__ )
 
 BUILD_PY_TEMPLATE = """\
@@ -844,9 +2000,7 @@ except:
 # Do not modify this code
 if __name__ == "__main__":
 	print "tahchee v." + version()
-	site = Site(URL, locals=locals())
-	if len(sys.argv)>1 and sys.argv[1].lower()=="remote": site.setMode("remote")
-	SiteBuilder(site).build(filter(lambda x:x not in ('local','remote'),sys.argv[1:]))
+	build(Site(URL, locals=locals()), sys.argv[1:])
 """
 
 BUILD_PY_DEFAULTS = """\
@@ -1006,6 +2160,7 @@ Usage:
 
    tahchee create URL [DIRECTORY]     (Creates a new website)
    tahchee update [DIRECTORY]         (Updates website tahchee files)
+   tahchee deploy TARGET [DIRECTORY]  (Uploads the changes to the website)
    tahchee plugins                    (Lists available plugins)
    tahchee help [COMMAND]             (Displays command help)
    tahchee version                    (Displays version info)
@@ -1060,6 +2215,27 @@ tahchee plugins
 #
 #------------------------------------------------------------------------------
 
+def build( site, args ):
+	"""Builds the given site according to the given arguments of `build.py`,
+	which are the modes to build (`local` and/or `remote`), the paths of the
+	pages to build (all of them by default), `--shard INDEX/COUNT` to only
+	build one shard of the site and `--merge COUNT` to merge the shards (see
+	`tahchee.sharding`)."""
+	try:
+		options, args = getopt.gnu_getopt(args, "", ["shard=", "merge="])
+		shard = merge = None
+		for option, value in options:
+			if option == "--shard": shard = sharding.parse(value)
+			elif option == "--merge": merge = int(value)
+	except (getopt.GetoptError, ValueError), e:
+		fatal(e)
+	modes   = map(lambda x:x.lower(), filter(lambda x:x.lower() in ('local','remote'), args))
+	paths   = filter(lambda x:x.lower() not in ('local','remote'), args)
+	builder = SiteBuilder(site)
+	if merge: builder.merge(merge, modes)
+	else: builder.build(paths, modes, shard)
+	return builder
+
 def run( args ):
 	if not args:
 		print HELP[:-1]
@@ -1067,7 +2243,7 @@ def run( args ):
 
 	# Checks the number of arguments
 	if args[0] == "create" and len( args ) < 2 or len( args) > 3 \
-	or args[0] == "update" and len( args ) > 2:
+	and args[0] != "deploy" or args[0] == "update" and len( args ) > 2:
 		print HELP[:-1]
 		sys.exit()
 	
@@ -1141,6 +2317,11 @@ def run( args ):
 		else:
 			print "Your project was updated."
 	# ========================================================================
+	# DEPLOY MODE
+	# ========================================================================
+	elif args[0] == "deploy":
+		if deploy.run(args[1:]): sys.exit(1)
+	# ========================================================================
 	# UPDATE MODE
 	# ========================================================================
 	elif args[0] == "plugin" or args[0] == "plugins":
@@ -1160,6 +2341,7 @@ def run( args ):
 			command = args[1].lower()
 			if   command == "create": print HELP_CREATE
 			elif command == "update": print HELP_UPDATE
+			elif command == "deploy": print deploy.HELP_DEPLOY
 			elif command == "plugin": print HELP_PLUGIN
 			elif command == "version": print __version__
 			elif command == "help": print HELP
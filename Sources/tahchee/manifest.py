@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# Encoding: ISO-8859-1
+# -----------------------------------------------------------------------------
+# Project           :   Tahchee                     <http://www.ivy.fr/tahchee>
+# -----------------------------------------------------------------------------
+# Author            :   Sebastien Pierre                     <sebastien@ivy.fr>
+# License           :   Revised BSD License
+# -----------------------------------------------------------------------------
+# Creation date     :   19-Oct-2026
+# Last mod.         :   19-Oct-2026
+# -----------------------------------------------------------------------------
+
+import os
+
+try:
+	import json
+except ImportError:
+	import simplejson as json
+
+__doc__ = """\
+Keeps the manifest of the files generated for each mode of a site (like
+`Site/Local.manifest` for the `Site/Local` directory). The manifest is a JSON
+file that maps the path of each output file (relative to the output
+directory) to its source (relative to the site root, or null for the files
+that have no source, like the sitemap), its digest and its size:
+
+>   {"version":1, "files":{
+>       "index.html":{"source":"Pages/index.html.tmpl", "hash":"sha1:...", "size":1024},
+>       ...
+>   }}
+
+The builder uses the manifest to remove the files whose source was removed
+(orphans), and deployment tools can compare two manifests (see `diff`)
+instead of walking and hashing the whole output directory."""
+
+VERSION = 1
+
+def diff( previous, current ):
+	"""Compares the given dictionaries of files (as found in manifests),
+	returning an (updated, removed) couple, where updated is the sorted list
+	of the paths that are new or whose digest changed, and removed the sorted
+	list of the paths that are not in the current files."""
+	updated = []
+	for path, entry in current.items():
+		known = previous.get(path)
+		if not known or known.get("hash") != entry.get("hash") or \
+		known.get("size") != entry.get("size"):
+			updated.append(path)
+	removed = filter(lambda p:not current.has_key(p), previous.keys())
+	updated.sort()
+	removed.sort()
+	return updated, removed
+
+#------------------------------------------------------------------------------
+#
+#  Manifest
+#
+#------------------------------------------------------------------------------
+
+class Manifest:
+	"""The manifest of the files of an output directory. The files of the
+	previous build are loaded in `previous`, and the files produced by the
+	current build are registered in `files` (see `record` and `keep`)."""
+
+	def __init__( self, path ):
+		self.path     = path
+		self.previous = {}
+		self.files    = {}
+
+	def load( self ):
+		"""Loads the files of the previous build, if the manifest exists and
+		has the current version."""
+		self.previous = {}
+		if not os.path.exists(self.path): return self
+		fd = open(self.path, "rb")
+		try:
+			try:
+				data = json.load(fd)
+			except ValueError:
+				data = None
+		finally:
+			fd.close()
+		if type(data) is dict and data.get("version") == VERSION:
+			for path, entry in data.get("files", {}).items():
+				self.previous[str(path)] = entry
+		return self
+
+	def record( self, path, source, digest, size ):
+		"""Registers the output file with the given path, which was produced
+		from the given source."""
+		self.files[path] = {"source":source, "hash":digest, "size":size}
+
+	def keep( self, path, source ):
+		"""Registers the output file with the given path as unchanged since the
+		previous build, returning False if it was not in the previous build
+		(or had another source), in which case it is not registered."""
+		entry = self.previous.get(path)
+		if entry is None or entry.get("source") != source: return False
+		self.files[path] = entry
+		return True
+
+	def merge( self, path ):
+		"""Registers the files of the partial manifest at the given path, as
+		saved by a shard of the build (see `tahchee.sharding`)."""
+		self.files.update(Manifest(path).load().previous)
+
+	def orphans( self ):
+		"""Returns the sorted list of the files of the previous build that were
+		not registered by the current build."""
+		res = filter(lambda p:not self.files.has_key(p), self.previous.keys())
+		res.sort()
+		return res
+
+	def save( self, merge=False, path=None ):
+		"""Saves the registered files, and the files of the previous build that
+		were not registered when merge is True (for partial builds), to the
+		given path (the manifest path by default)."""
+		files = {}
+		if merge: files.update(self.previous)
+		files.update(self.files)
+		fd = open(path or self.path, "wb")
+		try:
+			json.dump({"version":VERSION, "files":files}, fd, indent=1, sort_keys=True)
+			fd.write("\n")
+		finally:
+			fd.close()
+		return files
+
+# EOF - vim: tw=80 ts=4 sw=4 noet
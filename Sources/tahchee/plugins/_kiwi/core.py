@@ -11,7 +11,7 @@
 # Last mod.         :   05-Aug-2008
 # -----------------------------------------------------------------------------
 
-import os, sys
+import os, sys, bisect
 
 import re, string, operator, getopt, codecs
 
@@ -34,6 +34,9 @@ from blocks  import *
 # How many spaces a tab represent.
 TAB_SIZE = 4
 
+# How many characters are read before the streaming parser parses a chunk.
+STREAM_CHUNK_SIZE = 64 * 1024
+
 #------------------------------------------------------------------------------
 #
 #  Regular expressions
@@ -46,6 +49,35 @@ RE_TABS = re.compile("\t+")
 ATTRIBUTE = u"""(\w+)\s*=\s*('[^']*'|"[^"]*")"""
 RE_ATTRIBUTE = re.compile(ATTRIBUTE, re.LOCALE|re.MULTILINE)
 
+#------------------------------------------------------------------------------
+#
+#  Line index
+#
+#------------------------------------------------------------------------------
+
+class LineIndex:
+	"""The line index converts offsets in a text to (line, column) couples
+	(and back) in logarithmic time, by looking up the offsets of the start of
+	each line, which are computed once. Lines start at the given `firstLine`
+	(1 by default) and columns at 0."""
+
+	def __init__( self, text, firstLine=1 ):
+		self.firstLine = firstLine
+		self.starts    = [0]
+		newline = text.find("\n")
+		while newline != -1:
+			self.starts.append(newline + 1)
+			newline = text.find("\n", newline + 1)
+
+	def lineColumn( self, offset ):
+		"""Returns the (line, column) couple for the given offset."""
+		line = bisect.bisect_right(self.starts, offset) - 1
+		return (line + self.firstLine, offset - self.starts[line])
+
+	def offset( self, line, column=0 ):
+		"""Returns the offset for the given line and column."""
+		return self.starts[line - self.firstLine] + column
+
 #------------------------------------------------------------------------------
 #
 #  Parsing context
@@ -69,6 +101,8 @@ class Context:
 		- blockEndOffset: the offset in the text where the currently parsed block
 	  	ends.
 		- parser: a reference to the Kiwi parser instance using the context.
+		- firstLine: the number of the first line of the document text (the
+		  streaming parser gives the text one chunk at a time).
 	"""
 
 	def __init__( self, documentText, markOffsets=False ):
@@ -82,6 +116,7 @@ class Context:
 		self._offset = 0
 		self.blockStartOffset = 0
 		self.blockEndOffset = -1
+		self.firstLine = 1
 		self.setDocumentText(documentText)
 		self._currentFragment = None
 		self.parser = None
@@ -157,14 +192,29 @@ class Context:
 
 	def setDocumentText( self, text ):
 		"""Sets the text of the current document. This should only be called
-		at context initialisation."""
+		at context initialisation, or by the streaming parser when it moves to
+		the next chunk of the document."""
 		if not type(text) == type(u""):
 			text = unicode(text)
 		self.documentText = text
 		self.documentTextLength = len(text)
 		self.blockEndOffset = self.documentTextLength
+		self._lineIndex = None
 		self.setOffset(0)
 
+	def getLineIndex( self ):
+		"""Returns the `LineIndex` for the document text, which is only
+		created when it is first needed."""
+		if self._lineIndex is None:
+			self._lineIndex = LineIndex(self.documentText, self.firstLine)
+		return self._lineIndex
+
+	def getLineColumn( self, offset=None ):
+		"""Returns the (line, column) couple for the given offset, or the
+		current offset when None."""
+		if offset is None: offset = self.getOffset()
+		return self.getLineIndex().lineColumn(offset)
+
 	def setOffset( self, offset ):
 		"""Sets the current offset."""
 		self._offset = offset
@@ -265,6 +315,9 @@ class Context:
 		clone.currentNode = self.currentNode
 		clone.parser      = self.parser
 		clone.document    = self.document
+		clone.firstLine   = self.firstLine
+		# The clone has the same text, so it shares the line index
+		clone._lineIndex  = self.getLineIndex()
 		clone.setOffset(self.getOffset())
 		clone.setCurrentBlock(self.blockStartOffset, self.blockEndOffset)
 		return clone
@@ -411,9 +464,7 @@ class Parser:
 	# EXCEPTIONS_______________________________________________________________
 
 	def _print( self, message, context ):
-		text   = context.documentText[:context.getOffset()]
-		line   = len(text.split("\n"))
-		offset = context.getOffset() - text.rfind("\n") - 1
+		line, offset = context.getLineColumn()
 		message = unicode(message % (line, offset) + "\n")
 		sys.stderr.write(message.encode("iso-8859-1"))
 
@@ -433,7 +484,8 @@ class Parser:
 		set to True, then all nodes of the document are annotated with their
 		position in the original text as well with a number. The document will
 		also have an `offsets` attribute that will contain a list of (start,
-		end) offset tuples for each element."""
+		end) offset tuples for each element, and a `lineIndex` attribute (see
+		`LineIndex`) to convert these offsets to lines and columns."""
 		# Text MUST be unicode
 		assert type(text) == type(u"")
 		context = Context(text, markOffsets=offsets)
@@ -447,13 +499,178 @@ class Parser:
 			if len(node.childNodes) == 0:
 				context.rootNode.removeChild(node)
 		if offsets:
-			context.offsets = self._updateElementOffsets(context, offsets=[])
+			context.offsets = self._updateElementOffsets(context)
+			context.document.offsets   = context.offsets
+			context.document.lineIndex = context.getLineIndex()
 		return context.document
 
 	def parseContext( self, context ):
 		while not context.documentEndReached():
 			self._parseNextBlock(context)
 
+	def iterparse( self, stream, chunkSize=STREAM_CHUNK_SIZE ):
+		"""Parses the given stream (any iterable of lines, like a file) and
+		yields `(event, node)` couples as soon as parts of the document are
+		finished, so that the whole document never has to be held in memory:
+
+		- `("header", rootNode)` once, before the first block, when the
+		  document header is complete
+		- `("open", section)` for a section that is not finished, but whose
+		  heading is, before the blocks of its content
+		- `("block", node)` for each finished node of the content, or of the
+		  content of an open section
+		- `("close", section)` once an open section is finished
+		- `("end", rootNode)` once the stream is exhausted, the root node
+		  then holds the header and the references.
+
+		The input is read line by line and parsed in chunks of about
+		`chunkSize` characters, which always end on a block separator
+		followed by an unindented line outside of any markup. Once a block was
+		yielded and the iteration resumed, it is removed from the document
+		(sections are counted by an empty placeholder, see
+		`kiwi2html.getSectionNumberPrefix`, so that the numbering of the
+		following sections stays right), so that only the path of the open
+		sections and their last block are kept in memory.
+
+		Offsets are not supported in this mode."""
+		context = Context(u"")
+		self._initialiseContextDocument(context)
+		context.parser = self
+		context._streamHeader = False
+		lines        = []
+		size         = 0
+		markup_stack = []
+		# The number of the first line of the current chunk, so that the
+		# diagnostics give the lines of the whole stream
+		context.firstLine = 1
+		# The index of the line following the first blank line after the last
+		# non-blank line, which is where the block separator ends
+		cut          = None
+		for line in stream:
+			if type(line) != unicode: line = line.decode(self.inputEncoding)
+			blank = not line.strip()
+			# We only cut the input before a non-blank, unindented line that
+			# follows a blank line, when no markup element is left open
+			if not blank and cut is not None and size >= chunkSize \
+			and not markup_stack and line[0] not in u" \t":
+				for event in self._parseChunk(context, u"".join(lines[:cut])):
+					yield event
+				context.firstLine += cut
+				lines = lines[cut:]
+				size  = sum(map(len, lines))
+			if blank:
+				if cut is None and lines and lines[-1].strip(): cut = len(lines) + 1
+			else:
+				cut = None
+			lines.append(line)
+			size += len(line)
+			self._updateMarkupStack(markup_stack, line)
+		if lines:
+			for event in self._parseChunk(context, u"".join(lines)):
+				yield event
+		for event in self._flushBlocks(context, True):
+			yield event
+		for node in (context.content, context.references, context.appendices):
+			if len(node.childNodes) == 0:
+				context.rootNode.removeChild(node)
+		yield ("end", context.rootNode)
+
+	def _updateMarkupStack( self, stack, line ):
+		"""Updates the given list of currently open markup element names with
+		the markup found in the given line."""
+		for match in RE_MARKUP.finditer(line):
+			if Markup_isEndTag(match):
+				name = match.group(4)
+				if name in stack:
+					while stack.pop() != name: pass
+			elif Markup_isStartTag(match):
+				stack.append(match.group(1))
+
+	def _parseChunk( self, context, text ):
+		"""Parses the given chunk of text within the given (streaming) context,
+		yielding the events for the blocks that are finished."""
+		context.setDocumentText(text)
+		while not context.documentEndReached():
+			self._parseNextBlock(context)
+		return self._flushBlocks(context)
+
+	def _flushBlocks( self, context, all=False ):
+		"""Yields the events for the finished blocks of the given streaming
+		context and removes them from the document. Unless `all` is True, the
+		last block and the last section (which may still receive content) of
+		the content and of the open sections are kept."""
+		flushed = False
+		for event in self._flushContent(context, context.content, all):
+			if not context._streamHeader:
+				context._streamHeader = True
+				if not context.header.childNodes:
+					context.rootNode.removeChild(context.header)
+				yield ("header", context.rootNode)
+			flushed = True
+			yield event
+		if all and not context._streamHeader:
+			context._streamHeader = True
+			if not context.header.childNodes:
+				context.rootNode.removeChild(context.header)
+			yield ("header", context.rootNode)
+		# Sections that were flushed cannot be parents of new sections anymore
+		if flushed:
+			context.sections = [s for s in context.sections if self._isAttached(context, s[0])]
+
+	def _flushContent( self, context, content, all=False ):
+		"""Yields the events for the finished children of the given content
+		node (the document content or the content of an open section), and
+		opens its last section, whose content is then flushed as well."""
+		blocks = [n for n in content.childNodes if not getattr(n, "_streamed", False)]
+		opened = None
+		if not all:
+			sections = [n for n in blocks if n.nodeName in ("Chapter", "Section")]
+			limit    = len(blocks) - 1
+			if sections:
+				limit  = min(limit, blocks.index(sections[-1]))
+				opened = sections[-1]
+			blocks   = blocks[:max(0, limit)]
+		for node in blocks:
+			if getattr(node, "_streamOpened", False):
+				for event in self._flushContent(context, self._sectionContent(node), True):
+					yield event
+				yield ("close", node)
+			else:
+				yield ("block", node)
+			# Flushed sections are counted by a placeholder, which is the
+			# first child of the content
+			placeholder = content.firstChild
+			if node.nodeName not in ("Chapter", "Section"):
+				content.removeChild(node)
+			elif getattr(placeholder, "_streamed", False):
+				placeholder._streamedSections += 1
+				content.removeChild(node)
+			else:
+				placeholder = context.document.createElementNS(None, node.nodeName)
+				placeholder._streamed = True
+				placeholder._streamedSections = 1
+				content.replaceChild(placeholder, node)
+			node.unlink()
+		# The last section is opened, so that the finished blocks of its
+		# content are not kept until the section ends
+		if opened is not None and opened.nodeName == "Section":
+			if not getattr(opened, "_streamOpened", False):
+				opened._streamOpened = True
+				yield ("open", opened)
+			for event in self._flushContent(context, self._sectionContent(opened)):
+				yield event
+
+	def _sectionContent( self, section ):
+		"""Returns the content node of the given section."""
+		for child in section.childNodes:
+			if child.nodeName == "Content": return child
+
+	def _isAttached( self, context, node ):
+		while node is not None:
+			if node is context.rootNode: return True
+			node = node.parentNode
+		return False
+
 	def _parseNextBlock( self, context, end=None ):
 		"""Parses the block identified in the given context, ending at the given
 		'end' (if 'end' is not None)."""
@@ -624,10 +841,6 @@ class Parser:
 			local_offset = markup_match.end()
 		return local_offset, None
 
-	def _nodeHasOffsets( self, node ):
-		start, end = self._nodeGetOffsets(node)
-		return start != None and end != None
-
 	def _nodeGetOffsets( self, node ):
 		start = node.getAttributeNS(None, "_start") 
 		end   = node.getAttributeNS(None, "_end") 
@@ -639,93 +852,105 @@ class Parser:
 		else: end = None
 		return (start,end)
 
-	def _nodeEnsureOffsets( self, node, start=None, end=None ):
-		nstart, nend = self._nodeGetOffsets(node)
-		if nstart is None and start != None:
-			node.setAttributeNS(None, "_start", str(start))
-		if nend is None and end != None:
-			node.setAttributeNS(None, "_end", str(end))
-
-	def _updateElementOffsets( self, context, node=None, counter=0, offsets=None ):
+	def _updateElementOffsets( self, context ):
 		"""This function ensures that every element has a _start and _end
-		attribute indicating the bit of original data it comes from."""
-		if node == None:
-			node = context.document.childNodes[0]
-			self._nodeEnsureOffsets(node, 0, context.documentTextLength)
-		node.setAttributeNS(None, "_number", str(counter))
-		# The given offsets parameter is an array with the node number and the
-		# offsets. It can be used by embedders to easily access nods by offset
-		if offsets != None:
-			assert len(offsets) == counter, "%s != %s" % (len(offsets) , counter)
-			this_offsets = [None,None]
-			offsets.append(this_offsets)
-		# The first step is to fill an array with the child nodes offsets
-		# Each child node may or may not have an offset
-		child_nodes = tuple([n for n in node.childNodes if n.nodeType == n.ELEMENT_NODE])
-		nstart, nend = self._nodeGetOffsets(node)
-		if child_nodes:
-			self._nodeEnsureOffsets(child_nodes[0], start=nstart)
-			self._nodeEnsureOffsets(child_nodes[-1], end=nend)
-		child_offsets = []
-		start = end = None
-		for e in child_nodes:
-			counter = self._updateElementOffsets(context, e, counter + 1)
-			child_offsets.append(self._nodeGetOffsets(e))
-		# Once this list is created, we retried the start offset of the earliest
-		# child that has a start offset, same for the end offset of the latest
-		# child
-		child_start = None
-		child_end   = None
-		if child_offsets:
-			i = 0
-			j = len(child_offsets) - 1
-			while i < len(child_offsets) and child_offsets[i][0] == None: i += 1
-			while j >= 0 and child_offsets[j][1] == None: j -= 1
-			if i < len(child_offsets): child_start = child_offsets[i][0]
-			if j >= 0: child_end   = child_offsets[j][1]
-		# We update the current node with the child offsets (this allows node
-		# that have incomplete offsets to be completed)
-		self._nodeEnsureOffsets(node, child_start, child_end)
-		# And now we update the children offsets again (so that they actually
-		# all have offsets), because we have all the information we need to
-		# actually update the children offsets
-		start, end = self._nodeGetOffsets(node)
-		self._propagateElementOffsets(node,start,end)
-		# As we now the current node offsets, we can set the real values in the
-		# fiven offsets array, by simply updating the offsets value in the
-		# `this_offsets` list.
-		if offsets!=None:
-			o = self._nodeGetOffsets(node)
-			this_offsets[0] = o[0]
-			this_offsets[1] = o[1]
-		# And we return the number of this node
-		return counter
-
-	def _propagateElementOffsets( self, element, start=None, end=None ):
-		"""Used by the _updateElementOffsets to ensure start and end offsets in
-		all children and descendants."""
-		#if start is None or end is None: return
-		child_nodes = list([n for n in element.childNodes if n.nodeType == n.ELEMENT_NODE]) 
-		self._nodeEnsureOffsets(element, start, end)
-		# At first, we set the bounds properly, so that the first child node
-		# start is this node start, and the last node end is this node end
-		if child_nodes:
-			self._nodeEnsureOffsets(child_nodes[0],  start=start)
-			self._nodeEnsureOffsets(child_nodes[-1], end=end)
-		# Now 
-		for child in child_nodes:
-			self._propagateElementOffsets(child, start=start)
-			if self._nodeGetOffsets(child)[1] != None:
-				_,nstart = self._nodeGetOffsets(child)
-				if nstart != None: start = nstart
-		child_nodes.reverse()
-		for child in child_nodes:
-			self._propagateElementOffsets(child,end=end)
-			if self._nodeGetOffsets(child)[0] != None:
-				nend,_ = self._nodeGetOffsets(child)
-				if nend != None: end = nend
-		# TODO: Maybe update the element offsetsd
-
+		attribute indicating the bit of original data it comes from, and
+		numbers the elements in document order (the `_number` attribute).
+
+		The elements are numbered in a single traversal, and their offsets
+		are then completed in integer tables indexed by the element number (an
+		offset that is known is never changed, and the offsets of the children
+		are used to complete the offsets of their parent, which then bound the
+		offsets of its children). The attributes are only written once the
+		tables are complete.
+
+		Returns a list of (start, end) offsets indexed by element number.
+		Elements also get an `_offsetNumber` Python attribute, so that writers
+		can read the offsets from this list without parsing the attributes."""
+		root     = context.document.childNodes[0]
+		nodes    = []
+		children = []
+		stack    = [(root, None)]
+		while stack:
+			node, parent = stack.pop()
+			number = len(nodes)
+			nodes.append(node)
+			children.append([])
+			if parent is not None: children[parent].append(number)
+			child_nodes = [n for n in node.childNodes if n.nodeType == n.ELEMENT_NODE]
+			child_nodes.reverse()
+			for child in child_nodes: stack.append((child, number))
+		known    = [self._nodeGetOffsets(node) for node in nodes]
+		starts   = [o[0] for o in known]
+		ends     = [o[1] for o in known]
+		# A subtree is complete when all its elements have both offsets, in
+		# which case completing it again would not change anything
+		complete = [False] * len(nodes)
+		# The attributes are set in the order in which their value is known,
+		# as it defines the order of the attributes of HTML elements
+		order    = [[] for node in nodes]
+		def ensure( i, start=None, end=None ):
+			if starts[i] is None and start is not None:
+				starts[i] = start
+				order[i].append("_start")
+			if ends[i] is None and end is not None:
+				ends[i] = end
+				order[i].append("_end")
+		def check( i ):
+			complete[i] = starts[i] is not None and ends[i] is not None \
+			and not [c for c in children[i] if not complete[c]]
+		def update( i ):
+			order[i].append("_number")
+			child_nodes = children[i]
+			if child_nodes:
+				ensure(child_nodes[0], start=starts[i])
+				ensure(child_nodes[-1], end=ends[i])
+			for c in child_nodes: update(c)
+			# We complete this element with the offsets of the earliest child
+			# that has a start offset, and of the latest child that has an end
+			# offset
+			child_start = child_end = None
+			for c in child_nodes:
+				if starts[c] is not None:
+					child_start = starts[c]
+					break
+			for c in reversed(child_nodes):
+				if ends[c] is not None:
+					child_end = ends[c]
+					break
+			ensure(i, child_start, child_end)
+			propagate(i, starts[i], ends[i])
+		def propagate( i, start=None, end=None ):
+			if complete[i]: return
+			ensure(i, start, end)
+			child_nodes = children[i]
+			# The first child starts with its parent, and the last child ends
+			# with it, then each child starts where the previous one ends and
+			# ends where the next one starts
+			if child_nodes:
+				ensure(child_nodes[0], start=start)
+				ensure(child_nodes[-1], end=end)
+			for c in child_nodes:
+				propagate(c, start=start)
+				if ends[c] is not None: start = ends[c]
+			for c in reversed(child_nodes):
+				propagate(c, end=end)
+				if starts[c] is not None: end = starts[c]
+			check(i)
+		ensure(0, 0, context.documentTextLength)
+		update(0)
+		offsets = []
+		values  = {}
+		for i in range(len(nodes)):
+			node = nodes[i]
+			values["_number"] = i
+			values["_start"]  = starts[i]
+			values["_end"]    = ends[i]
+			for name in order[i]:
+				node.setAttributeNS(None, name, str(values[name]))
+			node._offsetNumber = i
+			offsets.append((starts[i], ends[i]))
+		return offsets
 
 	# TEXT PROCESSING UTILITIES________________________________________________
 
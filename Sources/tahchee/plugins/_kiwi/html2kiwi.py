@@ -6,9 +6,10 @@
 # Author            :   Sebastien Pierre                 <sebastien@type-z.org>
 # -----------------------------------------------------------------------------
 # Creation date     :   06-Mar-2006
-# Last mod.         :   06-Mar-2006
+# Last mod.         :   19-Oct-2026
 # History           :
-#                       06-Mar-2006 First implementation
+#                       19-Oct-2026 Streaming converter on HTMLParser, batch
+#                                   mode
 #                       06-Mar-2006 First implementation
 #
 # Bugs              :
@@ -17,71 +18,260 @@
 #                       -
 #
 
-import re, textwrap, xml.dom
-from templates import Processor
+import sys, re, textwrap, codecs, getopt, htmlentitydefs, HTMLParser
+from formatting import escapeHTML
 
 # Text to HTML: http://bhaak.dyndns.org/vilistextum/screenshots.html
-# From <http://www.boddie.org.uk/python/HTML.html>
-from xml.dom.ext.reader import HtmlLib
 
-# We create the processor, register the rules and define the process variable
-processor      = Processor()
+__doc__ = """\
+Converts HTML to Kiwi text. The HTML is tokenized by the standard library
+`HTMLParser` and the Kiwi text is written as the HTML is read: only the
+blocks that are not closed yet (like a list and its current item) are kept
+in memory, so that large documents can be converted in bounded memory.
+
+Each block element has a `convertXXX(text)` function (where `XXX` is the
+upper case tag name) that returns the Kiwi text for the converted content of
+the block. Other elements are replaced by their text, and the content of
+SCRIPT and STYLE elements is dropped."""
+
+# The size of the chunks read from the input files
+READ_CHUNK_SIZE = 64 * 1024
+
+RE_SPACES       = re.compile("\s+")
+
+# Elements whose content is not converted
+IGNORED         = ("SCRIPT", "STYLE")
 
 #------------------------------------------------------------------------------
 #
-#  Actual element processing
+#  Converter
 #
 #------------------------------------------------------------------------------
 
-def convertHTML(element):
-	return process(element, "$(*)\n")
+class Converter(HTMLParser.HTMLParser):
+	"""Converts the HTML given to `feed` into Kiwi text, which is given to
+	the `write` function as soon as each top-level block is closed. Call
+	`close` once the whole document was fed."""
+
+	def __init__( self, write ):
+		HTMLParser.HTMLParser.__init__(self)
+		self.write   = write
+		# The stack of open blocks, as [TAG, [TEXT]] lists
+		self.blocks  = []
+		self.ignored = 0
+
+	def handle_starttag( self, tag, attrs ):
+		tag = tag.upper()
+		if tag in IGNORED:
+			self.ignored += 1
+		elif BLOCKS.has_key(tag):
+			# Blocks cannot be nested in paragraphs, and list items close the
+			# previous item of the same list
+			while self.blocks and (self.blocks[-1][0] == "P" or \
+			(tag == "LI" and self.blocks[-1][0] == "LI")):
+				self._closeBlock()
+			self.blocks.append([tag, []])
+
+	def handle_startendtag( self, tag, attrs ):
+		pass
 
-def convertP(element):
-	return "\n".join(textwrap.wrap(process(element, "$(*)"), 79)) + "\n\n"
+	def handle_endtag( self, tag ):
+		tag = tag.upper()
+		if tag in IGNORED:
+			self.ignored = max(0, self.ignored - 1)
+		elif BLOCKS.has_key(tag):
+			# We only close the block if it is open, closing the blocks it
+			# contains that were not closed
+			for block in self.blocks:
+				if block[0] == tag:
+					while self._closeBlock() != tag: pass
+					break
 
-def convertPRE(element):
+	def handle_data( self, data ):
+		if self.ignored: return
+		# Kiwi escapes the content of preformatted blocks, but passes entities
+		# through in other blocks
+		if self.blocks and self.blocks[-1][0] == "PRE":
+			self.blocks[-1][1].append(data)
+			return
+		data = RE_SPACES.sub(" ", data)
+		# Spaces are only kept between inline text
+		if not data.strip() and (not self.blocks or not self.blocks[-1][1] \
+		or self.blocks[-1][1][-1].endswith("\n")):
+			return
+		# Text outside of a block makes an implicit paragraph
+		if not self.blocks: self.blocks.append(["P", []])
+		self.blocks[-1][1].append(escapeHTML(data))
+
+	def handle_entityref( self, name ):
+		codepoint = htmlentitydefs.name2codepoint.get(name)
+		if codepoint is None: self.handle_data("&%s;" % (name))
+		else: self.handle_data(unichr(codepoint))
+
+	def handle_charref( self, name ):
+		try:
+			if name[0] in "xX": codepoint = int(name[1:], 16)
+			else: codepoint = int(name)
+			self.handle_data(unichr(codepoint))
+		except (ValueError, OverflowError):
+			self.handle_data("&#%s;" % (name))
+
+	def _closeBlock( self ):
+		tag, text = self.blocks.pop()
+		text = BLOCKS[tag]("".join(text))
+		if self.blocks:
+			# A block always starts on a new line of its parent
+			parent = self.blocks[-1][1]
+			if parent and not parent[-1].endswith("\n"): parent.append("\n")
+			parent.append(text)
+		else:
+			self.write(text)
+		return tag
+
+	def close( self ):
+		HTMLParser.HTMLParser.close(self)
+		while self.blocks: self._closeBlock()
+
+#------------------------------------------------------------------------------
+#
+#  Actual element processing
+#
+#------------------------------------------------------------------------------
+
+def convertP( text ):
+	return "\n".join(textwrap.wrap(text.strip(), 79)) + "\n\n"
+
+def convertPRE( text ):
 	res = "\n"
-	for line in process(element, "$(*)").split("\n"):
-		res += ">    %s\n" % (line)
+	for line in text.strip("\n").split("\n"):
+		res += ">   %s\n" % (line)
 	return res + "\n"
 
-def convertUL(element):
+def convertUL( text ):
 	res = ""
-	for line in process(element, "$(*)").split("\n"):
-		res += "  %s\n" % (line)
-	return res + "\n\n"
+	for line in text.strip("\n").split("\n"):
+		if line: res += "  %s\n" % (line)
+		else: res += "\n"
+	return res + "\n"
 
-def convertLI(element):
-	lines = process(element, "$(*)").split("\n")
-	res = " * " + lines[0]
+def convertLI( text ):
+	lines = text.strip().split("\n")
+	res = " - " + lines[0].strip() + "\n"
 	for line in lines[1:]:
-		res += "   %s\n" % (line)
-	return res + "\n"
+		if line: res += "   %s\n" % (line)
+		else: res += "\n"
+	return res
 
-def convertH1(element):
-	res = process(element, "$(*)")
+def convertH1( text ):
+	res = text.strip()
 	return "\n" + res + "\n" + "=" * len(res) + "\n\n"
 
-def convertH2(element):
-	res = process(element, "$(*)")
+def convertH2( text ):
+	res = text.strip()
 	return "\n" + res + "\n" + "-" * len(res) + "\n\n"
 
-
-name2functions = {}
+BLOCKS = {}
 for symbol in filter(lambda x:x.startswith("convert"), dir()):
-	name2functions[symbol] = eval(symbol)
-processor.register(name2functions)
-process = processor.process
+	BLOCKS[symbol[len("convert"):]] = eval(symbol)
+
+#------------------------------------------------------------------------------
+#
+#  Conversion functions
+#
+#------------------------------------------------------------------------------
+
+def convertDocument( text, encoding="iso-8859-1" ):
+	"""Returns the Kiwi text for the given HTML text, which is decoded with
+	the given encoding when it is not unicode."""
+	if type(text) != unicode: text = text.decode(encoding)
+	res       = []
+	converter = Converter(res.append)
+	converter.feed(text)
+	converter.close()
+	return "".join(res)
+
+def convertFile( ifile, ofile, options ):
+	"""Converts the HTML read from the given input file (which gives unicode
+	text, see `codecs.open`) to Kiwi text written to the given output file,
+	encoded in the `outputEncoding` option. This is the converter used by the
+	batch mode."""
+	encoding  = options["outputEncoding"]
+	converter = Converter(lambda text:ofile.write(text.encode(encoding)))
+	while True:
+		data = ifile.read(READ_CHUNK_SIZE)
+		if not data: break
+		converter.feed(data)
+	converter.close()
+
+USAGE = """\
+html2kiwi [options] source [destination]
+html2kiwi [options] --output-dir=DIR source...
+
+   Converts HTML sources to Kiwi text.
+
+Options:
+
+   -i --input-encoding=ENC       The encoding of the HTML sources
+   -o --output-encoding=ENC      The encoding of the Kiwi text
+   -d --output-dir=DIR           Converts every given source (globs and @LIST
+                                 files are expanded) into the output directory
+   -j --jobs=N                   The number of worker processes used with
+                                 --output-dir (defaults to the number of CPUs)
+"""
 
-def convertDocument( text ):
-	reader = HtmlLib.Reader()
-	doc    = reader.fromString(text)
-	return processor.generate(doc)
+def run( arguments ):
+	"""Returns a (STATUS, VALUE) couple, like the Kiwi `main.run`."""
+	import main
+	try:
+		optlist, args = getopt.getopt(arguments, "hi:o:d:j:",
+		["help", "input-encoding=", "output-encoding=", "output-dir=", "jobs="])
+	except getopt.GetoptError, e:
+		return (main.ERROR, "html2kiwi error: %s" % (e))
+	options = {
+		"inputEncoding":main.LATIN1,
+		"outputEncoding":main.LATIN1,
+		"extension":".txt"
+	}
+	output_dir = None
+	jobs       = None
+	for opt, arg in optlist:
+		if opt in ('-h', '--help'):
+			return (main.INFO, USAGE)
+		elif opt in ('-i', '--input-encoding'):
+			options["inputEncoding"] = options["outputEncoding"] = arg
+		elif opt in ('-o', '--output-encoding'):
+			options["outputEncoding"] = arg
+		elif opt in ('-d', '--output-dir'):
+			output_dir = arg
+		elif opt in ('-j', '--jobs'):
+			try:
+				jobs = int(arg)
+			except ValueError:
+				jobs = 0
+			if jobs < 1:
+				return (main.ERROR, "html2kiwi error: Specified number of jobs (%s) should be superior to 0." % (arg))
+	if not args:
+		return (main.INFO, USAGE)
+	if output_dir:
+		return main.batch(args, output_dir, options, jobs, converter=convertFile)
+	if args[0] == "-": ifile = codecs.getreader(options["inputEncoding"])(sys.stdin)
+	else: ifile = codecs.open(args[0], "r", options["inputEncoding"])
+	if len(args) > 1: ofile = open(args[1], "w")
+	else: ofile = sys.stdout
+	try:
+		convertFile(ifile, ofile, options)
+	finally:
+		if args[0] != "-": ifile.close()
+		if len(args) > 1: ofile.close()
+	return (main.SUCCESS, "")
 
 if __name__ == "__main__":
-	import sys
-	fd = file(sys.argv[1], 'rt')
-	print convertDocument(fd.read())
-	fd.close()
+	import main
+	status, result = run(sys.argv[1:])
+	if status == main.ERROR:
+		sys.stderr.write(result + "\n")
+		sys.exit(-1)
+	elif status == main.INFO:
+		sys.stdout.write(result + "\n")
 
 # EOF
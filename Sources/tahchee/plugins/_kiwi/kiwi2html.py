@@ -23,6 +23,10 @@ import templates
 
 class Processor(templates.Processor):
 
+	def __init__( self, module=None ):
+		templates.Processor.__init__(self, module)
+		self.index = Index()
+
 	def defaultProcessElement( self, element, selector ):
 		"""We override this for elements with the 'html' attribute."""
 		if element.getAttributeNS(None, "_html"):
@@ -44,23 +48,215 @@ class Processor(templates.Processor):
 			return templates.Processor.defaultProcessElement(self,element,selector)
 
 	def generate( self, xmlDocument, bodyOnly=False, variables={} ):
+		"""Generates the HTML for the given document. When the `TOC_DEPTH`
+		variable is set, the table of contents (sections up to this depth) is
+		available as the `TOC` variable, and is put before the content."""
 		node = xmlDocument.getElementsByTagName("Document")[0]
 		self.variables = variables
+		self.reset()
+		self.index = Index(variables.get("TOC_DEPTH"))
+		self.index.add(node)
+		if self.index.tocDepth:
+			self.variables = variables = variables.copy()
+			variables["TOC"] = self.index.toc()
 		if bodyOnly:
 			for child in node.childNodes:
 				if child.nodeName == "Content":
-					return convertContent_bodyonly(child)
+					return (variables.get("TOC") or "") + convertContent_bodyonly(child)
 		else:
 			return convertDocument(node)
 
+	def generateStream( self, events, output, bodyOnly=False, variables={}, encoding=None ):
+		"""Writes the HTML for the given `Parser.iterparse` events to the given
+		output as the events come, encoding the text with the given encoding
+		(when given). The generated HTML is the same as `generate` without
+		offsets, but only the open sections and one block are held in memory
+		at once.
+
+		As the document is indexed block by block, there is no table of
+		contents, and internal links only resolve to the targets and sections
+		that come before them (sections referenced afterwards have no
+		anchor)."""
+		self.variables = variables
+		self.index     = Index()
+		def write( text ):
+			if encoding: text = text.encode(encoding)
+			output.write(text)
+		opened = False
+		for event, node in events:
+			# The parser reuses the document nodes between events
+			self.reset()
+			if event == "header":
+				if not bodyOnly: write(process(node, DOCUMENT_START))
+			elif event in ("block", "open"):
+				if not opened and not bodyOnly: write("<div class='content'>")
+				opened = True
+				if event == "open":
+					self.index.add(node, False)
+					write(sectionStart(node))
+				else:
+					self.index.add(node)
+					write(self.processElement(node))
+			elif event == "close":
+				write(SECTION_END)
+			elif event == "end":
+				if opened and not bodyOnly: write("</div>")
+				if not bodyOnly: write(process(node, DOCUMENT_END))
+
+#------------------------------------------------------------------------------
+#
+#  Document index
+#
+#------------------------------------------------------------------------------
+
+class Index:
+	"""The index numbers the sections of a document and collects its targets,
+	reference entries and internal links in a single traversal (see `add`), so
+	that section numbers, anchors, internal links and the table of contents
+	are resolved in linear time.
+
+	Sections only get an anchor when there is a table of contents, or when an
+	internal link refers to their heading, so that the HTML stays the same for
+	other documents."""
+
+	def __init__( self, tocDepth=None ):
+		self.tocDepth   = tocDepth or 0
+		# Maps section elements to their number (as "1.2.3")
+		self.numbers    = {}
+		# Maps section elements to their anchor name
+		self.anchors    = {}
+		# Maps the keys of targets and reference entries to their anchor name
+		self.targets    = {}
+		# Maps the keys of section headings to the (first) section element
+		self.headings   = {}
+		# The keys of the targets of internal links
+		self.referenced = {}
+		# The list of (number, section) in document order
+		self.sections   = []
+		self._counts    = {}
+		self._names     = {}
+
+	def add( self, node, content=True ):
+		"""Indexes the given node and its descendants. Nodes must be added in
+		document order, which is the case when the whole document is added at
+		once, or when blocks are added as they are streamed. When `content`
+		is False, the content of the given section is not indexed (the
+		streaming writer indexes the blocks of open sections one by one)."""
+		stack = [node]
+		while stack:
+			element = stack.pop()
+			name    = element.nodeName
+			if name in ("Chapter", "Section"):
+				self._addSection(element)
+			elif name == "target":
+				self._addTarget(element.getAttributeNS(None, "name"), stringToTarget(element.getAttributeNS(None, "name")))
+			elif name == "Entry":
+				self._addTarget(element.getAttributeNS(None, "id"), element.getAttributeNS(None, "id"))
+			elif name == "link" and element.getAttributeNS(None, "type") == "ref":
+				self.referenced[targetKey(element.getAttributeNS(None, "target"))] = True
+			children = [c for c in element.childNodes if c.nodeType == xml.dom.Node.ELEMENT_NODE
+				and (content or element is not node or c.nodeName != "Content")]
+			children.reverse()
+			stack.extend(children)
+
+	def _addTarget( self, name, anchor ):
+		key = targetKey(name)
+		if key in self.targets: return
+		self.targets[key]   = anchor
+		self._names[anchor] = True
+
+	def _addSection( self, element ):
+		# Sections are numbered by their rank among the sections of their
+		# parent, prefixed by the number of the enclosing section (as
+		# `getSectionNumberPrefix` does)
+		parent = element.parentNode
+		count  = self._counts.get(parent, 0) + 1
+		self._counts[parent] = count
+		prefix = self.numbers.get(parent.parentNode)
+		if prefix: number = "%s.%s" % (prefix, count)
+		else: number = str(count)
+		self.numbers[element] = number
+		self.sections.append((number, element))
+		key = targetKey(headingText(element))
+		if key and key not in self.headings: self.headings[key] = element
+
+	def number( self, element ):
+		"""Returns the number of the given section element."""
+		number = self.numbers.get(element)
+		if number is None: return getSectionNumberPrefix(element)
+		return number
+
+	def anchor( self, element ):
+		"""Returns the anchor name for the given section, or None when the
+		section does not need one."""
+		anchor = self.anchors.get(element)
+		if anchor is not None: return anchor
+		key = targetKey(headingText(element))
+		if not self.tocDepth and not (key in self.referenced and self.headings.get(key) is element):
+			return None
+		anchor = stringToTarget(headingText(element))
+		if not anchor or anchor in self._names:
+			anchor = "section_" + self.number(element)
+		self.anchors[element] = anchor
+		self._names[anchor]   = True
+		return anchor
+
+	def resolve( self, target ):
+		"""Returns the anchor name for the given internal link target, looking
+		for a target, then a reference entry, and then a section heading."""
+		key    = targetKey(target)
+		anchor = self.targets.get(key)
+		if anchor is not None: return anchor
+		section = self.headings.get(key)
+		if section is not None: return self.anchor(section)
+		return stringToTarget(target)
+
+	def toc( self ):
+		"""Returns the HTML table of contents, which lists the sections up to
+		`tocDepth`."""
+		res   = ['<div class="kiwiTOC">']
+		depth = 0
+		for number, section in self.sections:
+			level = number.count(".") + 1
+			if level > self.tocDepth: continue
+			if level > depth:
+				res.append("<ul>" * (level - depth))
+			else:
+				res.append("</li>")
+				res.append("</ul></li>" * (depth - level))
+			depth = level
+			res.append('<li><a href="#%s"><span class="number">%s</span>%s</a>' % (
+				self.anchor(section), formatSectionNumber(number),
+				process(section, "$(Heading)")
+			))
+		res.append("</li></ul>" * depth)
+		res.append("</div>")
+		return "".join(res)
+
+def targetKey( name ):
+	"""Returns the key used to match the given target name, which ignores
+	case and spacing."""
+	return " ".join(name.split()).lower()
+
+def headingText( element ):
+	"""Returns the text of the heading of the given section element."""
+	for child in element.childNodes:
+		if child.nodeName == "Heading":
+			return nodeText(child)
+	return ""
+
+def nodeText( element ):
+	"""Returns the text contained in the given node."""
+	if element.nodeType == xml.dom.Node.TEXT_NODE: return element.data
+	return "".join([nodeText(c) for c in element.childNodes])
+
 #------------------------------------------------------------------------------
 #
 #  Actual element processing
 #
 #------------------------------------------------------------------------------
 
-def convertDocument(element):
-	return process(element, """\
+DOCUMENT_START = """\
 <!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN"
     "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
 <html xmlns="http://www.w3.org/1999/xhtml">
@@ -70,53 +266,59 @@ $(Header)$(=HEADER)
 </head>
 <body>
 $(Header:title)
-<div class="kiwiContent">$(Content)</div>
+<div class="kiwiContent">$(=TOC)"""
+
+DOCUMENT_END = """</div>
 $(References)
 </body>
-</html>""")
+</html>"""
+
+def convertDocument(element):
+	return process(element, DOCUMENT_START + "$(Content)" + DOCUMENT_END)
 
 def element_number( element ):
 	"""Utility function that returns the element number (part of the element
 	offset attributes)"""
+	number = getattr(element, "_offsetNumber", None)
+	if number is not None: return number
 	number = element.getAttributeNS(None, "_number")
 	if number: return int(number)
 	else: return None
 
+def element_offsets( element ):
+	"""Returns the (number, start, end) offsets of the given element, read
+	from the offsets table of the document when it has one (see
+	`core.Parser.parse`), or None when the element has no offsets. Unknown
+	offsets are given as empty strings."""
+	number = element_number(element)
+	if number == None: return None
+	offsets = getattr(element.ownerDocument, "offsets", None)
+	if offsets is not None and getattr(element, "_offsetNumber", None) is not None:
+		start, end = offsets[number]
+		if start is None: start = ""
+		if end is None: end = ""
+		return (number, start, end)
+	return (number, element.getAttributeNS(None, '_start'), element.getAttributeNS(None, '_end'))
+
 def wdiv( element, text ):
 	"""Wraps the given text in a DIV extended with offsets attributes if the
 	given element has offset attributes."""
-	number = element_number(element)
-	if number == None: return text
-	return "<div class='KIWI N%s' ostart='%s' oend='%s'>%s</div>" % (
-		element.getAttributeNS(None, '_number'),
-		element.getAttributeNS(None, '_start'),
-		element.getAttributeNS(None, '_end'),
-		text
-	)
+	offsets = element_offsets(element)
+	if offsets == None: return text
+	return "<div class='KIWI N%s' ostart='%s' oend='%s'>%s</div>" % (offsets + (text,))
 
 def wspan( element, text ):
 	"""Wraps the given text in a SPAN extended with offsets attributes if the
 	given element has offset attributes."""
-	number = element_number(element)
-	if number == None: return text
-	return "<div class='KIWI N%s' ostart='%s' oend='%s'>%s</div>" % (
-		element.getAttributeNS(None, '_number'),
-		element.getAttributeNS(None, '_start'),
-		element.getAttributeNS(None, '_end'),
-		text
-	)
+	offsets = element_offsets(element)
+	if offsets == None: return text
+	return "<div class='KIWI N%s' ostart='%s' oend='%s'>%s</div>" % (offsets + (text,))
 
 def wattrs( element ):
 	"""Returns the offset attributes of this element if it has any."""
-	res = ""
-	number = element_number(element)
-	if number != None:
-		res = " class='KIWI N%s' ostart='%s' oend='%s'" % (
-			element.getAttributeNS(None, '_number'),
-			element.getAttributeNS(None, '_start'),
-			element.getAttributeNS(None, '_end')
-		)
-	return res
+	offsets = element_offsets(element)
+	if offsets == None: return ""
+	return " class='KIWI N%s' ostart='%s' oend='%s'" % offsets
 
 def convertContent( element ):
 	return process(element, wdiv(element, """<div class='content'>$(*)</div>"""))
@@ -143,8 +345,9 @@ def getSectionNumberPrefix(element):
 	for child in parent.childNodes:
 		if child == element:
 			break
+		# The streaming parser counts the dropped sections in a placeholder
 		if child.nodeName in ("Chapter", "Section"):
-			section_count += 1
+			section_count += getattr(child, "_streamedSections", 1)
 	parent_number = getSectionNumberPrefix(parent.parentNode)
 	if parent_number:
 		return "%s.%s" % (parent_number, section_count)
@@ -163,15 +366,27 @@ def formatSectionNumber(number):
 		depth += 1
 	return "".join(res)
 
-def convertSection( element ):
-	offset = element._processor.variables.get("LEVEL") or 0
+SECTION_END = "</div></div>"
+
+def sectionStart( element ):
+	"""Returns the HTML that starts the given section, up to its content (which
+	is closed by `SECTION_END`)."""
+	# We use the module processor rather than the element `_processor`, as
+	# the document may be rendered by other processors in other threads
+	offset = processor.variables.get("LEVEL") or 0
 	level = int(element.getAttributeNS(None, "_depth")) + offset
+	anchor = processor.index.anchor(element)
+	if anchor: anchor = '<a class="anchor" name="%s"></a>' % (anchor)
+	else: anchor = ""
 	return process(element,
 	  '<div class="section" level="%d">' % (level)
-	  + '<h%d class="heading"><span class="number">%s</span>$(Heading)</h%d>' % (level, formatSectionNumber(getSectionNumberPrefix(element)), level)
-	  + '<div class="level%d">$(Content:section)</div></div>' % (level)
+	  + '<h%d class="heading">%s<span class="number">%s</span>$(Heading)</h%d>' % (level, anchor, formatSectionNumber(processor.index.number(element)), level)
+	  + '<div class="level%d">' % (level)
 	)
 
+def convertSection( element ):
+	return sectionStart(element) + process(element, "$(Content:section)") + SECTION_END
+
 def convertReferences( element ):
 	return process(element, """<div class="kiwiReferences">$(Entry)</div>""")
 
@@ -234,7 +449,7 @@ def convertCaption( element ):
 	return process(element, """<caption%s>$(*)</caption>""" % (wattrs(element)))
 
 def convertRow( element ):
-	try: index = element.parentNode.childNodes.index(element) % 2 + 1
+	try: index = processor.indexOf(element) % 2 + 1
 	except: index = 0 
 	classes = ( "", "even", "odd" )
 	return process(element, """<tr class='%s'%s>$(*)</tr>""" % (classes[index], wattrs(element)))
@@ -266,7 +481,7 @@ def stringToTarget( text ):
 def convertlink( element ):
 	if element.getAttributeNS(None, "type") == "ref":
 		return process(element, """<a href="#%s" class="internal">$(*)</a>""" %
-		(stringToTarget(element.getAttributeNS(None, "target"))))
+		(processor.index.resolve(element.getAttributeNS(None, "target"))))
 	else:
 		# TODO: Support title
 		return process(element, """<a href="%s" class="external">$(*)</a>""" %
@@ -71,7 +71,7 @@ def convertDefinitionItem( element ):
 	return process(element, """   $ $(Title) : $(Content)\n""")
 
 def convertRow( element ):
-	try: index = element.parentNode.childNodes.index(element) % 2 + 1
+	try: index = processor.indexOf(element) % 2 + 1
 	except: index = 0 
 	classes = ( "", "even", "odd" )
 	return process(element, """$(*) |\n""")
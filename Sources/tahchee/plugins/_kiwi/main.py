@@ -20,7 +20,12 @@ XML DOM."""
 __version__ = "0.8.6"
 __pychecker__ = "blacklist=cDomlette,cDomlettec"
 
-import re, string, operator, getopt, codecs
+import re, string, operator, getopt, codecs, glob, time, traceback, threading
+
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
 
 # NOTE: I disabled 4Suite support, as minidom is good as it is right now
 # We use 4Suite domlette
@@ -52,9 +57,12 @@ USAGE = u"Kiwi v."+__version__+u""",
    See <http://www.ivy.fr/kiwi>
 
 Usage: kiwi [options] source [destination]
+       kiwi [options] --batch --output-dir=DIR source...
 
    source:
-      The text file to be parsed (usually an .stx file, "-" for stdin)
+      The text file to be parsed (usually an .stx file, "-" for stdin). In
+      batch mode, sources can be globs or "@FILE" where FILE lists one source
+      (or glob) per line.
    destination:
       The optional destination file (otherwise result is dumped on stdout)
 
@@ -65,6 +73,8 @@ Options:
    -t --tab                      The value for tabs (tabs equal N sapces).
                                  Set to 4 by default.
    -f --offsets                  Add offsets information
+   -s --stream                   Parses the source and writes the HTML block
+                                 by block, without loading the whole document
    -p --pretty                   Pretty prints the output XML, this should only
                                  be used for viewing the output.
    -m --html                     Outputs an HTML file corresponding to the Kiwi
@@ -72,8 +82,19 @@ Options:
       --no-style                 Does not include the default CSS in the HTML
       --body-only                Only returns the content of the <body< element
       --level=n                  If n>0, n will transform HTML h1 to h2, etc...
+      --toc=n                    Puts a table of contents listing the sections
+                                 up to depth n before the HTML content
    -O --output-format            Specifies and alternate output FORMAT
                                  (see below)
+   -r --render=FORMAT:DEST       Renders the document in FORMAT (one of the
+                                 formats, or "xml") to DEST. Can be given more
+                                 than once, the source being parsed only once
+      --threads                  Renders each --render format in its own thread
+   -b --batch                    Converts every given source (globs and @LIST
+                                 files are expanded) into the output directory
+   -d --output-dir=DIR           The directory where batch outputs are written
+   -j --jobs=N                   The number of worker processes used in batch
+                                 mode (defaults to the number of CPUs)
 								 
    The available encodings are   %s
    The available formats are     %s
@@ -112,6 +133,44 @@ ENCODINGS = {
 	MACROMAN:MACROMAN, "mac-roman":MACROMAN
 }
 
+# Extensions used for batch outputs
+
+EXTENSIONS = {
+	"html":".html",
+	"lout":".lout",
+	"twiki":".twiki",
+	"xml":".xml"
+}
+
+# The encodings and the default style sheet are looked up once per process, as
+# they do not change between conversions
+
+AVAILABLE_ENCODINGS = None
+DEFAULT_STYLE       = None
+
+def availableEncodings():
+	"""Returns the list of normalised encodings that are supported by this
+	Python installation. The lookup is only done once."""
+	global AVAILABLE_ENCODINGS
+	if AVAILABLE_ENCODINGS is None:
+		AVAILABLE_ENCODINGS = []
+		for encoding in NORMALISED_ENCODINGS:
+			try:
+				codecs.lookup(encoding)
+				AVAILABLE_ENCODINGS.append(encoding)
+			except:
+				pass
+	return AVAILABLE_ENCODINGS
+
+def defaultStyle():
+	"""Returns the content of the default Kiwi CSS file."""
+	global DEFAULT_STYLE
+	if DEFAULT_STYLE is None:
+		css_file = file(os.path.join(os.path.dirname(kiwi2html.__file__), "screen-kiwi.css"))
+		DEFAULT_STYLE = css_file.read()
+		css_file.close()
+	return DEFAULT_STYLE
+
 def run( arguments, input=None, noOutput=False ):
 	"""Returns a couple (STATUS, VALUE), where status is 1 when OK, 0 when
 	informative, and -1 when error, and value is a string.
@@ -125,26 +184,19 @@ def run( arguments, input=None, noOutput=False ):
 
 	# --We extract the arguments
 	try:
-		optlist, args = getopt.getopt(arguments, "hpmfO:vi:o:t:",\
+		optlist, args = getopt.getopt(arguments, "hpmfsO:vi:o:t:r:bd:j:",\
 		["input-encoding=", "output-encoding=", "output-format=",
 		"offsets", "help", "html", "tab=", "version",
 		"pretty", "no-style", "nostyle",
-		"body-only", "bodyonly", "level="])
+		"body-only", "bodyonly", "level=",
+		"batch", "output-dir=", "jobs=", "stream", "render=", "threads", "toc="])
 	except:
 		args=[]
 		optlist = []
 
 	# We get the list of available encodings
-	available_enc = []
-	ENCODINGS_LIST=""
-	for encoding in NORMALISED_ENCODINGS:
-		try:
-			codecs.lookup(encoding)
-			available_enc.append(encoding)
-			ENCODINGS_LIST+=encoding+", "
-		except:
-			pass
-	ENCODINGS_LIST=ENCODINGS_LIST[:-2]+"."
+	available_enc  = availableEncodings()
+	ENCODINGS_LIST = ", ".join(available_enc) + "."
 
 	usage = USAGE % (ENCODINGS_LIST, ", ".join(FORMATS.keys()))
 
@@ -156,9 +208,16 @@ def run( arguments, input=None, noOutput=False ):
 	no_style        = 0
 	body_only       = 0
 	level_offset    = 0
+	toc_depth       = 0
 	input_enc       = ASCII
 	output_enc      = ASCII
 	output_format   = "html"
+	batch_mode      = False
+	stream_mode     = False
+	render_targets  = []
+	render_threads  = False
+	output_dir      = None
+	jobs            = None
 	if LATIN1 in ENCODINGS:
 		input_enc  = LATIN1
 		output_enc = LATIN1
@@ -221,6 +280,61 @@ def run( arguments, input=None, noOutput=False ):
 			show_offsets = True
 		elif opt in ('--level'):
 			level_offset = min(10, max(0, int(arg)))
+		elif opt == '--toc':
+			try:
+				toc_depth = int(arg)
+			except ValueError:
+				toc_depth = 0
+			if toc_depth < 1:
+				return (ERROR, "Kiwi error: Specified table of contents depth (%s) should be superior to 0." % (arg))
+		elif opt in ('-r', '--render'):
+			if arg.find(":") == -1:
+				return (ERROR, "Kiwi error: Expected FORMAT:DESTINATION, got %s" % (arg))
+			format, destination = arg.split(":", 1)
+			format = string.lower(format)
+			if format not in FORMATS.keys() and format != "xml":
+				r  = "Kiwi error: Given format (%s) not supported. Choose one of:\n" % (format)
+				r += "\n  - ".join(FORMATS.keys() + ["xml"])
+				return (ERROR, r)
+			render_targets.append((format, destination))
+		elif opt == '--threads':
+			render_threads = True
+		elif opt in ('-s', '--stream'):
+			stream_mode = True
+		elif opt in ('-b', '--batch'):
+			batch_mode = True
+		elif opt in ('-d', '--output-dir'):
+			output_dir = arg
+		elif opt in ('-j', '--jobs'):
+			try:
+				jobs = int(arg)
+			except ValueError:
+				jobs = 0
+			if jobs < 1:
+				return (ERROR, "Kiwi error: Specified number of jobs (%s) should be superior to 0." % (arg))
+
+	options = {
+		"inputEncoding":input_enc,
+		"outputEncoding":output_enc,
+		"outputFormat":output_format,
+		"offsets":show_offsets,
+		"html":generate_html,
+		"pretty":pretty_print,
+		"noStyle":no_style,
+		"bodyOnly":body_only,
+		"level":level_offset,
+		"toc":toc_depth
+	}
+
+	# In batch mode, every argument is a source
+	if batch_mode:
+		if render_targets:
+			return (ERROR, "Kiwi error: --render cannot be used in batch mode.")
+		if not args:
+			return (INFO, usage.encode("iso-8859-1"))
+		if not output_dir:
+			return (ERROR, "Kiwi error: Batch mode requires an output directory (--output-dir).")
+		return batch(args, output_dir, options, jobs)
 
 	# We check the arguments
 	if input==None and len(args)<1:
@@ -231,6 +345,8 @@ def run( arguments, input=None, noOutput=False ):
 	else: source = None
 	output = None
 	if len(args)>1: output = args[1]
+	if render_targets and (output or stream_mode):
+		return (ERROR, "Kiwi error: --render cannot be used with a destination or --stream.")
 
 	#sys.stderr.write("Kiwi started with input as %s and output as %s.\n"\
 	#% (input_enc, output_enc))
@@ -254,10 +370,24 @@ def run( arguments, input=None, noOutput=False ):
 		except:
 			return (ERROR, "Unable to open input file: %s" % (input))
 
-	if noOutput: pass
+	if noOutput or render_targets: pass
 	elif output==None: ofile = sys.stdout
 	else: ofile = open(output,"w")
 
+	# In stream mode, the HTML is written as the source is read
+	if stream_mode and not noOutput:
+		if not generate_html or output_format != "html" or show_offsets or toc_depth:
+			return (ERROR, "Kiwi error: Streaming is only available for HTML output without offsets nor table of contents.")
+		if source == "-": ifile = codecs.getreader(input_enc)(sys.stdin)
+		variables = {"LEVEL":level_offset}
+		if not no_style:
+			variables["HEADER"] = "\n<style><!-- \n%s --></style>" % (defaultStyle())
+			variables["ENCODING"] = output_enc
+		kiwi2html.processor.generateStream(parser.iterparse(ifile), ofile, body_only, variables, output_enc)
+		if source!="-": ifile.close()
+		if output != None: ofile.close()
+		return (SUCCESS, "")
+
 	try:
 		data = ifile.read()
 	except UnicodeDecodeError, e:
@@ -267,34 +397,242 @@ def run( arguments, input=None, noOutput=False ):
 
 	if source!="-": ifile.close()
 
-	if type(data) != unicode:
-		data = data.decode(input_enc)
-	xml_document = parser.parse(data, offsets=show_offsets)
+	# When rendering to many formats, the document is parsed only once
+	if render_targets:
+		if type(data) != unicode: data = data.decode(input_enc)
+		xml_document = parser.parse(data, offsets=show_offsets)
+		render(xml_document, render_targets, options, render_threads)
+		return (SUCCESS, "")
+
+	result = convert(parser, data, options)
+	if not noOutput: ofile.write(result)
+	return (SUCCESS, result)
 
+def convert( parser, data, options ):
+	"""Parses the given data with the given parser and returns the document
+	rendered according to the given options (as built by `run`), encoded in
+	the output encoding."""
+	if type(data) != unicode:
+		data = data.decode(options["inputEncoding"])
+	xml_document = parser.parse(data, offsets=options["offsets"])
+	if options["html"]: return renderDocument(xml_document, options["outputFormat"], options)
+	else: return renderDocument(xml_document, "xml", options)
+
+def renderDocument( xmlDocument, format, options ):
+	"""Renders the given parsed document in the given format, which is either
+	one of the FORMATS or "xml", and returns the result encoded in the output
+	encoding. The document is not modified, so that it can be rendered to
+	many formats (see `render`)."""
+	output_enc = options["outputEncoding"]
 	result = None
-	if generate_html:
+	if format != "xml":
 		variables = {}
-		variables["LEVEL"] = level_offset
-		css_file = file(os.path.join(os.path.dirname(kiwi2html.__file__), "screen-kiwi.css"))
-		if not no_style:
-			variables["HEADER"] = "\n<style><!-- \n%s --></style>" % (css_file.read())
+		variables["LEVEL"] = options["level"]
+		variables["TOC_DEPTH"] = options.get("toc")
+		if not options["noStyle"]:
+			variables["HEADER"] = "\n<style><!-- \n%s --></style>" % (defaultStyle())
 			variables["ENCODING"] = output_enc
-		css_file.close()
-		result = FORMATS[output_format].processor.generate(xml_document, body_only, variables)
+		result = FORMATS[format].processor.generate(xmlDocument, options["bodyOnly"], variables)
 		if result: result = result.encode(output_enc)
 		else: result = ""
-		if not noOutput: ofile.write(result)
-	elif pretty_print:
+	elif options["pretty"]:
 		#Ft.Xml.Lib.Print.PrettyPrint(xml_document, ofile, output_enc)
 		#MiniDom:
-		result = xml_document.toprettyxml("  ").encode(output_enc)
-		if not noOutput: ofile.write(result)
+		result = xmlDocument.toprettyxml("  ").encode(output_enc)
 	else:
 		#Ft.Xml.Lib.Print.Print(xml_document, ofile, output_enc)
 		#MiniDom:
-		result = xml_document.toxml().encode(output_enc)
-		if not noOutput: ofile.write(result)
-	return (SUCCESS, result)
+		result = xmlDocument.toxml().encode(output_enc)
+	return result
+
+def render( xmlDocument, targets, options, threads=False ):
+	"""Renders the given parsed document once per format given in the
+	`targets` list of (format, destination) couples, and writes each result to
+	its destinations ("-" being stdout). When `threads` is True, each format is
+	rendered in its own thread. Returns a dictionary mapping formats to their
+	rendered text."""
+	formats = []
+	for format, destination in targets:
+		if format not in formats: formats.append(format)
+	results = {}
+	errors  = []
+	def do( format ):
+		try:
+			results[format] = renderDocument(xmlDocument, format, options)
+		except Exception, e:
+			errors.append((format, e, sys.exc_info()[2]))
+	if threads and len(formats) > 1:
+		workers = [threading.Thread(target=do, args=(f,)) for f in formats]
+		for worker in workers: worker.start()
+		for worker in workers: worker.join()
+	else:
+		for format in formats: do(format)
+	if errors:
+		format, e, tb = errors[0]
+		raise e.__class__, e, tb
+	for format, destination in targets:
+		if destination == "-":
+			sys.stdout.write(results[format])
+		else:
+			f = open(destination, "w")
+			f.write(results[format])
+			f.close()
+	return results
+
+#------------------------------------------------------------------------------
+#
+#  Batch conversion
+#
+#------------------------------------------------------------------------------
+
+# Each worker process keeps its parser between files, so that the block and
+# inline parsers are only created once per process.
+WORKER_PARSER    = None
+WORKER_OPTIONS   = None
+WORKER_CONVERTER = None
+
+def expandSources( sources ):
+	"""Expands the given list of sources, where each source is either a path,
+	a glob or "@FILE", FILE being a text file listing one source per line.
+	Returns the list of matching paths, without duplicates."""
+	paths = []
+	seen  = {}
+	def add( source ):
+		matches = glob.glob(source)
+		if not matches: matches = [source]
+		matches.sort()
+		for path in matches:
+			if seen.has_key(path): continue
+			seen[path] = True
+			paths.append(path)
+	for source in sources:
+		if source.startswith("@"):
+			f = file(source[1:], "r")
+			for line in f:
+				line = line.strip()
+				if line and not line.startswith("#"): add(line)
+			f.close()
+		else:
+			add(source)
+	return paths
+
+def batchDestination( source, sourceRoot, outputDir, options ):
+	"""Returns the path of the file that will hold the conversion of the given
+	source, preserving the source location relative to the `sourceRoot`."""
+	if options.get("extension"): extension = options["extension"]
+	elif options["html"]: extension = EXTENSIONS.get(options["outputFormat"], ".html")
+	else: extension = EXTENSIONS["xml"]
+	source = os.path.abspath(source)
+	if sourceRoot and source.startswith(sourceRoot + os.sep):
+		relative = source[len(sourceRoot)+1:]
+	else:
+		relative = os.path.basename(source)
+	return os.path.join(outputDir, os.path.splitext(relative)[0] + extension)
+
+def _initWorker( options, converter=None ):
+	global WORKER_PARSER, WORKER_OPTIONS, WORKER_CONVERTER
+	WORKER_OPTIONS   = options
+	WORKER_CONVERTER = converter
+	if not converter:
+		WORKER_PARSER = core.Parser(os.getcwd(), options["inputEncoding"], options["outputEncoding"])
+
+def _openDestination( destination ):
+	parent = os.path.dirname(destination)
+	if parent and not os.path.exists(parent):
+		try:
+			os.makedirs(parent)
+		except OSError:
+			# Another worker may have created it in the meantime
+			if not os.path.isdir(parent): raise
+	return open(destination, "w")
+
+def _convertFile( task ):
+	"""Converts the given (source, destination) task using the worker parser
+	(or the worker converter, when given to `batch`), returning a (source,
+	destination, status, message, elapsed) tuple. Errors are reported in the
+	result instead of being raised, so that a failing file does not stop the
+	batch."""
+	source, destination = task
+	started = time.time()
+	try:
+		ifile = codecs.open(source, "r", WORKER_OPTIONS["inputEncoding"])
+		try:
+			if WORKER_CONVERTER:
+				ofile = _openDestination(destination)
+				try:
+					WORKER_CONVERTER(ifile, ofile, WORKER_OPTIONS)
+				finally:
+					ofile.close()
+			else:
+				WORKER_PARSER.baseDirectory = os.path.abspath(os.path.dirname(source))
+				result = convert(WORKER_PARSER, ifile.read(), WORKER_OPTIONS)
+				ofile  = _openDestination(destination)
+				ofile.write(result)
+				ofile.close()
+		finally:
+			ifile.close()
+		return (source, destination, SUCCESS, None, time.time() - started)
+	except Exception, e:
+		message = "%s: %s" % (e.__class__.__name__, e)
+		if not isinstance(e, (IOError, OSError, UnicodeError)):
+			message += "\n" + traceback.format_exc()
+		return (source, destination, ERROR, message, time.time() - started)
+
+def batch( sources, outputDir, options, jobs=None, report=None, converter=None ):
+	"""Converts the given sources (see `expandSources`) to files in the given
+	output directory, using `jobs` worker processes (one per CPU by default).
+	Each worker reuses a single parser for all the files it converts.
+
+	Other converters (like `html2kiwi`) can give a module-level `converter`
+	function, which is called with the input file (decoded with the input
+	encoding), the output file and the options for each source.
+
+	Timing and failures are written to `report` (stderr by default) as the
+	files are converted, failures do not interrupt the batch. Returns a
+	(STATUS, VALUE) couple like `run`, where VALUE summarizes the batch."""
+	if report is None: report = sys.stderr
+	started = time.time()
+	paths   = expandSources(sources)
+	if not paths:
+		return (ERROR, "Kiwi error: No source matches %s" % (" ".join(sources)))
+	if len(paths) == 1:
+		root = os.path.abspath(os.path.dirname(paths[0]))
+	else:
+		root = os.path.commonprefix([os.path.abspath(os.path.dirname(p)) + os.sep for p in paths])
+		root = root[:root.rfind(os.sep)]
+	tasks = [(p, batchDestination(p, root, outputDir, options)) for p in paths]
+	if jobs is None:
+		if multiprocessing: jobs = multiprocessing.cpu_count()
+		else: jobs = 1
+	jobs = min(jobs, len(tasks))
+	if jobs > 1 and multiprocessing:
+		pool    = multiprocessing.Pool(jobs, _initWorker, (options, converter))
+		results = pool.imap_unordered(_convertFile, tasks)
+	else:
+		pool    = None
+		_initWorker(options, converter)
+		results = (_convertFile(task) for task in tasks)
+	failures = []
+	try:
+		for source, destination, status, message, elapsed in results:
+			if status == SUCCESS:
+				report.write("%8.3fs  %s -> %s\n" % (elapsed, source, destination))
+			else:
+				failures.append(source)
+				report.write("%8.3fs  FAILED %s\n" % (elapsed, source))
+				for line in message.split("\n"):
+					if line: report.write("           %s\n" % (line))
+	finally:
+		if pool:
+			pool.close()
+			pool.join()
+	summary = "Converted %d of %d file(s) in %.3fs using %d job(s)" % (
+		len(tasks) - len(failures), len(tasks), time.time() - started, max(1, jobs))
+	if failures:
+		return (ERROR, summary + ", %d failed:\n  - %s" % (len(failures), "\n  - ".join(failures)))
+	else:
+		report.write(summary + "\n")
+		return (SUCCESS, summary)
 
 def text2htmlbody( text, inputEncoding=None, outputEncoding=None ):
 	"""Converts the given text to HTML, returning only the body."""
@@ -16,6 +16,9 @@ from formatting import *
 
 RE_EXPRESSION    =re.compile("\$\(([^\)]+)\)")
 
+# The maximum number of compiled template texts kept by a processor
+PLANS_CACHE_SIZE = 1000
+
 __doc__ = """\
 The template module implements a simple way to convert an XML document to another
 format (HTML, text, whatever) by expanding very simple XPath-like expressions. Of
@@ -48,11 +51,22 @@ will be expanded by procesing the set of nodes indicated by the XXX expression.
 
 class Processor:
 	"""The processor is the core of the template engine. You give it a Python
-	module with "convert*" functions, and it will process it."""
+	module with "convert*" functions, and it will process it.
+
+	Template strings are compiled once into an expression plan (see
+	`compile`), and the children of each element are grouped by tag name the
+	first time an expression is resolved on it, so that processing a document
+	costs time proportional to its number of nodes. These caches are reset by
+	`generate`, as they assume that the document is not modified while it is
+	processed."""
 
 	def __init__( self, module=None ):
 		self.expressionTable = {}
 		self.variables       = {}
+		self.plans           = {}
+		self._functions      = {}
+		self._children       = {}
+		self._indexes        = {}
 
 	def register( self, name2functions ):
 		"""Fills the EXPRESSION_TABLE which maps element names to processing
@@ -65,6 +79,7 @@ class Processor:
 		to register a processor for an individual tag.
 		"""
 		self.expressionTable = {}
+		self._functions      = {}
 		for name, function in name2functions.items():
 			if name.startswith("convert"):
 				ename = name[len("convert"):]
@@ -79,24 +94,66 @@ class Processor:
 		element and variant."""
 		if variant: elementName += ":" + variant
 		self.expressionTable[elementName] = function
+		self._functions = {}
+
+	def reset( self ):
+		"""Clears the caches that depend on the processed document. This is
+		done by `generate`, and should be done when the document changes."""
+		self._children = {}
+		self._indexes  = {}
+
+	def children( self, element ):
+		"""Returns a dictionary mapping the tag names of the given element
+		children to the list of the children elements with that name. The "*"
+		key gives all the child nodes (including text nodes)."""
+		buckets = self._children.get(element)
+		if buckets is None:
+			buckets = {"*":element.childNodes}
+			for child in element.childNodes:
+				if child.nodeType == xml.dom.Node.ELEMENT_NODE:
+					bucket = buckets.get(child.tagName)
+					if bucket is None: buckets[child.tagName] = [child]
+					else: bucket.append(child)
+			self._children[element] = buckets
+		return buckets
+
+	def indexOf( self, element ):
+		"""Returns the index of the given element within its parent child
+		nodes."""
+		parent  = element.parentNode
+		indexes = self._indexes.get(parent)
+		if indexes is None:
+			indexes = {}
+			for i, child in enumerate(parent.childNodes): indexes[child] = i
+			self._indexes[parent] = indexes
+		return indexes[element]
 
 	def resolveSet( self, element, names ):
 		"""Resolves the set of names in the given element. When ["Paragraph"] is
 		given, then all child paragraph nodes of the current node will be returned,
 		while ["Section", "Paragraph"] will return all paragraphs for all
 		sections."""
-		s = []
+		s = self.children(element).get(names[0]) or ()
 		if len(names) == 1:
-			name = names[0]
-			for child in element.childNodes:
-				if name != "*" and not child.nodeType == xml.dom.Node.ELEMENT_NODE: continue
-				if name == "*" or child.tagName == name: s.append(child)
+			return s
 		else:
-			name = names[0]
-			for child in element.childNodes:
-				if name != "*" and not child.nodeType == xml.dom.Node.ELEMENT_NODE: continue
-				if name == "*" or child.tagName == name: s.extend(self.resolveSet(child, names[1:]))
-		return s
+			r = []
+			for child in s:
+				if child.nodeType != xml.dom.Node.ELEMENT_NODE: continue
+				r.extend(self.resolveSet(child, names[1:]))
+			return r
+
+	def function( self, name, selector=None ):
+		"""Returns the function registered for the given element name and
+		selector, or None."""
+		key = (name, selector)
+		try:
+			return self._functions[key]
+		except KeyError:
+			if selector: fname = name + ":" + selector
+			else: fname = name
+			func = self._functions[key] = self.expressionTable.get(fname)
+			return func
 
 	def processElement( self, element, selector=None ):
 		"""Processes the given element according to the EXPRESSION_TABLE, using the
@@ -109,14 +166,12 @@ class Processor:
 			return escapeHTML(element.data)
 		elif element.nodeType == xml.dom.Node.ELEMENT_NODE:
 			element._processor = self
-			fname = element.nodeName
-			if selector: fname += ":" + selector
-			func  = self.expressionTable.get(fname)
+			func = self.function(element.nodeName, selector)
 			# There is a function for the element in the EXPRESSION TABLE
 			if func:
 				return func(element)
 			elif selector_optional:
-				self.processElement(element)
+				return self.processElement(element)
 			# Otherwise we simply expand its text
 			else:
 				return self.defaultProcessElement(element, selector)
@@ -127,14 +182,14 @@ class Processor:
 		"""Default function for processing elements. This returns the text."""
 		return "".join([self.processElement(e) for e in element.childNodes])
 
-	def interpret( self, element, expression ):
-		"""Interprets the given expression for the given element"""
-		assert self.expressionTable
+	def compileExpression( self, expression ):
+		"""Compiles the given expression into a (names, selector) couple, where
+		names is the list of element names and selector is None or a string, or
+		into a ("=", VARIABLE) couple for variable expressions."""
 		# =VARIABLE means that we replace the expression by the content of the
 		# variable in the varibales directory
 		if expression.startswith("="):
-			vname = expression[1:].upper()
-			return self.variables.get(vname) or ""
+			return ("=", expression[1:].upper())
 		# Otherwise, the expression is a node selection expression, which may also
 		# have a selector
 		elif expression.rfind(":") != -1:
@@ -143,31 +198,59 @@ class Processor:
 		else:
 			names           = expression
 			selector        = None
-		names = names.split("/")
-		r     = ""
-		for element in self.resolveSet(element, names):
-			r += self.processElement(element, selector)
-		return r
+		return (names.split("/"), selector)
+
+	def interpret( self, element, expression ):
+		"""Interprets the given expression for the given element"""
+		return self.evaluate(element, self.compileExpression(expression))
+
+	def evaluate( self, element, expression ):
+		"""Evaluates the given compiled expression for the given element"""
+		assert self.expressionTable
+		names, selector = expression
+		if names == "=":
+			return self.variables.get(selector) or ""
+		return "".join([self.processElement(e, selector) for e in self.resolveSet(element, names)])
+
+	def compile( self, text ):
+		"""Compiles the given template text into a plan, which is a list of
+		strings (the text between expressions) and compiled expressions (see
+		`compileExpression`). Plans are cached, so that a template text is
+		only compiled once."""
+		plan = self.plans.get(text)
+		if plan is None:
+			plan = []
+			i    = 0
+			while i < len(text):
+				m = RE_EXPRESSION.search(text, i)
+				if not m:
+					plan.append(text[i:])
+					break
+				else:
+					if m.start() > i: plan.append(text[i:m.start()])
+				plan.append(self.compileExpression(m.group(1)))
+				i = m.end()
+			# Template texts often embed element attributes, so we make sure
+			# the cache does not grow indefinitely
+			if len(self.plans) >= PLANS_CACHE_SIZE: self.plans = {}
+			self.plans[text] = plan
+		return plan
 
 	# SYNTAX: $(EXPRESSION)
 	# Where EXPRESSION is a "/" separated list of element names, optionally followed
 	# by a colon ':' and a name
 	def process( self, element, text ):
-		i = 0
-		r = ""
-		while i < len(text):
-			m = RE_EXPRESSION.search(text, i)
-			if not m:
-				r += text[i:]
-				break
+		r = []
+		for step in self.compile(text):
+			if type(step) is tuple:
+				r.append(self.evaluate(element, step))
 			else:
-				r += text[i:m.start()]
-			r+= self.interpret(element, m.group(1))
-			i = m.end()
-		return r
+				r.append(step)
+		return "".join(r)
 
 	def generate( self, xmlDocument, bodyOnly=False, variables={} ):
 		self.variables = variables
+		self.reset()
 		return self.processElement(xmlDocument.childNodes[0])
 
 # EOF
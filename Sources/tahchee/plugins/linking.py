@@ -19,10 +19,41 @@ NAME    = "linking"
 VERSION = None
 SUMMARY = "Useful functions to manage links within a site"
 
+# The number of links (and of paths components) remembered by the plugin
+LINKS_CACHE_SIZE = 10000
+
+class Memo:
+	"""A bounded dictionary that keeps the most recently used entries. Once it
+	holds `size` entries, the entries that were not used since the previous
+	time it was full are dropped."""
+
+	def __init__( self, size ):
+		self.size     = size
+		self._recent  = {}
+		self._older   = {}
+
+	def get( self, key ):
+		value = self._recent.get(key)
+		if value is None:
+			value = self._older.get(key)
+			if value is not None: self.set(key, value)
+		return value
+
+	def set( self, key, value ):
+		if len(self._recent) >= self.size:
+			self._older  = self._recent
+			self._recent = {}
+		self._recent[key] = value
+
 class LinkingPlugin:
 
 	def __init__( self, site ):
-		self.site = site
+		self.site        = site
+		self._links      = Memo(LINKS_CACHE_SIZE)
+		self._components = Memo(LINKS_CACHE_SIZE)
+		# The directories of the site pages, and their breadcrumbs
+		self._directories = None
+		self._breadcrumbs = {}
 
 	def name( self ): return NAME
 	def summary( self ): return SUMMARY
@@ -32,38 +63,79 @@ class LinkingPlugin:
 	def install( self, localdict ):
 		localdict["linking"] = self
 
+	def reset( self ):
+		"""Forgets the directories and the breadcrumbs of the previous build,
+		as pages may have been added or removed since then."""
+		self._directories = None
+		self._breadcrumbs = {}
+
 	def hierarchy( self, pagePath ):
 		"""Creates an HTML string that contains the clickable path from the
 		website root to the current page. This can be placed in a navigation
-		bar."""
-
-		parents  = (pagePath.split("/"))
-		page     = parents[-1]
-		parents  = parents[:-1]
-
-		# The first element is the site root
-		res = "<a href='%s'>%s</a> / " %\
-		( self.link(pagePath, "/index.html"), self.name())
-		path = ""
-
-		# Now we add links for the parents
-		for path_index in range(0, len(parents)):
-			path += parents[path_index] + "/"
-			res += "<a href='%s'>%s</a> / " % (
-				self.link(pagePath,
-				path+"/index.html"),
-				parents[path_index]
-			)
-
-		# We add the last link ofr the file
+		bar.
+
+		The breadcrumb of each directory is only rendered once (see
+		`breadcrumb`), so that pages of the same directory only add the link
+		to themselves."""
+		dirs, page = self._pathComponents(pagePath)
+		res   = self.breadcrumb(dirs)
+		# We add the last link for the file
 		radix = os.path.splitext(page)[0]
-		if radix!="index":
-			return res+"<a href='%s'>%s</a> " % (
-				self.link(pagePath, radix), radix
-			)
+		if radix and not self._isIndex(page):
+			return res + " / <a href='%s'>%s</a> " % (page, radix)
 		else:
-			# We get rid of the trailing " / "
-			return res[:-3]
+			return res
+
+	def directories( self ):
+		"""Returns a dictionary that maps the directories of the site pages
+		(as tuples of path components, the pages directory being the empty
+		tuple) to the name of their index, or None if they have no index. The
+		directories are the ones of the pages walk of the build (see
+		`Catalog.walk`), so that ignored directories are left out."""
+		if self._directories is not None: return self._directories
+		self._directories = {}
+		pages = os.path.abspath(self.site.pages())
+		for path, st in self.site.catalog.walk():
+			path = self._normalize(path[len(pages)+1:]).split("/")
+			name = self.site.isTemplate(path[-1]) or path[-1]
+			path = tuple(path[:-1])
+			for i in range(0, len(path) + 1):
+				self._directories.setdefault(path[:i], None)
+			index = self._directories[path]
+			if self._isIndex(name) and (index is None or name < index):
+				self._directories[path] = name
+		return self._directories
+
+	def _isIndex( self, name ):
+		"""Tells if the given file name is an index for the site, files named
+		'index' being always considered as indexes."""
+		return self.site.isDirectoryIndex(name)
+
+	def breadcrumb( self, dirs ):
+		"""Returns the HTML links from the website root to the directory with
+		the given components (see `directories`). The links are relative to
+		the directory, so the breadcrumb is rendered once per directory and
+		shared by all its pages. Directories without an index are not
+		linked."""
+		res = self._breadcrumbs.get(dirs)
+		if res is None:
+			directories = self.directories()
+			res = []
+			for i in range(0, len(dirs) + 1):
+				if i == 0: name = self.site.name()
+				else: name = dirs[i-1]
+				# When the pages were not walked, we assume there are indexes
+				if directories: index = directories.get(dirs[:i])
+				else: index = "index.html"
+				if index is None:
+					res.append(name)
+				else:
+					res.append("<a href='%s'>%s</a>" % (
+						self._relativeLink(dirs, dirs[:i], index), name
+					))
+			res = " / ".join(res)
+			self._breadcrumbs[dirs] = res
+		return res
 
 	def _normalize( self, path ):
 		"""Normalizes the given path, fixing some issues with Windows \\ in
@@ -83,48 +155,72 @@ class LinkingPlugin:
 	def a( self, target, content ):
 		return "<a href='%s'>%s</a>" % (target, content)
 
+	def _pathComponents( self, path ):
+		"""Returns a (dirs, file) couple for the given path, where dirs is the
+		tuple of directories of the absolute path (see `_abspath`)."""
+		components = self._components.get(path)
+		if components is None:
+			# Now, all paths are of the form
+			# - '/'
+			# - '/FILE' or '/DIR'
+			# - '/DIR/FILE' or '/DIR/DIR'
+			# - ...
+			elements   = self._abspath(path).split("/")[1:]
+			components = (tuple(elements[:-1]), elements[-1])
+			self._components.set(path, components)
+		return components
+
+	def _relativeLink( self, fromDirs, toDirs, toFile ):
+		# If there is no "to_file", we force the "/"
+		if not toFile: toFile = "/"
+		# Both paths have the same directories in common
+		if fromDirs == toDirs:
+			return toFile
+		common = 0
+		for c in range(0, min(len(fromDirs), len(toDirs))):
+			if fromDirs[c] != toDirs[c]:
+				break
+			common = c + 1
+		prefix = "../" * (len(fromDirs) - common) + "/".join(toDirs[common:])
+		if prefix and not prefix[-1] == "/": prefix += "/"
+		return prefix + toFile
+
 	def link( self, fromPath, toPath, checkLink=True ):
 		"""Creates a relative or absolute link (if the site is in local mode,
 		then the link is relative, otherwise it is absolute) from the given path
-		to the other path. The 'fromPath' is RELATIVE TO THE PAGES DIRECTORY."""
+		to the other path. The 'fromPath' is RELATIVE TO THE PAGES DIRECTORY.
+
+		Links to fingerprinted resources (see the FINGERPRINT option) point to
+		their fingerprinted name.
+
+		Links are memoized, as templates usually create the same links for
+		every page."""
 		# WE SHOULD ASSERT THAT FROM PATH IS A FILE, OR IF IT IS A DIRECTORY, IT
 		# MUST END WITH /
-		fromPath = self._abspath(fromPath)
-		toPath   = self._abspath(toPath)
-		# Now, all paths are of the form
-		# - '/'
-		# - '/FILE' or '/DIR'
-		# - '/DIR/FILE' or '/DIR/DIR'
-		# - ...
-		from_el   = fromPath.split("/")[1:]
-		to_el     = toPath.split("/")[1:]
-		from_dirs = len(from_el) > 1 and from_el[:-1] or []
-		to_dirs   = len(to_el) > 1 and to_el[:-1] or []
-		from_file = from_el[-1]
-		to_file   = to_el[-1]
-		common    = -1
-		for c in range(0, min(len(from_dirs), len(to_dirs))):
-			if from_dirs[c] != to_dirs[c]:
-				break
-			common = c
-		# If there is no "to_file", we force the "/"
-		if not to_file: to_file = "/"
-		res = None
-		# Both paths have the same directories in common
-		if from_dirs == to_dirs:
-			res = to_file
-		else:
-			prefix  = ""
-			if common == -1:
-				prefix += "../" * (len(from_dirs))
-				prefix += "/".join(to_dirs)
-			else:
-				common += 1
-				prefix += "../" * (len(from_dirs[common:]))
-				if common < len(to_dirs):
-					prefix +=  "/".join(to_dirs[common:])
-			if prefix and not prefix[-1] == "/": prefix += "/"
-			res = prefix + to_file
+		toPath = self.site.fingerprints.get(toPath)
+		key = (fromPath, toPath)
+		res = self._links.get(key)
+		if res is None:
+			from_dirs, _     = self._pathComponents(fromPath)
+			to_dirs, to_file = self._pathComponents(toPath)
+			res = self._relativeLink(from_dirs, to_dirs, to_file)
+			self._links.set(key, res)
+		return res
+
+	def links( self, fromPath, toPaths, checkLink=True ):
+		"""Returns the list of links (see `link`) from the given path to each of
+		the given paths."""
+		from_dirs, _ = self._pathComponents(fromPath)
+		res = []
+		for to_path in toPaths:
+			to_path = self.site.fingerprints.get(to_path)
+			key  = (fromPath, to_path)
+			link = self._links.get(key)
+			if link is None:
+				to_dirs, to_file = self._pathComponents(to_path)
+				link = self._relativeLink(from_dirs, to_dirs, to_file)
+				self._links.set(key, link)
+			res.append(link)
 		return res
 
 # EOF
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# Encoding: ISO-8859-1
+# -----------------------------------------------------------------------------
+# Project           :   Tahchee                     <http://www.ivy.fr/tahchee>
+# -----------------------------------------------------------------------------
+# Author            :   Sebastien Pierre                     <sebastien@ivy.fr>
+# License           :   Revised BSD License
+# -----------------------------------------------------------------------------
+# Creation date     :   19-Oct-2026
+# Last mod.         :   19-Oct-2026
+# -----------------------------------------------------------------------------
+
+import os, posixpath, pickle
+
+try:
+	from hashlib import sha1 as hashfunc
+except ImportError,e:
+	import sha as hashfunc
+
+__doc__ = """\
+Splits the build of a site into shards, which can run on different machines
+(like the runners of a continuous integration service), and merges their
+results. Shards are given as `INDEX/COUNT`, where the index starts at 1:
+
+>   python build.py remote --shard 1/3     (on the first machine)
+>   python build.py remote --shard 2/3     (on the second machine)
+>   python build.py remote --shard 3/3     (on the third machine)
+>   python build.py remote --merge 3       (once the shards are gathered)
+
+Each file of the pages directory is built by exactly one shard, which is
+found by hashing a key that only depends on the file: pages are grouped by
+the template they extend and by their directory, so that pages that share
+their templates are built together, and the other files are hashed by path.
+Groups that are larger than half a shard are split in chunks, so that shards
+stay balanced. As the partition does not depend on the machine, every shard
+agrees on it without communicating.
+
+Each shard writes the files it built in the site output, the list of these
+files in a partial manifest (like `Site/Remote.manifest.1-3`) and the changes
+it made to the build state in a checksums delta (`site.checksums.1-3`). Once
+the `Site` directories and deltas of the shards are gathered in one site
+directory, the merge applies the deltas to `site.checksums`, combines the
+partial manifests in the site manifest, and runs the steps that need the
+whole site (bundles, sitemap, removal of the orphans, compression and link
+checking)."""
+
+def parse( text ):
+	"""Parses the given `INDEX/COUNT` shard specification, returning an
+	(index, count) couple, or raising a ValueError."""
+	try:
+		index, count = map(int, text.split("/"))
+	except ValueError:
+		raise ValueError("Shard must be given as INDEX/COUNT: " + text)
+	if count < 1 or index < 1 or index > count:
+		raise ValueError("Shard index must be between 1 and %d: %s" % (max(count, 1), text))
+	return index, count
+
+def suffix( index, count ):
+	"""Returns the suffix of the partial manifests and checksums delta of the
+	given shard."""
+	return ".%d-%d" % (index, count)
+
+def assign( key, count ):
+	"""Returns the index of the shard of the given key."""
+	return int(hashfunc(key).hexdigest()[:8], 16) % count + 1
+
+def extends( path ):
+	"""Returns the name of the template extended by the page template at the
+	given path, as given by its `#extends` directive, or None."""
+	fd = open(path, "r")
+	try:
+		for line in fd:
+			line = line.strip()
+			if line.startswith("#extends"): return line[len("#extends"):].strip()
+			if line and not line.startswith("##"): break
+	finally:
+		fd.close()
+	return None
+
+def partition( pages, resources, count ):
+	"""Returns a dictionary that maps the given paths (relative to the pages
+	directory, with '/' as separator) to the index of their shard. The pages
+	are given as (path, extended template) couples, and the resources as a
+	list of paths."""
+	res    = {}
+	groups = {}
+	for path, template in pages:
+		key = "%s|%s" % (template or "", posixpath.dirname(path))
+		groups.setdefault(key, []).append(path)
+	limit = max(1, len(pages) / (2 * count))
+	for key, paths in groups.items():
+		paths.sort()
+		for i in range(0, len(paths), limit):
+			index = assign("%s|%d" % (key, i / limit), count)
+			for path in paths[i:i+limit]: res[path] = index
+	for path in resources:
+		res[path] = assign(path, count)
+	return res
+
+#------------------------------------------------------------------------------
+#
+#  Checksums deltas
+#
+#------------------------------------------------------------------------------
+
+def flatten( data, prefix=(), res=None ):
+	"""Returns a dictionary that maps the keys of the leaves of the given
+	nested dictionaries (as tuples) to their values."""
+	if res is None: res = {}
+	for key, value in data.items():
+		if type(value) is dict and value:
+			flatten(value, prefix + (key,), res)
+		else:
+			res[prefix + (key,)] = value
+	return res
+
+def delta( previous, current ):
+	"""Returns the (updated, removed) couple of changes between the given
+	flattened dictionaries (see `flatten`), where updated maps the leaves that
+	are new or changed to their value, and removed lists the removed
+	leaves."""
+	updated = {}
+	for key, value in current.items():
+		if not previous.has_key(key) or previous[key] != value: updated[key] = value
+	# Empty dictionaries that were filled are not removed
+	parents = {}
+	for key in current.keys():
+		for i in range(1, len(key)): parents[key[:i]] = True
+	removed = filter(lambda k:not current.has_key(k) and not parents.has_key(k), previous.keys())
+	return updated, removed
+
+def apply( data, changes ):
+	"""Applies the given (updated, removed) changes (see `delta`) to the given
+	nested dictionaries."""
+	updated, removed = changes
+	for key in removed:
+		parent = data
+		for name in key[:-1]:
+			parent = parent.get(name)
+			if type(parent) is not dict: break
+		else:
+			if parent.has_key(key[-1]): del parent[key[-1]]
+	for key, value in updated.items():
+		parent = data
+		for name in key[:-1]:
+			if type(parent.get(name)) is not dict: parent[name] = {}
+			parent = parent[name]
+		# Dictionaries that were emptied keep the leaves of the other deltas
+		if value == {} and type(parent.get(key[-1])) is dict: continue
+		parent[key[-1]] = value
+	return data
+
+def relocate( changes, signatures, root, newRoot ):
+	"""Returns the given changes made by a shard that was built in the given
+	root directory, for a site in the given new root: the checksums are kept
+	by site signature and by absolute path, so the given signatures map the
+	signatures of the shard to the ones of the new site, and the paths within
+	the root are moved to the new root."""
+	def relocateKey( key ):
+		res = []
+		for name in key:
+			if type(name) is str:
+				prefix = name.split(":", 1)
+				if signatures.has_key(prefix[0]):
+					name = ":".join([signatures[prefix[0]]] + prefix[1:])
+				elif root != newRoot and name.startswith(root + os.sep):
+					name = newRoot + name[len(root):]
+			res.append(name)
+		return tuple(res)
+	updated, removed = changes
+	res = {}
+	for key, value in updated.items(): res[relocateKey(key)] = value
+	return res, map(relocateKey, removed)
+
+def save( path, changes, root, signatures ):
+	"""Saves the given changes (see `delta`) made by a shard that was built in
+	the given root directory, where signatures maps the signature of the site
+	in each of the built modes to the mode."""
+	fd = open(path, "wb")
+	try:
+		pickle.dump({"root":root, "signatures":signatures, "changes":changes},
+		fd, pickle.HIGHEST_PROTOCOL)
+	finally:
+		fd.close()
+
+def load( path ):
+	"""Loads the checksums delta saved at the given path (see `save`),
+	returning a dictionary with its root, signatures and changes."""
+	fd = open(path, "rb")
+	try:
+		return pickle.load(fd)
+	finally:
+		fd.close()
+
+# EOF - vim: tw=80 ts=4 sw=4 noet
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# Encoding: ISO-8859-1
+# -----------------------------------------------------------------------------
+# Project           :   Tahchee                     <http://www.ivy.fr/tahchee>
+# -----------------------------------------------------------------------------
+# Author            :   Sebastien Pierre                     <sebastien@ivy.fr>
+# License           :   Revised BSD License
+# -----------------------------------------------------------------------------
+# Creation date     :   19-Oct-2026
+# Last mod.         :   19-Oct-2026
+# -----------------------------------------------------------------------------
+
+import os, time
+from xml.sax.saxutils import escape
+from email.Utils import formatdate
+
+try:
+	from hashlib import sha1 as hashfunc
+except ImportError,e:
+	import sha as hashfunc
+
+__doc__ = """\
+Maintains the `sitemap.xml` and the Atom and RSS feeds of a generated website.
+The sitemap and feeds are written from a record of each page (its URL, last
+modification time and title) that is kept with the build state: records are
+only updated for the pages that were generated, and the files are only
+written again when their content changed.
+
+Sitemaps of more than `SITEMAP_SIZE` URLs are split into `sitemap-N.xml`
+files, listed by a `sitemap.xml` index."""
+
+# The maximum number of URLs in a sitemap file (see <http://sitemaps.org>)
+SITEMAP_SIZE = 50000
+# The default number of entries in the feeds
+FEED_SIZE    = 20
+# The extensions of the pages that are listed in the sitemap and feeds
+PAGE_EXTENSIONS = (".html", ".htm")
+# The encoding of the page titles
+ENCODING     = "iso-8859-1"
+
+SITEMAP_FILE = "sitemap.xml"
+SITEMAP_PART = "sitemap-%d.xml"
+ATOM_FILE    = "atom.xml"
+RSS_FILE     = "rss.xml"
+
+def isPage( path ):
+	"""Tells if the page with the given path goes into the sitemap."""
+	return os.path.splitext(path)[1].lower() in PAGE_EXTENSIONS
+
+def w3cdate( mtime ):
+	return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(mtime))
+
+#------------------------------------------------------------------------------
+#
+#  Sitemap
+#
+#------------------------------------------------------------------------------
+
+class Sitemap:
+	"""Writes the sitemap and feeds of the given site from the page records
+	held in the given state dictionary (see `SiteBuilder.state`)."""
+
+	def __init__( self, site, state ):
+		self.site  = site
+		self.state = state
+		# Maps the path of the pages to (url, mtime, title) records
+		self.pages = state.setdefault("pages", {})
+		# Maps the files written in the site output to their digest
+		self.files = state.setdefault("files", {})
+		self.dirty = False
+
+	def update( self, path, url, mtime, title ):
+		"""Updates the record for the page with the given path (relative to
+		the site output)."""
+		if not isPage(path): return
+		record = (url, mtime, title)
+		if self.pages.get(path) != record:
+			self.pages[path] = record
+			self.dirty = True
+
+	def remove( self, path ):
+		if self.pages.has_key(path):
+			del self.pages[path]
+			self.dirty = True
+
+	def prune( self, paths ):
+		"""Removes the records of the pages that are not in the given paths."""
+		for path in self.pages.keys():
+			if not paths.has_key(path): self.remove(path)
+
+	def write( self, sitemap=True, feed=None, feedSize=FEED_SIZE ):
+		"""Writes the sitemap (if sitemap is True) and the feeds (if feed is
+		not None, feed being True or the directory whose pages are listed) in
+		the site output. Nothing is done if the records did not change since
+		the last time and the files still exist. Returns the list of files
+		that were written."""
+		output = self.site.output()
+		config = (sitemap, feed, feedSize)
+		if not self.dirty and self.state.get("config") == config and \
+		filter(lambda n:not os.path.exists(os.path.join(output, n)), self.files) == []:
+			return []
+		files = {}
+		if sitemap:
+			files.update(self.sitemapFiles())
+		if feed is not None and feed is not False:
+			files.update(self.feedFiles(feed, feedSize))
+		written = []
+		for name, content in files.items():
+			path   = os.path.join(output, name)
+			digest = hashfunc(content).hexdigest()
+			if self.files.get(name) == digest and os.path.exists(path): continue
+			fd = open(path, "wb")
+			fd.write(content)
+			fd.close()
+			self.files[name] = digest
+			written.append(name)
+		# We remove the files that we do not write anymore (like sitemap parts)
+		for name in self.files.keys():
+			if files.has_key(name): continue
+			path = os.path.join(output, name)
+			if os.path.exists(path): os.unlink(path)
+			del self.files[name]
+		self.dirty = False
+		self.state["config"] = config
+		written.sort()
+		return written
+
+	def sitemapFiles( self ):
+		"""Returns a dictionary mapping the sitemap file names to their
+		content."""
+		paths = self.pages.keys()
+		paths.sort()
+		if len(paths) <= SITEMAP_SIZE:
+			return {SITEMAP_FILE:self._urlset(paths)}
+		res   = {}
+		index = []
+		for i in range(0, len(paths), SITEMAP_SIZE):
+			part  = paths[i:i+SITEMAP_SIZE]
+			name  = SITEMAP_PART % (i / SITEMAP_SIZE + 1)
+			mtime = max(map(lambda p:self.pages[p][1], part))
+			res[name] = self._urlset(part)
+			index.append("<sitemap><loc>%s/%s</loc><lastmod>%s</lastmod></sitemap>\n" % (
+				escape(self.site.url()), name, w3cdate(mtime)
+			))
+		res[SITEMAP_FILE] = '<?xml version="1.0" encoding="%s"?>\n' % (ENCODING) + \
+		'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n' + \
+		"".join(index) + "</sitemapindex>\n"
+		return res
+
+	def _urlset( self, paths ):
+		res = ['<?xml version="1.0" encoding="%s"?>\n' % (ENCODING),
+		'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+		for path in paths:
+			url, mtime, title = self.pages[path]
+			res.append("<url><loc>%s</loc><lastmod>%s</lastmod></url>\n" % (
+				escape(url), w3cdate(mtime)
+			))
+		res.append("</urlset>\n")
+		return "".join(res)
+
+	def entries( self, feed=True, feedSize=FEED_SIZE ):
+		"""Returns the (url, mtime, title) records of the most recent pages in
+		the given feed directory (or of all the pages if feed is True)."""
+		if feed is True or not feed: prefix = ""
+		else: prefix = feed.strip("/") + "/"
+		res = []
+		for path, record in self.pages.items():
+			if path.startswith(prefix): res.append(record)
+		res.sort(lambda a,b:cmp(b[1], a[1]) or cmp(a[0], b[0]))
+		return res[:feedSize]
+
+	def feedFiles( self, feed=True, feedSize=FEED_SIZE ):
+		"""Returns a dictionary mapping the Atom and RSS feed file names to
+		their content."""
+		entries = self.entries(feed, feedSize)
+		url     = escape(self.site.url())
+		name    = escape(self.site.name() or "")
+		if entries: updated = entries[0][1]
+		else: updated = 0
+		atom = ['<?xml version="1.0" encoding="%s"?>\n' % (ENCODING),
+		'<feed xmlns="http://www.w3.org/2005/Atom">\n',
+		"<title>%s</title>\n" % (name),
+		"<link href=\"%s/\"/>\n" % (url),
+		"<link rel=\"self\" href=\"%s/%s\"/>\n" % (url, ATOM_FILE),
+		"<id>%s/</id>\n" % (url),
+		"<author><name>%s</name></author>\n" % (name),
+		"<updated>%s</updated>\n" % (w3cdate(updated))]
+		rss  = ['<?xml version="1.0" encoding="%s"?>\n' % (ENCODING),
+		'<rss version="2.0"><channel>\n',
+		"<title>%s</title>\n" % (name),
+		"<link>%s/</link>\n" % (url),
+		"<description>%s</description>\n" % (name),
+		"<lastBuildDate>%s</lastBuildDate>\n" % (formatdate(updated, usegmt=True))]
+		for page_url, mtime, title in entries:
+			page_url = escape(page_url)
+			title    = escape(title or "")
+			atom.append("<entry><title>%s</title><link href=\"%s\"/><id>%s</id><updated>%s</updated></entry>\n" % (
+				title, page_url, page_url, w3cdate(mtime)
+			))
+			rss.append("<item><title>%s</title><link>%s</link><guid>%s</guid><pubDate>%s</pubDate></item>\n" % (
+				title, page_url, page_url, formatdate(mtime, usegmt=True)
+			))
+		atom.append("</feed>\n")
+		rss.append("</channel></rss>\n")
+		return {ATOM_FILE:"".join(atom), RSS_FILE:"".join(rss)}
+
+# EOF - vim: tw=80 ts=4 sw=4 noet
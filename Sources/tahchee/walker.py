@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# Encoding: ISO-8859-1
+# -----------------------------------------------------------------------------
+# Project           :   Tahchee                     <http://www.ivy.fr/tahchee>
+# -----------------------------------------------------------------------------
+# Author            :   Sebastien Pierre                     <sebastien@ivy.fr>
+# License           :   Revised BSD License
+# -----------------------------------------------------------------------------
+# Creation date     :   19-Oct-2026
+# Last mod.         :   19-Oct-2026
+# -----------------------------------------------------------------------------
+
+import os, stat
+
+# The scandir function is part of Python 3.5+, and is available as the
+# 'scandir' module for older versions
+try:
+	from os import scandir
+except ImportError:
+	try:
+		from scandir import scandir
+	except ImportError:
+		scandir = None
+
+try:
+	from multiprocessing.pool import ThreadPool
+except ImportError:
+	ThreadPool = None
+
+__doc__ = """\
+Walks a directory tree, giving the stat of each file that was found. When
+`scandir` is available, the stat comes from the directory entry, otherwise
+each directory entry is stat'ed once. Either way, the builder does not need to
+stat the files again.
+
+Directories of the same depth can be scanned by a pool of threads, which makes
+a difference on network filesystems, where each request is slow."""
+
+def scanDirectory( path ):
+	"""Returns a (files, directories) couple for the given directory, where
+	files is a list of (path, stat) couples and directories a list of paths,
+	both sorted by name. Symbolic links to directories are not listed (they
+	are not walked by `os.walk` either), and unreadable directories are
+	empty."""
+	files = []
+	dirs  = []
+	try:
+		if scandir:
+			entries = list(scandir(path))
+			entries.sort(lambda a,b:cmp(a.name, b.name))
+			for entry in entries:
+				if entry.is_dir(follow_symlinks=False):
+					dirs.append(entry.path)
+				elif entry.is_file():
+					files.append((entry.path, entry.stat()))
+		else:
+			names = os.listdir(path)
+			names.sort()
+			for name in names:
+				child = os.path.join(path, name)
+				st    = os.lstat(child)
+				if stat.S_ISLNK(st.st_mode):
+					try:
+						st = os.stat(child)
+					except OSError:
+						continue
+					if stat.S_ISDIR(st.st_mode): continue
+				if stat.S_ISDIR(st.st_mode):
+					dirs.append(child)
+				elif stat.S_ISREG(st.st_mode):
+					files.append((child, st))
+	except OSError:
+		pass
+	return files, dirs
+
+class Walker:
+	"""Walks directory trees, skipping the directories whose name is ignored
+	(see `Site.isIgnored`), using the given number of threads."""
+
+	def __init__( self, isIgnored=None, threads=1 ):
+		self.isIgnored = isIgnored
+		self.threads   = threads or 1
+
+	def walk( self, root ):
+		"""Returns the list of (path, stat) couples for the files of the given
+		directory and its subdirectories. Files are listed by depth, then by
+		directory and by name."""
+		res   = []
+		level = [root]
+		pool  = None
+		if ThreadPool and self.threads > 1: pool = ThreadPool(self.threads)
+		try:
+			while level:
+				if pool and len(level) > 1: scans = pool.map(scanDirectory, level)
+				else: scans = map(scanDirectory, level)
+				level = []
+				for files, dirs in scans:
+					res.extend(files)
+					if self.isIgnored:
+						dirs = filter(lambda d:not self.isIgnored(os.path.basename(d)), dirs)
+					level.extend(dirs)
+		finally:
+			if pool:
+				pool.close()
+				pool.join()
+		return res
+
+# EOF - vim: tw=80 ts=4 sw=4 noet
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from tahchee.main import hasHash, newHash, hashFile
+from tahchee import walker
+
+__doc__ = """\
+Compares the throughput of the hash algorithms available for the 'signature'
+change detection method, on the files of the given directory (the
+documentation by default):
+
+    python B001-Digests.py [DIRECTORY] [ROUNDS]"""
+
+ALGORITHMS = ("sha1", "blake2b", "xxh3")
+
+def benchmark( algorithm, paths, rounds=1 ):
+	"""Hashes the given files the given number of times, returning the
+	duration of the fastest round."""
+	res = None
+	for i in range(rounds):
+		start = time.time()
+		for path in paths: hashFile(path, algorithm)
+		duration = time.time() - start
+		if res is None or duration < res: res = duration
+	return res
+
+if __name__ == "__main__":
+	root   = os.path.dirname(os.path.abspath(__file__)) + "/../Documentation"
+	rounds = 3
+	if len(sys.argv) > 1: root   = sys.argv[1]
+	if len(sys.argv) > 2: rounds = int(sys.argv[2])
+	files = walker.Walker(lambda d:d.startswith(".")).walk(os.path.abspath(root))
+	paths = map(lambda f:f[0], files)
+	size  = sum(map(lambda f:f[1].st_size, files))
+	print "Hashing %d files (%0.1fMb), %d rounds" % (len(paths), size / 1048576.0, rounds)
+	for algorithm in ALGORITHMS:
+		if not hasHash(algorithm):
+			print "%-8s not available" % (algorithm)
+			continue
+		# The chunked digest is the same as the digest of the whole file
+		if paths:
+			f = open(paths[0], "rb") ; h = newHash(algorithm) ; h.update(f.read()) ; f.close()
+			assert hashFile(paths[0], algorithm) == h.hexdigest()
+		duration = benchmark(algorithm, paths, rounds)
+		print "%-8s %8.3fs %10.1fMb/s" % (algorithm, duration, size / 1048576.0 / max(duration, 0.000001))
+	print "OK"
+
+# EOF
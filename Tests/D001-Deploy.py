@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil, threading, StringIO
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+import TahcheeTest
+from TahcheeTest import write, read, create
+from tahchee import deploy
+
+__doc__ = """Ensures that deployments only upload the changed files and remove the
+removed ones, using a directory and local stand-ins for SFTP and S3."""
+
+def build( root ):
+	return TahcheeTest.build(root).site
+
+class FakeSFTP:
+	"""Stands for a `paramiko.SFTPClient`, storing the files in a directory."""
+
+	def __init__( self, root, clients ):
+		self.root = root
+		clients.append(self)
+		self.closed = False
+
+	def _path( self, path ):
+		return self.root + path
+
+	def stat( self, path ):
+		if not os.path.exists(self._path(path)): raise IOError(path)
+
+	def mkdir( self, path ):
+		try:
+			os.mkdir(self._path(path))
+		except OSError:
+			raise IOError(path)
+
+	def put( self, source, path ):
+		shutil.copyfile(source, self._path(path))
+
+	def remove( self, path ):
+		if not os.path.exists(self._path(path)): raise IOError(path)
+		os.unlink(self._path(path))
+
+	def open( self, path, mode="rb" ):
+		if mode.startswith("r") and not os.path.exists(self._path(path)): raise IOError(path)
+		return open(self._path(path), mode)
+
+	def close( self ):
+		self.closed = True
+
+class NoSuchKey(Exception):
+	response = {"Error":{"Code":"NoSuchKey"}}
+
+class FakeS3:
+	"""Stands for a `boto3` S3 client, storing the objects in a dictionary."""
+
+	def __init__( self, objects ):
+		self.objects = objects
+
+	def put_object( self, Bucket, Key, Body, ContentType ):
+		if hasattr(Body, "read"): Body = Body.read()
+		self.objects[(Bucket, Key)] = (Body, ContentType)
+
+	def get_object( self, Bucket, Key ):
+		if not self.objects.has_key((Bucket, Key)): raise NoSuchKey(Key)
+		class Body:
+			def __init__( self, data ): self.data = data
+			def read( self ): return self.data
+		return {"Body":Body(self.objects[(Bucket, Key)][0])}
+
+	def delete_object( self, Bucket, Key ):
+		if self.objects.has_key((Bucket, Key)): del self.objects[(Bucket, Key)]
+
+def deployAll( output, backends ):
+	"""Deploys with each given backend, returning the uploaded and removed files,
+	which must be the same for every backend."""
+	res = None
+	for backend in backends:
+		uploaded, removed, errors = deploy.Deployer(output, output + ".manifest", backend, 4).deploy()
+		assert not errors, errors
+		uploaded.sort()
+		removed.sort()
+		assert res is None or res == (uploaded, removed), (res, uploaded, removed)
+		res = (uploaded, removed)
+	return res
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	create(root)
+	for path in ("Target", "SFTP/www"):
+		os.makedirs(os.path.join(root, path))
+	pages  = os.path.join(root, "Pages")
+	output = os.path.join(root, "Site", "Local")
+	target = os.path.join(root, "Target")
+	write(os.path.join(pages, "index.html.tmpl"), "Index")
+	write(os.path.join(pages, "docs/about.html.tmpl"), "About")
+	write(os.path.join(pages, "docs/images/logo.png"), "PNG")
+	for i in range(10):
+		write(os.path.join(pages, "js/%d.js" % (i)), "var a = %d;" % (i))
+	# Targets are parsed from URLs
+	assert isinstance(deploy.backend(target), deploy.LocalBackend)
+	assert deploy.backend("file://" + target).directory == target
+	# A site must be built before it is deployed
+	try:
+		deploy.Deployer(output, output + ".manifest", deploy.LocalBackend(target)).deploy()
+		assert False
+	except deploy.DeployError:
+		pass
+	build(root)
+	clients = []
+	objects = {}
+	backends = (
+		deploy.LocalBackend(target),
+		deploy.SFTPBackend("localhost", "/www", connect=lambda:FakeSFTP(os.path.join(root, "SFTP"), clients)),
+		deploy.S3Backend("bucket", "/site/", connect=lambda:FakeS3(objects)),
+	)
+	# The first deployment uploads everything, with pages last
+	plan = deploy.Deployer(output, output + ".manifest", backends[0]).plan()
+	assert plan[0][-2:] == ["docs/about.html", "index.html"], plan[0]
+	uploaded, removed = deployAll(output, backends)
+	assert len(uploaded) == 13 and not removed, uploaded
+	assert read(os.path.join(target, "docs/images/logo.png")) == "PNG"
+	assert read(os.path.join(root, "SFTP/www/js/9.js")) == "var a = 9;"
+	assert objects[("bucket", "site/docs/images/logo.png")] == ("PNG", "image/png")
+	assert objects.has_key(("bucket", "site/" + deploy.DEPLOY_MANIFEST))
+	# Connections are closed after the deployment
+	assert clients and not filter(lambda c:not c.closed, clients)
+	# Nothing is uploaded when nothing changed
+	build(root)
+	assert deployAll(output, backends) == ([], [])
+	# Only the changed files are uploaded, and the removed files are removed
+	write(os.path.join(pages, "js/3.js"), "var a = 'changed';")
+	os.unlink(os.path.join(pages, "docs/images/logo.png"))
+	build(root)
+	assert deployAll(output, backends) == (["js/3.js"], ["docs/images/logo.png"])
+	assert read(os.path.join(target, "js/3.js")) == "var a = 'changed';"
+	assert not os.path.exists(os.path.join(target, "docs/images/logo.png"))
+	assert not os.path.exists(os.path.join(root, "SFTP/www/docs/images/logo.png"))
+	assert not objects.has_key(("bucket", "site/docs/images/logo.png"))
+	# Files that could not be uploaded are uploaded by the next deployment
+	write(os.path.join(pages, "js/4.js"), "var a = 'failed';")
+	write(os.path.join(pages, "js/5.js"), "var a = 'uploaded';")
+	build(root)
+	class FailingBackend(deploy.LocalBackend):
+		def upload( self, source, path ):
+			if path == "js/4.js": raise IOError("Connection lost")
+			deploy.LocalBackend.upload(self, source, path)
+	uploaded, removed, errors = deploy.Deployer(output, output + ".manifest", FailingBackend(target)).deploy()
+	assert uploaded == ["js/5.js"] and errors == [("js/4.js", "Connection lost")], (uploaded, errors)
+	assert deploy.Deployer(output, output + ".manifest", backends[0]).deploy() == (["js/4.js"], [], [])
+	# Dry runs do not change the target
+	write(os.path.join(pages, "js/6.js"), "var a = 'dry';")
+	build(root)
+	assert deploy.Deployer(output, output + ".manifest", backends[0]).deploy(True) == (["js/6.js"], [], [])
+	assert read(os.path.join(target, "js/6.js")) == "var a = 6;"
+	# The command reports bad options and dry runs
+	stdout = sys.stdout
+	for args, result, expected in (
+		(["-l", "-j", "many", target, root], 1, "must be a positive number"),
+		(["-l", "-n", target, root], 0, "1 files would be uploaded, 0 files would be removed"),
+		(["-l", target, root], 0, "1 files uploaded, 0 files removed, 0 errors"),
+	):
+		sys.stdout = StringIO.StringIO()
+		try:
+			assert deploy.run(args) == result, args
+			assert sys.stdout.getvalue().find(expected) != -1, sys.stdout.getvalue()
+		finally:
+			sys.stdout = stdout
+	assert read(os.path.join(target, "js/6.js")) == "var a = 'dry';"
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
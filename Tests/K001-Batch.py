@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil, StringIO
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from TahcheeTest import write, read
+from tahchee.plugins._kiwi import main as kiwi
+
+__doc__ = """Ensures that the batch mode of the Kiwi command line gives the same
+outputs as converting each file on its own."""
+
+DOCUMENT = """== Document %d
+-- Author: Pouet
+
+1. First section
+================
+
+Some *emphasized* text with a [link](http://www.pouet.org), and the d\xe9j\xe0
+vu of Latin-1.
+
+ - item one
+ - item two
+
+1.1 Subsection
+--------------
+
+More text.
+
+2. Second section
+=================
+
+>   code block
+"""
+
+MANUAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Documentation", "MANUAL.txt")
+
+def single( source, *options ):
+	"""Converts the given source on its own, returning the result."""
+	status, result = kiwi.run(list(options) + ["-i", "latin-1", source], noOutput=True)
+	assert status == kiwi.SUCCESS, result
+	return result
+
+def batch( output, sources, *options ):
+	"""Converts the given sources in batch mode, returning the status and
+	result, and the report."""
+	report = StringIO.StringIO()
+	stderr = sys.stderr
+	sys.stderr = report
+	try:
+		res = kiwi.run(list(options) + ["-i", "latin-1", "--batch", "-d", output] + sources)
+	finally:
+		sys.stderr = stderr
+	return res, report.getvalue()
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	if os.path.exists(root): shutil.rmtree(root)
+	sources = os.path.join(root, "Sources")
+	output  = os.path.join(root, "Output")
+	for i, path in enumerate(("a.txt", "b.txt", "docs/c.txt", "docs/more/d.txt")):
+		write(os.path.join(sources, path), DOCUMENT % (i))
+	shutil.copy(MANUAL, os.path.join(sources, "docs", "manual.txt"))
+	# Every source (given by globs and lists) is converted in the output
+	# directory, keeping its location, as it would be on its own
+	write(os.path.join(root, "list.txt"), "# Sources\n%s\n\n%s\n" % (
+		os.path.join(sources, "docs/*.txt"), os.path.join(sources, "docs/more/d.txt")))
+	for jobs in ("1", "3"):
+		for options, extension in ((["-m"], ".html"), (["-O", "twiki"], ".twiki"), (["-p"], ".xml"), (["-m", "-f"], ".html")):
+			if os.path.exists(output): shutil.rmtree(output)
+			(status, result), report = batch(output,
+				[os.path.join(sources, "*.txt"), "@" + os.path.join(root, "list.txt")],
+				"-j", jobs, *options)
+			assert status == kiwi.SUCCESS, result
+			assert result.startswith("Converted 5 of 5 file(s)"), result
+			for path in ("a", "b", "docs/c", "docs/manual", "docs/more/d"):
+				expected = single(os.path.join(sources, path + ".txt"), *options)
+				assert read(os.path.join(output, path + extension)) == expected, (path, options, jobs)
+	# Failures are reported without stopping the batch
+	shutil.rmtree(output)
+	(status, result), report = batch(output, [os.path.join(sources, "a.txt"),
+		os.path.join(sources, "missing.txt")], "-m", "-j", "1")
+	assert status == kiwi.ERROR and result.find("1 failed") != -1, result
+	assert report.find("FAILED " + os.path.join(sources, "missing.txt")) != -1, report
+	assert read(os.path.join(output, "a.html")) == single(os.path.join(sources, "a.txt"), "-m")
+	# The batch mode requires an output directory
+	status, result = kiwi.run(["--batch", os.path.join(sources, "a.txt")])
+	assert status == kiwi.ERROR, result
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil, codecs, StringIO
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from TahcheeTest import write, read
+from tahchee.plugins._kiwi import main as kiwi, core, kiwi2html
+
+__doc__ = """Ensures that the streaming Kiwi parser and HTML writer give the same
+HTML as parsing and generating the whole document."""
+
+SECTION = """%(n)d. Section %(n)d
+============
+
+A paragraph of section %(n)d with *emphasis*, `code` and <term:markup
+that spans two lines>, which continues on a third line.
+
+ - A list item
+ - Another item
+
+%(n)d.1 Subsection
+-------------
+
+>   code of section %(n)d
+>   on two lines
+
+    Note ____________________________________________________
+    A note, indented like a block.
+
+"""
+
+NESTED = """1.%(n)d Subsection %(n)d
+--------------
+
+A paragraph of subsection %(n)d.
+
+"""
+
+MANUAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Documentation", "MANUAL.txt")
+
+def streamed( path, chunkSize, bodyOnly=False ):
+	"""Returns the HTML of the given file, parsed and written in chunks of the
+	given size."""
+	parser    = core.Parser(os.path.dirname(path), kiwi.LATIN1, kiwi.LATIN1)
+	output    = StringIO.StringIO()
+	variables = {"LEVEL":0}
+	if not bodyOnly:
+		variables["HEADER"]   = "\n<style><!-- \n%s --></style>" % (kiwi.defaultStyle())
+		variables["ENCODING"] = kiwi.LATIN1
+	source = codecs.open(path, "r", kiwi.LATIN1)
+	kiwi2html.processor.generateStream(parser.iterparse(source, chunkSize), output,
+	bodyOnly, variables, kiwi.LATIN1)
+	source.close()
+	return output.getvalue()
+
+def whole( path, *options ):
+	status, result = kiwi.run(list(options) + ["-m", "-i", "latin-1", path], noOutput=True)
+	assert status == kiwi.SUCCESS, result
+	return result
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	if os.path.exists(root): shutil.rmtree(root)
+	document = os.path.join(root, "document.txt")
+	write(document, "== Streamed document\n-- Author: Pouet\n\n" + "".join(
+		map(lambda n:SECTION % {"n":n}, range(1, 21))))
+	# Whatever the size of the chunks, the document gives the same HTML
+	for path in (document, MANUAL):
+		expected = whole(path)
+		for size in (1, 256, 4096, core.STREAM_CHUNK_SIZE):
+			assert streamed(path, size) == expected, (path, size)
+		assert streamed(path, 256, True) == whole(path, "--body-only")
+	# Which is what the command line writes with --stream
+	status, result = kiwi.run(["-m", "-s", "-i", "latin-1", document, os.path.join(root, "document.html")])
+	assert status == kiwi.SUCCESS, result
+	assert read(os.path.join(root, "document.html")) == whole(document)
+	# Blocks are yielded as they are finished, and the sections keep their
+	# numbering once the previous ones were dropped
+	parser = core.Parser(root, kiwi.LATIN1, kiwi.LATIN1)
+	events = map(lambda e:e[0], parser.iterparse(open(document), 256))
+	assert events[0] == "header" and events[-1] == "end"
+	assert events.count("open") == events.count("close") > 0, events
+	# The finished blocks of nested sections are yielded too, so that only
+	# the open sections are kept in memory
+	nested = os.path.join(root, "nested.txt")
+	write(nested, "1. Intro\n========\n\nIntroduction.\n\n" + "".join(
+		map(lambda n:NESTED % {"n":n}, range(1, 200))))
+	assert streamed(nested, 256) == whole(nested)
+	events  = []
+	largest = 0
+	for event, node in parser.iterparse(open(nested), 256):
+		events.append(event)
+		if event == "header": document = node
+		largest = max(largest, len(document.getElementsByTagName("*")))
+	assert events[:3] == ["header", "open", "block"], events[:3]
+	assert events.count("open") == events.count("close") > 1, events
+	assert largest < 50, largest
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
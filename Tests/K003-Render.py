@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from TahcheeTest import read
+from tahchee.plugins._kiwi import main as kiwi
+
+__doc__ = """Ensures that rendering a Kiwi document to several formats, with and
+without threads, gives the same outputs as separate single-format runs."""
+
+DOCUMENTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Documentation")
+SOURCES   = (
+	os.path.join(DOCUMENTS, "MANUAL.txt"),
+	os.path.join(DOCUMENTS, "Example", "Pages", "index.html.tmpl"),
+)
+
+# The options of the single-format runs for each format
+FORMATS = {
+	"html":["-m"],
+	"twiki":["-O", "twiki"],
+	"xml":["-p"],
+}
+
+def single( source, format, *options ):
+	status, result = kiwi.run(FORMATS[format] + list(options) + ["-i", "latin-1", source], noOutput=True)
+	assert status == kiwi.SUCCESS, result
+	return result
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	if os.path.exists(root): shutil.rmtree(root)
+	os.makedirs(root)
+	for source in SOURCES:
+		for options in ([], ["-f"], ["--toc=2", "--level=1"]):
+			for threads in ([], ["--threads"]):
+				targets = []
+				for format in ("html", "twiki", "xml"):
+					targets += ["-r", "%s:%s" % (format, os.path.join(root, format))]
+				# A format may be written to several destinations
+				targets += ["-r", "html:%s" % (os.path.join(root, "html.copy"))]
+				status, result = kiwi.run(options + threads + ["-p", "-i", "latin-1"] + targets + [source])
+				assert status == kiwi.SUCCESS, result
+				for format in ("html", "twiki", "xml"):
+					assert read(os.path.join(root, format)) == single(source, format, *options), \
+					(source, format, options, threads)
+				assert read(os.path.join(root, "html.copy")) == read(os.path.join(root, "html"))
+	# Rendering cannot be combined with a destination
+	status, result = kiwi.run(["-r", "html:" + os.path.join(root, "html"), SOURCES[0], os.path.join(root, "out")])
+	assert status == kiwi.ERROR, result
+	status, result = kiwi.run(["-r", "pdf:" + os.path.join(root, "pdf"), SOURCES[0]])
+	assert status == kiwi.ERROR, result
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, xml.dom.minidom
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from tahchee.plugins._kiwi import templates
+
+__doc__ = """Ensures that the Kiwi template processor expands expressions from its
+cached plans and child buckets, also when it generates several documents."""
+
+DOCUMENT_A = """<Document><Title>A</Title><Section><Title>One</Title><Para>first
+</Para><Para>second</Para></Section><Section><Title>Two</Title><Para>third</Para>
+</Section><Note>n&amp;b</Note></Document>"""
+
+DOCUMENT_B = """<Document><Title>B</Title><Section><Title>Un</Title><Para>premier</Para>
+</Section></Document>"""
+
+TEMPLATE = "[$(=name)|$(Title)|$(Section/Para)|$(Section:toc?)|$(Note:toc?)|$(=missing)]"
+
+def convertDocument( element ):
+	return element._processor.process(element, TEMPLATE)
+
+def convertTitle( element ):
+	return element._processor.process(element, "<$(*)>")
+
+def convertPara( element ):
+	return element._processor.process(element, "($(*))")
+
+def convertSection_toc( element ):
+	return element._processor.process(element, "{$(Title)}")
+
+def generate( processor, text, **variables ):
+	return processor.generate(xml.dom.minidom.parseString(text), variables=variables)
+
+if __name__ == "__main__":
+	processor = templates.Processor()
+	processor.register(globals())
+	# $(A/B) selects the grand-children, $(X:alt?) falls back to the default
+	# conversion and $(=VAR) is replaced by the (upper case) variable
+	expected_a = "[a|<A>|(first\n)(second)(third)|{<One>}{<Two>}|n&amp;b|]"
+	assert generate(processor, DOCUMENT_A, NAME="a") == expected_a
+	assert processor.plans[TEMPLATE] == ["[", ("=", "NAME"), "|", (["Title"], None),
+		"|", (["Section", "Para"], None), "|", (["Section"], "toc?"), "|",
+		(["Note"], "toc?"), "|", ("=", "MISSING"), "]"], processor.plans[TEMPLATE]
+	plan = processor.plans[TEMPLATE]
+	# A second document uses the same plans, but not the children of the
+	# first one
+	expected_b = "[b|<B>|(premier)|{<Un>}||]"
+	assert generate(processor, DOCUMENT_B, NAME="b") == expected_b
+	assert processor.plans[TEMPLATE] is plan
+	assert generate(processor, DOCUMENT_A, NAME="a") == expected_a
+	# A document is processed again from scratch after it was changed
+	document = xml.dom.minidom.parseString(DOCUMENT_B)
+	assert processor.generate(document, variables={"NAME":"b"}) == expected_b
+	section = document.getElementsByTagName("Section")[0]
+	para    = document.createElement("Para")
+	para.appendChild(document.createTextNode("second"))
+	section.appendChild(para)
+	assert processor.generate(document, variables={"NAME":"b"}) == \
+	"[b|<B>|(premier)(second)|{<Un>}||]"
+	# The children of an element are grouped by tag name, with all the child
+	# nodes (including text) under "*"
+	buckets = processor.children(section)
+	assert map(lambda e:e.tagName, buckets["Para"]) == ["Para", "Para"]
+	assert len(buckets["*"]) == 4 and processor.children(section) is buckets
+	assert processor.indexOf(para) == 3
+	# Interpreting expressions gives the same as the plans
+	assert processor.interpret(document.childNodes[0], "Section/Para") == "(premier)(second)"
+	assert processor.interpret(document.childNodes[0], "Section:toc") == "{<Un>}"
+	# Registered element processors replace the cached functions
+	processor.registerElementProcessor(lambda e:"P", "Para")
+	assert processor.generate(document, variables={"NAME":"b"}) == "[b|<B>|PP|{<Un>}||]"
+	# The plans cache does not grow indefinitely
+	for i in range(templates.PLANS_CACHE_SIZE + 1):
+		processor.compile("$(Para)%d" % (i))
+	assert len(processor.plans) <= templates.PLANS_CACHE_SIZE
+	print "OK"
+
+# EOF
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, re, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from TahcheeTest import write
+from tahchee.plugins._kiwi import main as kiwi
+
+__doc__ = """Ensures that the internal links of Kiwi documents resolve to the
+anchors of targets, reference entries and sections, including the ones that
+come after the links, and that the table of contents links to the sections."""
+
+DOCUMENT = """== References
+-- Author: Pouet
+
+1. Introduction
+===============
+
+See the [later section] and the [  Later   SECTION ] again, the
+|first target| here, a forward [target][Far Target], the [reference][kiwi]
+entry and a [missing one].
+
+1.1 Details
+-----------
+
+Nothing.
+
+2. Later section
+================
+
+The |far target:far| is here, back to [introduction].
+
+2.1 More
+--------
+
+2.1.1 Deep
+----------
+
+Deep text.
+
+ [kiwi]: The Kiwi markup.
+"""
+
+RE_ANCHOR   = re.compile('<a (?:class="anchor" )?name="([^"]+)"')
+RE_INTERNAL = re.compile('<a href="#([^"]+)" class="internal">')
+RE_TOC      = re.compile('<div class="kiwiTOC">(.*?)</div>')
+RE_HEADING  = re.compile('<h\d class="heading">(<a class="anchor" name="([^"]+)"></a>)?<span class="number">.*?</span></span>([^<]+)</h')
+
+def html( path, *options ):
+	status, result = kiwi.run(list(options) + ["-m", "--no-style", "-i", "latin-1", path], noOutput=True)
+	assert status == kiwi.SUCCESS, result
+	return result
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	if os.path.exists(root): shutil.rmtree(root)
+	document = os.path.join(root, "document.txt")
+	write(document, DOCUMENT)
+	for options in ([], ["--toc=2"]):
+		result  = html(document, *options)
+		anchors = RE_ANCHOR.findall(result)
+		# Anchors are unique, and the internal links go to one of them, whether
+		# they come before or after the link, ignoring case and spacing
+		for anchor in anchors: assert anchors.count(anchor) == 1, (anchor, anchors)
+		links = RE_INTERNAL.findall(result)
+		assert links == ["Later_section", "Later_section", "far_target", "kiwi",
+			"missing_one", "Introduction"], links
+		for link in links:
+			assert link == "missing_one" or link in anchors, (link, anchors)
+		assert "first_target" in anchors and "missing_one" not in anchors
+		# Sections are numbered, and they get an anchor when they are referenced
+		# or when there is a table of contents
+		headings = map(lambda m:(m[1], m[2]), RE_HEADING.findall(result))
+		if options:
+			assert headings == [("Introduction", "Introduction"), ("Details", "Details"),
+				("Later_section", "Later section"), ("More", "More"), ("Deep", "Deep")], headings
+		else:
+			assert headings == [("Introduction", "Introduction"), ("", "Details"),
+				("Later_section", "Later section"), ("", "More"), ("", "Deep")], headings
+	# The table of contents lists the sections up to the given depth, and links
+	# to their anchors
+	toc = RE_TOC.search(html(document, "--toc=2")).group(1)
+	assert RE_INTERNAL.findall(toc) == [], toc
+	assert re.findall('<a href="#([^"]+)">', toc) == ["Introduction", "Details", "Later_section", "More"], toc
+	assert toc.count("<ul>") == 3 and toc.count("</ul>") == 3, toc
+	assert not RE_TOC.search(html(document))
+	assert html(document, "--toc=1", "--body-only").startswith(
+		'<div class="kiwiTOC"><ul><li><a href="#Introduction">')
+	# Sections whose headings clash with other anchors get a numbered one
+	write(document, "1. kiwi\n=======\n\nThe [kiwi] entry.\n\n [kiwi]: Entry.\n")
+	result = html(document, "--toc=1")
+	assert RE_INTERNAL.findall(result) == ["kiwi"]
+	assert RE_ANCHOR.findall(result) == ["section_1", "kiwi"], RE_ANCHOR.findall(result)
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, re, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from TahcheeTest import write, read
+from tahchee.plugins._kiwi import main as kiwi, html2kiwi
+
+__doc__ = """Ensures that the HTML to Kiwi converter handles entities, nested lists
+and malformed markup, and that Kiwi gives back the same content from the
+converted text."""
+
+HTML = """<html><head><style>p { color: red }</style><script>var a = "<p>";</script></head>
+<body><h1>Caf&eacute; th&#233;</h1>
+<p>Fish &amp; chips &lt;here&gt; at &#x41;&#66; &unknown;</p>
+<ul><li>one<ul><li>one.one</li><li>one.two<ul><li>deep</li></ul></li></ul></li><li>two</ul>
+<p>Unclosed paragraph
+<p>Another <b>bold <i>italic</b> text</i>
+<h2>Sub</h2>text outside</div>
+<pre>code &lt;b&gt; &amp;
+  indented</pre>
+</body></html>"""
+
+KIWI = u"""
+Caf\xe9 th\xe9
+========
+
+Fish &amp; chips &lt;here&gt; at AB &amp;unknown;
+
+   - one
+        - one.one
+        - one.two
+             - deep
+   - two
+
+Unclosed paragraph
+
+Another bold italic text
+
+
+Sub
+---
+
+text outside
+
+
+>   code <b> &
+>     indented
+
+"""
+
+# The HTML that Kiwi gives for the converted text
+ROUND_TRIP = u"""<p>Fish &amp; chips &lt;here&gt; at AB &amp;unknown;</p>\
+<ul><li>one <ul><li>one.one </li><li>one.two <ul><li>deep </li></ul></li></ul></li><li>two</li></ul>\
+<p>Unclosed paragraph</p><p>Another bold italic text</p>"""
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	if os.path.exists(root): shutil.rmtree(root)
+	assert html2kiwi.convertDocument(HTML) == KIWI, repr(html2kiwi.convertDocument(HTML))
+	# The converted text gives back the same content with Kiwi
+	write(os.path.join(root, "document.txt"), KIWI.encode("latin-1"))
+	status, result = kiwi.run(["-m", "--body-only", "-i", "latin-1", os.path.join(root, "document.txt")], noOutput=True)
+	assert status == kiwi.SUCCESS, result
+	result = result.decode("latin-1")
+	assert result.find(ROUND_TRIP) != -1, repr(result)
+	assert re.search(u"<h1 class=\"heading\">.*</span>Caf\xe9 th\xe9</h1>", result), result
+	assert result.find("</span>Sub</h2>") != -1 and result.find("<p>text outside</p>") != -1, result
+	assert result.find("<pre>\ncode &lt;b&gt; &amp;\n  indented</pre>") != -1, repr(result)
+	# The converter gives the same text whatever the size of the chunks it is
+	# fed with
+	for size in (1, 7, 64):
+		res       = []
+		converter = html2kiwi.Converter(res.append)
+		for i in range(0, len(HTML), size): converter.feed(HTML[i:i+size].decode("latin-1"))
+		converter.close()
+		assert "".join(res) == KIWI, size
+	# Invalid entities are kept as text, and the blocks that are not closed
+	# end with the document
+	assert html2kiwi.convertDocument("&#99999999999; &#xZZ; &bogus;") == \
+	"&amp;#99999999999; &amp;#xZZ; &amp;bogus;\n\n"
+	assert html2kiwi.convertDocument("<ul><li>a<li>b<ul><li>c</ul><p>d") == \
+	"   - a\n   - b\n        - c\n\n     d\n\n"
+	# The command line converts files
+	write(os.path.join(root, "document.html"), HTML)
+	status, result = html2kiwi.run([os.path.join(root, "document.html"), os.path.join(root, "converted.txt")])
+	assert status == kiwi.SUCCESS, result
+	assert read(os.path.join(root, "converted.txt")) == KIWI.encode("latin-1")
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, StringIO
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from tahchee.plugins._kiwi import core
+
+__doc__ = """Ensures that the Kiwi line index converts offsets to lines and columns
+like counting the newlines before the offset, including at line boundaries and
+on a last line without a trailing newline."""
+
+TEXTS = (
+	u"",
+	u"\n",
+	u"a",
+	u"a\nb",
+	u"a\nb\n",
+	u"\n\nabc\n\nd",
+	u"first line\n\n  third line\nlast line without newline",
+)
+
+MANUAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Documentation", "MANUAL.txt")
+
+def lineColumn( text, offset, firstLine=1 ):
+	"""Returns the (line, column) for the given offset by counting the
+	newlines before it, which is what the parser did before the line
+	index."""
+	before = text[:offset]
+	return (before.count("\n") + firstLine, offset - before.rfind("\n") - 1)
+
+if __name__ == "__main__":
+	texts = list(TEXTS)
+	texts.append(open(MANUAL).read().decode("latin-1"))
+	for text in texts:
+		for firstLine in (1, 42):
+			index = core.LineIndex(text, firstLine)
+			assert len(index.starts) == text.count("\n") + 1
+			# Every offset, including the end of the text, gives the same line
+			# and column, and back
+			for offset in range(0, len(text) + 1):
+				line, column = index.lineColumn(offset)
+				assert (line, column) == lineColumn(text, offset, firstLine), (text, offset)
+				assert index.offset(line, column) == offset
+	# The newline belongs to the line it ends, and the next line starts right
+	# after it
+	index = core.LineIndex(u"ab\ncd\n\nef")
+	assert index.lineColumn(2) == (1, 2)
+	assert index.lineColumn(3) == (2, 0)
+	assert index.lineColumn(5) == (2, 2)
+	assert index.lineColumn(6) == (3, 0)
+	assert index.lineColumn(7) == (4, 0)
+	assert index.lineColumn(9) == (4, 2)
+	assert index.offset(4) == 7 and index.offset(3) == 6
+	# The parser reports warnings at the line and column of the current offset,
+	# and the offsets of the document convert to lines
+	text   = u"Some text.\n\n - item\n - "
+	stderr = sys.stderr
+	sys.stderr = StringIO.StringIO()
+	try:
+		document = core.Parser(".").parse(text, offsets=True)
+		report   = sys.stderr.getvalue()
+	finally:
+		sys.stderr = stderr
+	assert report.find("WARNING at line    4, character   3: Empty list item.") != -1, report
+	assert document.lineIndex.lineColumn(len(text)) == (4, 3)
+	for start, end in document.offsets:
+		assert document.lineIndex.lineColumn(start) == lineColumn(text, start)
+		assert document.lineIndex.lineColumn(end) == lineColumn(text, end)
+	print "OK"
+
+# EOF
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from TahcheeTest import read
+from tahchee.plugins._kiwi import main as kiwi, core
+
+__doc__ = """Ensures that the Kiwi XML and HTML with offsets are byte-identical to
+the fixtures, which were generated by the Kiwi that propagated the offsets
+through the element attributes."""
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Fixtures")
+DOCUMENT = os.path.join(FIXTURES, "offsets.txt")
+
+def convert( *options ):
+	status, result = kiwi.run(list(options) + ["-f", "-i", "latin-1", DOCUMENT], noOutput=True)
+	assert status == kiwi.SUCCESS, result
+	return result
+
+def elements( node ):
+	"""Returns the elements of the given node, in document order."""
+	res = []
+	for child in node.childNodes:
+		if child.nodeType == child.ELEMENT_NODE:
+			res.append(child)
+			res.extend(elements(child))
+	return res
+
+if __name__ == "__main__":
+	assert convert("-p") == read(os.path.join(FIXTURES, "offsets.xml"))
+	assert convert("-m") == read(os.path.join(FIXTURES, "offsets.html"))
+	# The offsets table gives the offsets of the attributes of each element,
+	# by element number
+	text     = read(DOCUMENT).decode("latin-1")
+	document = core.Parser(FIXTURES).parse(text, offsets=True)
+	nodes    = elements(document)
+	assert len(document.offsets) == len(nodes)
+	for node in nodes:
+		number = int(node.getAttributeNS(None, "_number"))
+		assert node._offsetNumber == number
+		assert document.offsets[number] == (int(node.getAttributeNS(None, "_start")),
+			int(node.getAttributeNS(None, "_end"))), node.nodeName
+		assert 0 <= document.offsets[number][0] <= len(text)
+	print "OK"
+
+# EOF
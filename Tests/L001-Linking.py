@@ -4,10 +4,12 @@
 # Project   : Tahchee
 # -----------------------------------------------------------------------------
 
-import sys, os
+import sys, os, shutil
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from TahcheeTest import write
 from tahchee.main import Site
 from tahchee.plugins.linking import LinkingPlugin
+from tahchee.plugins import linking
 
 __doc__ = "Ensures that the units are properly parsed."
 
@@ -54,7 +56,7 @@ LINKS = (
 
 if __name__ == "__main__":
 	root = __file__ + ".test"
-	if os.path.exists(root): os.rmdir(root)
+	if os.path.exists(root): shutil.rmtree(root)
 	os.mkdir(root)
 	s = Site("http://www.pouet.org", root=root)
 	l = LinkingPlugin(s)
@@ -62,6 +64,41 @@ if __name__ == "__main__":
 		res = l.link(src, dst, checkLink=False)
 		print "Checking link('%s', '%s') = '%s' ? '%s'" % (src, dst, res, expected )
 		assert expected == res
+	# Links are memoized, so we check them again, with the batch API as well
+	for src, dst, expected in LINKS:
+		assert l.link(src, dst, checkLink=False) == expected
+		assert l.links(src, [dst, dst], checkLink=False) == [expected, expected]
+	# And also with a cache that is too small to hold all the links
+	l._links = linking.Memo(3)
+	for src, dst, expected in LINKS + LINKS:
+		assert l.link(src, dst, checkLink=False) == expected
+	# Breadcrumbs are rendered once per directory, and end with the page
+	assert l.hierarchy("index.html") == "<a href='index.html'>http://www.pouet.org</a>"
+	assert l.hierarchy("pages/other/page.html") == \
+	"<a href='../../index.html'>http://www.pouet.org</a> / " + \
+	"<a href='../index.html'>pages</a> / <a href='index.html'>other</a> / " + \
+	"<a href='page.html'>page</a> "
+	assert l.breadcrumb(("pages", "other")) is l.breadcrumb(("pages", "other"))
+	# Once the pages are walked, directories without index are not linked,
+	# until the next build adds an index
+	write(os.path.join(s.pages(), "index.html"), "")
+	write(os.path.join(s.pages(), "docs", "page.html"), "")
+	l = LinkingPlugin(s)
+	assert l.hierarchy("docs/page.html") == \
+	"<a href='../index.html'>http://www.pouet.org</a> / docs / <a href='page.html'>page</a> "
+	write(os.path.join(s.pages(), "docs", "index.html"), "")
+	assert l.breadcrumb(("docs",)) == "<a href='../index.html'>http://www.pouet.org</a> / docs"
+	l.reset()
+	assert l.breadcrumb(("docs",)) == \
+	"<a href='../index.html'>http://www.pouet.org</a> / <a href='index.html'>docs</a>"
+	# Ignored directories are not walked, and the directories only
+	# containing directories are listed
+	write(os.path.join(s.pages(), ".svn", "index.html"), "")
+	write(os.path.join(s.pages(), "api", "v1", "index.html.tmpl"), "")
+	l = LinkingPlugin(Site("http://www.pouet.org", root=root, IGNORES=[".svn"]))
+	assert l.directories() == {():"index.html", ("docs",):"index.html",
+		("api",):None, ("api", "v1"):"index.html"}, l.directories()
+	shutil.rmtree(root)
 	print "OK"
 
 # EOF
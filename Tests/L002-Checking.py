@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from TahcheeTest import write
+from tahchee.main import Site, hashFile
+from tahchee.linkcheck import LinkChecker
+
+__doc__ = "Ensures that broken links and missing anchors are reported."
+
+PAGES = {
+	"index.html":"""<html><body id='top'>
+		<a href='about.html#team'>About</a>
+		<a href='about.html#nowhere'>Nowhere</a>
+		<a href='docs/'>Docs</a>
+		<a href='http://www.pouet.org/docs/manual.html#intro'>Manual</a>
+		<a href='http://www.python.org/missing.html'>Python</a>
+		<a href='mailto:pouet@pouet.org'>Mail</a>
+		<a href='#top'>Top</a>
+		<img src='images/missing.png' />
+	</body></html>""",
+	"about.html":"""<html><body><a name='team'></a>
+		<a href='index.html?lang=en'>Home</a>
+		<a href='../outside.html'>Outside</a>
+		<a href='/docs/manual.html#intro'>Manual</a>
+	</body></html>""",
+	"docs/index.html":"""<html><body>
+		<a href='manual.html#usage'>Usage</a>
+		<a href='../empty/'>Empty</a>
+	</body></html>""",
+	"docs/manual.html":"""<html><body><h1 id='intro'>Intro</h1></body></html>""",
+}
+
+EXPECTED = [
+	("about.html", "../outside.html", "Link goes outside of the site"),
+	("docs/index.html", "../empty/", "Directory has no index"),
+	("docs/index.html", "manual.html#usage", "Missing anchor 'usage' in 'docs/manual.html'"),
+	("index.html", "about.html#nowhere", "Missing anchor 'nowhere' in 'about.html'"),
+	("index.html", "images/missing.png", "Missing file"),
+]
+
+if __name__ == "__main__":
+	root = __file__ + ".test"
+	if os.path.exists(root): shutil.rmtree(root)
+	os.mkdir(root)
+	s = Site("http://www.pouet.org", root=root, INDEXES=["index.*"])
+	for path, content in PAGES.items():
+		write(os.path.join(s.output(), path), content)
+	os.mkdir(os.path.join(s.output(), "empty"))
+	cache    = {}
+	checker  = LinkChecker(s, cache)
+	problems = checker.check()
+	problems.sort()
+	print "\n".join(map(str, problems))
+	assert problems == EXPECTED
+	assert checker.scanned == len(PAGES)
+	# Files named 'index' are indexes even when the site has no INDEXES
+	problems = LinkChecker(Site("http://www.pouet.org", root=root), {}).check()
+	problems.sort()
+	assert problems == EXPECTED, problems
+	# The pages that did not change are not scanned again
+	write(os.path.join(s.output(), "docs/manual.html"), "<h1 id='intro'>Intro</h1><p id='usage'>Usage</p>")
+	checker  = LinkChecker(s, cache)
+	problems = checker.check(jobs=1)
+	assert checker.scanned == 1
+	assert len(problems) == len(EXPECTED) - 1
+	# The cached digests are tagged with their algorithm, like the ones of
+	# the build manifest
+	assert cache["index.html"][0] == "sha1:" + hashFile(os.path.join(s.output(), "index.html"))
+	# The pages whose digest is given are only read when it changed
+	digests  = {"docs/manual.html":"sha1:manual", "index.html":cache["index.html"][0]}
+	checker  = LinkChecker(s, cache)
+	problems = checker.check(1, digests)
+	assert checker.scanned == 1 and len(problems) == len(EXPECTED) - 1
+	write(os.path.join(s.output(), "docs/manual.html"), "<h1 id='intro'>Intro</h1>")
+	problems = checker.check(1, digests)
+	assert checker.scanned == 0 and len(problems) == len(EXPECTED) - 1
+	digests["docs/manual.html"] = "sha1:changed"
+	problems = checker.check(1, digests)
+	assert checker.scanned == 1 and len(problems) == len(EXPECTED)
+	# And removed pages are forgotten
+	os.unlink(os.path.join(s.output(), "about.html"))
+	problems = LinkChecker(s, cache).check()
+	assert not cache.has_key("about.html")
+	assert ("index.html", "about.html#team", "Missing file") in problems
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
@@ -19,13 +19,15 @@ VALID   = (
 	"./index.htm", "./index.html", "./pouet.php", "./hello.world", "./index.py",
 )
 INVALID = ( "_index.htm", "windex.html", "xpouet.php", "hello.wrld")
+IGNORES = ("*.sw?", ".svn", "node_modules")
+ACCEPTS = ("*.html", "*.tmpl", ".svn")
 
 
 if __name__ == "__main__":
 	root = __file__ + ".test"
 	if os.path.exists(root): os.rmdir(root)
 	os.mkdir(root)
-	s = Site("http://www.pouet.org", root=root, indexes=INDEXES)
+	s = Site("http://www.pouet.org", root=root, indexes=INDEXES, ignores=IGNORES, accepts=ACCEPTS)
 	print "Checking indexes:"
 	for path in VALID:
 		print " - ", path
@@ -34,6 +36,24 @@ if __name__ == "__main__":
 	for path in INVALID:
 		print " - ", path
 		assert not s.isIndex(path), path
+	print "Checking accepted and ignored files:"
+	for i in range(2):
+		assert s.isAccepted("index.html") and s.isAccepted("pages/index.html.tmpl")
+		assert not s.isAccepted("pages/style.css")
+		assert not s.isAccepted("index.html.swp") and not s.isAccepted("pages/.svn/")
+		assert s.isIgnored(".svn") and s.isIgnored("pages/node_modules/")
+		assert not s.isIgnored("pages") and not s.isIgnored("index.html")
+		assert s.isTemplate("pages/index.html.tmpl") == "pages/index.html"
+		assert s.isTemplate("pages/index.html") is None
+	print "Checking globs added after the site is created:"
+	assert s.isAccepted("index.xml~") is False and s.isAccepted("index.xml") is False
+	assert not s.isIndex("home.html")
+	s.ignores("*~")
+	s.accepts("*.xml", "*~")
+	s.index("home.html")
+	assert not s.isAccepted("index.xml~") and s.isAccepted("index.xml")
+	assert s.isIgnored("index.xml~")
+	assert s.isIndex("home.html") and s.isIndex("index.html")
 	print "OK"
 
 # EOF
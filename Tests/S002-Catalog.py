@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil, time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+import TahcheeTest
+from TahcheeTest import write, output, create
+
+__doc__ = "Ensures that the catalog lists pages and tracks their queries."
+
+PAGES = {
+	"index.html.tmpl":"""## TITLE = Home
+#for p in $site.catalog.query("news", "lastmod", True)
+$p.title() $p.url()
+#end for
+""",
+	"about.html.tmpl":"""#def title: About us
+About
+""",
+	"news/first.html.tmpl":"""## TITLE = First news
+## TAG = release
+First
+""",
+	"news/2008/second.html.tmpl":"""## TITLE = Second news
+Second
+""",
+	".svn/entries":"",
+	".svn/text-base/page.html.tmpl":"Ignored",
+}
+
+def build( root ):
+	"""Builds the site, returning the site and the generated pages."""
+	b = TahcheeTest.build(root, IGNORES=[".svn"])
+	return b.site, TahcheeTest.changed(b)
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	create(root)
+	mtime = 1200000000
+	# Pages are written from the oldest to the most recent
+	paths = PAGES.keys()
+	paths.sort()
+	paths.reverse()
+	for path in paths:
+		mtime += 60
+		write(os.path.join(root, "Pages", path), PAGES[path], mtime)
+	site, changed = build(root)
+	# The catalog lists the pages with their metadata
+	catalog = site.catalog
+	assert map(lambda p:p.path(), catalog.pages()) == [
+		"about.html", "index.html", "news/2008/second.html", "news/first.html"
+	]
+	# Ignored directories are not walked
+	assert not os.path.exists(os.path.join(site.output(), ".svn"))
+	assert catalog.page("about.html").title() == "About us"
+	assert catalog.page("index.html").title() == "Home"
+	assert map(lambda p:p.title(), catalog.query("news", "title")) == ["First news", "Second news"]
+	assert map(lambda p:p.title(), catalog.query("news", "lastmod", True, 1)) == ["Second news"]
+	assert map(lambda p:p.path(), catalog.query(tag="release")) == ["news/first.html"]
+	assert catalog.query("news/2008", tag="release") == []
+	# Pages compute their values when they are first used
+	page = catalog.page("news/2008/second.html")
+	assert page.parents() == ["news", "news/2008"]
+	assert page.lastmod == time.strftime("%d-%b-%Y", time.localtime(page.mtime))
+	assert "<a href='http://www.pouet.org/news/2008/'>2008</a>" in page.htmlPath()
+	assert page.htmlPath() is page.htmlPath()
+	assert output(site, "index.html").split("\n")[:2] == [
+		"Second news http://www.pouet.org/news/2008/second.html",
+		"First news http://www.pouet.org/news/first.html",
+	]
+	# Changing a page that is not in the query result does not rebuild the
+	# index
+	write(os.path.join(root, "Pages", "about.html.tmpl"), "About", mtime + 60)
+	site, changed = build(root)
+	assert os.path.join(root, "Pages", "index.html.tmpl") not in changed
+	# But adding a page to the query result does
+	write(os.path.join(root, "Pages", "news/third.html.tmpl"), "## TITLE = Third news\nThird", mtime + 120)
+	site, changed = build(root)
+	assert os.path.join(root, "Pages", "index.html.tmpl") in changed
+	assert output(site, "index.html").startswith("Third news")
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+import TahcheeTest
+from TahcheeTest import write, output, create
+from tahchee import sitemap
+
+__doc__ = "Ensures that the sitemap and feeds are maintained incrementally."
+
+PAGES = {
+	"index.html.tmpl":"## TITLE = Home\nHome",
+	"style.css.tmpl":"body {}",
+	"news/first.html.tmpl":"## TITLE = First & news\nFirst",
+	"news/second.html.tmpl":"## TITLE = Second news\nSecond",
+}
+
+def build( root ):
+	"""Builds the site, returning the site and the sitemap files written."""
+	directory = os.path.join(root, "Site", "Local")
+	files = filter(lambda f:f.endswith(".xml"), os.listdir(directory))
+	for name in files: os.utime(os.path.join(directory, name), (0, 0))
+	s = TahcheeTest.build(root, SITEMAP=True, FEED="news").site
+	written = []
+	for name in os.listdir(s.output()):
+		if name.endswith(".xml") and os.stat(os.path.join(s.output(), name)).st_mtime != 0:
+			written.append(name)
+	written.sort()
+	return s, written
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	create(root)
+	mtime = 1200000000
+	for path in ("index.html.tmpl", "style.css.tmpl", "news/first.html.tmpl", "news/second.html.tmpl"):
+		mtime += 60
+		write(os.path.join(root, "Pages", path), PAGES[path], mtime)
+	site, written = build(root)
+	assert written == ["atom.xml", "rss.xml", "sitemap.xml"]
+	text = output(site, "sitemap.xml")
+	assert text.count("<url>") == 3
+	assert "<loc>http://www.pouet.org/news/first.html</loc><lastmod>2008-01-10T21:23:00Z</lastmod>" in text
+	assert "style.css" not in text
+	atom = output(site, "atom.xml")
+	assert atom.count("<entry>") == 2
+	assert atom.index("Second news") < atom.index("First &amp; news")
+	assert "<updated>2008-01-10T21:24:00Z</updated>" in atom
+	assert "<pubDate>Thu, 10 Jan 2008 21:24:00 GMT</pubDate>" in output(site, "rss.xml")
+	# Nothing is written when nothing changed
+	site, written = build(root)
+	assert written == []
+	# Changing a page outside of the feed only updates the sitemap
+	write(os.path.join(root, "Pages", "index.html.tmpl"), "## TITLE = Home\nWelcome", mtime + 60)
+	site, written = build(root)
+	assert written == ["sitemap.xml"]
+	# Large sitemaps are split, and only the changed parts are written
+	sitemap.SITEMAP_SIZE = 2
+	os.unlink(os.path.join(site.output(), "sitemap.xml"))
+	site, written = build(root)
+	assert written == ["sitemap-1.xml", "sitemap-2.xml", "sitemap.xml"]
+	assert output(site, "sitemap.xml").count("<sitemap>") == 2
+	write(os.path.join(root, "Pages", "news/second.html.tmpl"), "## TITLE = Second\nSecond", mtime + 120)
+	site, written = build(root)
+	assert written == ["atom.xml", "rss.xml", "sitemap-2.xml", "sitemap.xml"]
+	# Removed pages are removed from the sitemap
+	sitemap.SITEMAP_SIZE = 50000
+	os.unlink(os.path.join(root, "Pages", "news/first.html.tmpl"))
+	site, written = build(root)
+	assert "first.html" not in output(site, "sitemap.xml")
+	assert "first.html" not in output(site, "atom.xml")
+	assert not os.path.exists(os.path.join(site.output(), "sitemap-2.xml"))
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
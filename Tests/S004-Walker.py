@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from tahchee.main import Site, SiteBuilder
+from tahchee import walker
+
+__doc__ = "Ensures that the pages walker finds the same files as os.walk."
+
+FILES = (
+	"index.html.tmpl", "style.css", "docs/index.html.tmpl", "docs/api/a.html",
+	"docs/api/b.html", "images/logo.png", ".svn/entries", "docs/.svn/entries",
+)
+
+def walk( root, ignored ):
+	"""Returns the files found by os.walk, skipping the ignored directories."""
+	res = []
+	for directory, dirs, files in os.walk(root):
+		dirs[:] = filter(lambda d:d not in ignored, dirs)
+		res.extend(map(lambda f:os.path.join(directory, f), files))
+	res.sort()
+	return res
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	if os.path.exists(root): shutil.rmtree(root)
+	for path in ("Templates", "Site/Local", "Site/Remote"):
+		os.makedirs(os.path.join(root, path))
+	pages = os.path.join(root, "Pages")
+	for path in FILES:
+		path = os.path.join(pages, path)
+		if not os.path.exists(os.path.dirname(path)): os.makedirs(os.path.dirname(path))
+		f = open(path, "w") ; f.write(path) ; f.close()
+	# Symbolic links to directories are not walked, like with os.walk
+	os.symlink(os.path.join(pages, "docs"), os.path.join(pages, "link"))
+	expected = walk(pages, (".svn",))
+	for scandir in (walker.scandir, None):
+		walker.scandir = scandir
+		for threads in (1, 4):
+			w     = walker.Walker(lambda d:d == ".svn", threads)
+			files = w.walk(pages)
+			paths = map(lambda f:f[0], files)
+			assert len(paths) == len(expected)
+			paths.sort()
+			assert paths == expected, paths
+			for path, st in files:
+				assert st.st_size == len(path)
+	# Directories given to the builder have their files processed
+	s = Site("http://www.pouet.org", root=root, SHOW_MAIN=False, IGNORES=[".svn"])
+	SiteBuilder(s).build([os.path.join(pages, "docs")])
+	assert os.path.exists(os.path.join(s.output(), "docs/index.html"))
+	assert os.path.exists(os.path.join(s.output(), "docs/api/b.html"))
+	assert not os.path.exists(os.path.join(s.output(), "docs/.svn"))
+	assert not os.path.exists(os.path.join(s.output(), "index.html"))
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+from tahchee import main
+import TahcheeTest
+from TahcheeTest import write, create
+from tahchee.main import hashFile, hashfunc
+
+__doc__ = "Ensures that files are hashed by chunks, and while they are copied."
+
+def build( root, algorithm="sha1", **options ):
+	"""Builds the site, returning the builder."""
+	return TahcheeTest.build(root, CHANGE="signature", HASH=algorithm, **options)
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	create(root)
+	pages = os.path.join(root, "Pages")
+	data  = "".join(map(chr, range(256))) * 1000
+	write(os.path.join(pages, "index.html.tmpl"), "Index")
+	for i in range(4):
+		write(os.path.join(pages, "images/%d.png" % (i)), data + str(i))
+	# Files are hashed by chunks, with or without a memory map
+	path = os.path.join(pages, "images/0.png")
+	for mmap_size in (main.HASH_MMAP_SIZE, 1):
+		main.HASH_CHUNK_SIZE = 1000
+		main.HASH_MMAP_SIZE  = mmap_size
+		assert hashFile(path) == hashfunc(data + "0").hexdigest()
+	# Resources are hashed while they are copied
+	b = build(root)
+	assert b.digests[path] == "sha1:" + hashfunc(data + "0").hexdigest()
+	assert b.checksums[b.site.sig()][path] == b.digests[path]
+	assert open(os.path.join(b.site.output(), "images/0.png"), "rb").read() == data + "0"
+	assert b.changed[path]
+	# And then before they are copied, so that only the changed ones are
+	write(os.path.join(pages, "images/1.png"), data + "changed")
+	b = build(root)
+	changed = filter(lambda p:b.changed[p], b.changed.keys())
+	assert changed == [os.path.join(pages, "images/1.png")], changed
+	assert len(b.digests) == 4
+	assert open(os.path.join(b.site.output(), "images/1.png"), "rb").read() == data + "changed"
+	# Removed outputs are copied again
+	os.unlink(os.path.join(b.site.output(), "images/2.png"))
+	b = build(root)
+	assert os.path.exists(os.path.join(b.site.output(), "images/2.png"))
+	# The files are hashed by the given number of threads
+	write(os.path.join(pages, "images/3.png"), data + "threads")
+	b = build(root, HASH_THREADS=2)
+	assert b.site.hashThreads() == 2 and b.site.threads() == 1
+	assert b.digests[os.path.join(pages, "images/3.png")] == "sha1:" + hashfunc(data + "threads").hexdigest()
+	# Signatures stored without their algorithm are SHA-1 signatures
+	checksums = b.checksums[b.site.sig()]
+	for key in checksums.keys(): checksums[key] = checksums[key].split(":", 1)[1]
+	b.saveChecksums()
+	b = build(root)
+	assert filter(lambda p:b.changed[p], b.changed.keys()) == []
+	# Changing the algorithm changes the signatures, and unavailable
+	# algorithms fall back to SHA-1
+	for algorithm in ("blake2b", "xxh3"):
+		b = build(root, algorithm)
+		if main.hasHash(algorithm):
+			assert b.site.hash() == algorithm
+			assert b.digests[path].startswith(algorithm + ":")
+			assert b.changed[path]
+		else:
+			assert b.site.hash() == "sha1"
+			assert not b.changed[path]
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
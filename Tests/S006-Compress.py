@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil, gzip
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+import TahcheeTest
+from TahcheeTest import write, create
+from tahchee import compress
+
+__doc__ = "Ensures that compressed variants are only written for changed files."
+
+def build( root, **options ):
+	"""Builds the site, returning the builder and the compressed files."""
+	b = TahcheeTest.build(root, **options)
+	return b, b.state("compress")
+
+def gunzip( path ):
+	f = gzip.open(path, "rb")
+	res = f.read()
+	f.close()
+	return res
+
+def compressed( b, names ):
+	"""Returns the names of the given files whose sidecars were written."""
+	res = filter(lambda n:os.path.exists(os.path.join(b.site.output(), n + ".gz")), names)
+	res.sort()
+	return res
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	create(root)
+	pages = os.path.join(root, "Pages")
+	write(os.path.join(pages, "index.html.tmpl"), "Index " * 100)
+	write(os.path.join(pages, "style.css"), "body {}")
+	write(os.path.join(pages, "logo.png"), "PNG")
+	for i in range(compress.POOL_THRESHOLD + 1):
+		write(os.path.join(pages, "js/%d.js" % (i)), "var a = %d;" % (i))
+	# Nothing is compressed by default
+	b, cache = build(root)
+	assert not os.path.exists(os.path.join(b.site.output(), "index.html.gz"))
+	# The files with the compressed extensions get sidecars, the others do not
+	b, cache = build(root, COMPRESS=True)
+	output = b.site.output()
+	assert gunzip(os.path.join(output, "index.html.gz")) == "Index " * 100
+	assert gunzip(os.path.join(output, "js/16.js.gz")) == "var a = 16;"
+	assert os.path.exists(os.path.join(output, "style.css.gz"))
+	assert not os.path.exists(os.path.join(output, "logo.png.gz"))
+	assert len(cache) == compress.POOL_THRESHOLD + 3
+	# Missing sidecars are written again, and the same content gives the
+	# same sidecar
+	sidecar = open(os.path.join(output, "style.css.gz"), "rb").read()
+	for name in cache.keys(): os.unlink(os.path.join(output, name + ".gz"))
+	os.unlink(os.path.join(output, "style.css"))
+	write(os.path.join(pages, "js/0.js"), "var a = 'changed';")
+	b, cache = build(root, COMPRESS=["gz"], COMPRESS_EXTENSIONS=[".css", ".js"])
+	assert not os.path.exists(os.path.join(output, "index.html.gz"))
+	assert not cache.has_key("index.html")
+	assert open(os.path.join(output, "style.css.gz"), "rb").read() == sidecar
+	assert gunzip(os.path.join(output, "js/0.js.gz")) == "var a = 'changed';"
+	# Only the files whose sidecars are missing are compressed again
+	os.unlink(os.path.join(output, "js/1.js.gz"))
+	c = compress.Compressor(b.site, cache)
+	assert c.update(["gz"], (".css", ".js")) == []
+	assert c.compressed == ["js/1.js"], c.compressed
+	assert c.update(["gz"], (".css", ".js")) == []
+	assert c.compressed == []
+	# Files changed within the same second with the same size are compressed
+	# again, according to their digest when it is given, and to their
+	# modification time otherwise
+	path  = os.path.join(output, "js/3.js")
+	mtime = os.stat(path).st_mtime
+	write(path, "var a = 7;")
+	os.utime(path, (mtime, mtime))
+	assert c.update(["gz"], (".css", ".js"), None, {"js/3.js":"sha1:changed"}) == []
+	assert c.compressed == ["js/3.js"], c.compressed
+	assert gunzip(path + ".gz") == "var a = 7;"
+	assert c.update(["gz"], (".css", ".js"), None, {"js/3.js":"sha1:changed"}) == []
+	assert c.compressed == []
+	write(path, "var a = 8;")
+	os.utime(path, (mtime, mtime + 0.5))
+	assert c.update(["gz"], (".css", ".js")) == []
+	assert c.compressed == ["js/3.js"], c.compressed
+	assert gunzip(path + ".gz") == "var a = 8;"
+	# Pages generated again with the same size are compressed again
+	write(os.path.join(pages, "index.html.tmpl"), "Pages " * 100)
+	b, cache = build(root, COMPRESS=True)
+	assert gunzip(os.path.join(output, "index.html.gz")) == "Pages " * 100
+	assert cache["index.html"][2] == b.outputs.files["index.html"]["hash"]
+	c = compress.Compressor(b.site, cache)
+	# Sidecars of removed files are removed
+	os.unlink(os.path.join(output, "js/2.js"))
+	assert c.update(["gz"], (".css", ".js")) == []
+	assert not os.path.exists(os.path.join(output, "js/2.js.gz"))
+	assert not cache.has_key("js/2.js")
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+import TahcheeTest
+from TahcheeTest import write, output, create
+from tahchee.main import Site, hashfunc
+
+__doc__ = "Ensures that fingerprinted resources are linked and rebuilt."
+
+PAGES = {
+	"index.html.tmpl":"<link href='$linking.link($page.path, \"/css/screen.css\")' />",
+	"docs/index.html.tmpl":"<link href='$linking.link($page.path, \"css/screen.css\")' />",
+	"about.html.tmpl":"<img src='$linking.link($page.path, \"logo.png\")' />",
+	"css/screen.css":"body {}",
+	"logo.png":"PNG",
+}
+
+def build( root, **options ):
+	"""Builds the site, returning the site and the changed pages."""
+	b = TahcheeTest.build(root, FINGERPRINT=["*.css"], **options)
+	return b.site, map(lambda p:p[len(b.site.pages())+1:], TahcheeTest.changed(b))
+
+def fingerprinted( content ):
+	return "css/screen.%s.css" % (hashfunc(content).hexdigest()[:8])
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	for change in ("signature", "date"):
+		create(root)
+		mtime = 1200000000
+		for path, content in PAGES.items():
+			write(os.path.join(root, "Pages", path), content, mtime)
+		# Fingerprinted resources are copied under their fingerprinted name,
+		# and links point to it
+		site, changed = build(root, CHANGE=change)
+		name = fingerprinted("body {}")
+		assert os.path.exists(os.path.join(site.output(), name))
+		# (and under their name, for the references that are not created by
+		# the linking plugin)
+		assert output(site, "css/screen.css") == output(site, name) == "body {}"
+		assert site.isFingerprinted("css/screen.css") and not site.isFingerprinted("logo.png")
+		assert os.path.exists(os.path.join(site.output(), "logo.png"))
+		assert output(site, "index.html") == "<link href='%s' />" % (name)
+		assert output(site, "docs/index.html") == "<link href='../%s' />" % (name)
+		assert output(site, "about.html") == "<img src='logo.png' />"
+		assert site.fingerprints.manifest == {"css/screen.css":name}
+		# Nothing changes when the resources did not change
+		site, changed = build(root, CHANGE=change)
+		assert changed == [], changed
+		# Only the pages that link to a changed resource are rebuilt, and the
+		# previous copy is removed
+		write(os.path.join(root, "Pages", "css/screen.css"), "body {color:red}", mtime + 60)
+		site, changed = build(root, CHANGE=change)
+		assert changed == ["css/screen.css", "docs/index.html.tmpl", "index.html.tmpl"], changed
+		assert not os.path.exists(os.path.join(site.output(), name))
+		name = fingerprinted("body {color:red}")
+		assert os.path.exists(os.path.join(site.output(), name))
+		assert output(site, "css/screen.css") == "body {color:red}"
+		assert output(site, "index.html") == "<link href='%s' />" % (name)
+		# Removed resources are removed from the manifest
+		os.unlink(os.path.join(root, "Pages", "css/screen.css"))
+		site, changed = build(root, CHANGE=change)
+		assert site.fingerprints.manifest == {}
+		assert not os.path.exists(os.path.join(site.output(), name))
+		assert not os.path.exists(os.path.join(site.output(), "css/screen.css"))
+		assert output(site, "index.html") == "<link href='css/screen.css' />"
+	# By default, only the style sheets and scripts are fingerprinted
+	site = Site("http://www.pouet.org", root=root, FINGERPRINT=True)
+	assert site.isFingerprinted("css/screen.css") and site.isFingerprinted("js/main.js")
+	assert not site.isFingerprinted("logo.png") and not site.isFingerprinted("fonts/a.woff")
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
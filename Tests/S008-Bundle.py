@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+import TahcheeTest
+from TahcheeTest import write, read, create
+from tahchee.bundle import minifyCSS, minifyJS, joinScripts
+
+__doc__ = "Ensures that bundles are minified and only rebuilt when they change."
+
+CSS = (
+	("body {\n  color: red;\n  margin: 0 auto;\n}\n", "body{color:red;margin:0 auto}"),
+	("/* Comment */\na > b, c {}", "a>b,c{}"),
+	("/*! License */\na:hover {}", "/*! License */\na:hover{}"),
+	("a { content: \"/* not a comment */\"; }", "a{content:\"/* not a comment */\"}"),
+	("a :hover { width: calc(1px + 2px) }", "a :hover{width:calc(1px + 2px)}"),
+	("a { content: \";}\"; color: red; /* c */ }", "a{content:\";}\";color:red}"),
+)
+
+JS = (
+	("  var a = 1; // Comment\n\n  var b = 2;\n", "var a = 1;\nvar b = 2;"),
+	("var s = '// not a comment' /* comment */ + \"/* not */\";", "var s = '// not a comment' + \"/* not */\";"),
+	("var r = /\\/\\/[/]/g, d = a / b / c;", "var r = /\\/\\/[/]/g, d = a / b / c;"),
+	("return /a'b/.test(x)", "return /a'b/.test(x)"),
+	("a = b\n/* multi\nline */\nc()", "a = b\nc()"),
+	("/*! License */\nf()", "/*! License */\nf()"),
+	# Slashes that may start a regular expression keep the rest of the line
+	("if (ok) /a  b/.test(s);", "if (ok) /a  b/.test(s);"),
+	("x++ / y;  // Comment", "x++ / y;  // Comment"),
+	("f() {}\n/a  b/.test(s);", "f() {}\n/a  b/.test(s);"),
+	("g(x)  /  2;\n\n  h()", "g(x) /  2;\nh()"),
+)
+
+SCRIPTS = (
+	(["var a = 1", "(function(){})()"], "var a = 1;\n(function(){})();"),
+	(["var a = 1;\n", "[1].map(f);"], "var a = 1;\n[1].map(f);"),
+	(["var a = 1 // A\n", "", "f()"], "var a = 1 // A\n;\nf();"),
+)
+
+def build( root, bundles ):
+	"""Builds the site, returning the builder."""
+	return TahcheeTest.build(root, BUNDLES=bundles)
+
+if __name__ == "__main__":
+	for text, expected in CSS:
+		assert minifyCSS(text) == expected, repr(minifyCSS(text))
+	for text, expected in JS:
+		assert minifyJS(text) == expected, repr(minifyJS(text))
+	for scripts, expected in SCRIPTS:
+		assert joinScripts(scripts) == expected, repr(joinScripts(scripts))
+	root = os.path.abspath(__file__ + ".test")
+	create(root)
+	pages = os.path.join(root, "Pages")
+	write(os.path.join(pages, "css/reset.css"), "* { margin: 0; }")
+	write(os.path.join(pages, "css/screen.css"), "body {\n  color: red;\n}")
+	write(os.path.join(pages, "js/b.js"), "var b = 2; // B")
+	write(os.path.join(pages, "js/a.js"), "var a = 1 // A")
+	write(os.path.join(pages, "js/c.js"), "(function(){})()")
+	bundles = {"all.css":["css/reset.css", "css/screen.css"], "js/all.js":["js/*.js"]}
+	# Bundles are written in the order of their members, and copied to the
+	# site output
+	b = build(root, bundles)
+	output = b.site.output()
+	assert read(os.path.join(output, "all.css")) == "*{margin:0}\nbody{color:red}\n"
+	assert read(os.path.join(output, "js/all.js")) == "var a = 1;\nvar b = 2;\n(function(){})();\n"
+	assert os.path.exists(os.path.join(root, "Bundles", "all.css"))
+	# Bundles are not written again when their members did not change, but
+	# missing outputs are copied again
+	for name in bundles.keys(): os.utime(os.path.join(root, "Bundles", name), (0, 0))
+	os.unlink(os.path.join(output, "all.css"))
+	b = build(root, bundles)
+	for name in bundles.keys():
+		assert os.stat(os.path.join(root, "Bundles", name)).st_mtime == 0
+	assert os.path.exists(os.path.join(output, "all.css"))
+	assert not b.changed[os.path.join(root, "Bundles", "js/all.js")]
+	# But they are when a member changed, reusing the minified version of the
+	# other members, which is cached in a file rather than in the state
+	write(os.path.join(pages, "css/screen.css"), "body { color: blue; }")
+	cache = os.path.join(root, "Bundles", ".minified")
+	reset = filter(lambda n:read(os.path.join(cache, n)) == "*{margin:0}", os.listdir(cache))[0]
+	assert b.state("bundles")["minified"] == dict.fromkeys(os.listdir(cache), True)
+	write(os.path.join(cache, reset), "*{margin:1px}")
+	b = build(root, bundles)
+	assert read(os.path.join(output, "all.css")) == "*{margin:1px}\nbody{color:blue}\n"
+	assert not b.changed[os.path.join(root, "Bundles", "js/all.js")]
+	assert len(b.state("bundles")["minified"]) == len(os.listdir(cache)) == 5
+	# And when their members change
+	bundles["all.css"] = ["css/screen.css"]
+	b = build(root, bundles)
+	assert read(os.path.join(output, "all.css")) == "body{color:blue}\n"
+	assert len(b.state("bundles")["minified"]) == len(os.listdir(cache)) == 4
+	# Removed bundles are removed
+	del bundles["all.css"]
+	b = build(root, bundles)
+	assert not os.path.exists(os.path.join(root, "Bundles", "all.css"))
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil, json
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+import TahcheeTest
+from TahcheeTest import write, create
+from tahchee.main import hashfunc
+from tahchee import manifest
+
+__doc__ = "Ensures that the build manifest is kept, and that orphans are removed."
+
+def build( root, paths=None, **options ):
+	"""Builds the site, returning the site and the manifest files."""
+	s = TahcheeTest.build(root, paths, **options).site
+	f = open(os.path.join(root, "Site", "Local.manifest"))
+	res = json.load(f)
+	f.close()
+	assert res["version"] == manifest.VERSION
+	return s, res["files"]
+
+if __name__ == "__main__":
+	root = os.path.abspath(__file__ + ".test")
+	create(root)
+	pages = os.path.join(root, "Pages")
+	write(os.path.join(pages, "index.html.tmpl"), "Index")
+	write(os.path.join(pages, "docs/old.html.tmpl"), "Old")
+	write(os.path.join(pages, "docs/images/logo.png"), "PNG")
+	write(os.path.join(pages, "style.css"), "body {}")
+	# The manifest lists the outputs with their source, digest and size
+	site, files = build(root, SITEMAP=True, COMPRESS=True)
+	output = site.output()
+	assert files["index.html"] == {"source":"Pages/index.html.tmpl",
+		"hash":"sha1:" + hashfunc("Index").hexdigest(), "size":5}, files["index.html"]
+	assert files["docs/images/logo.png"]["source"] == "Pages/docs/images/logo.png"
+	assert files["sitemap.xml"]["source"] is None
+	assert files["index.html.gz"]["source"] == "Site/Local/index.html"
+	assert files["style.css.gz"]["size"] == os.path.getsize(os.path.join(output, "style.css.gz"))
+	# Files that are not in the manifest are never removed
+	write(os.path.join(output, "robots.txt"), "")
+	# Orphans are removed, with the directories that become empty
+	previous = files
+	os.unlink(os.path.join(pages, "docs/old.html.tmpl"))
+	os.unlink(os.path.join(pages, "docs/images/logo.png"))
+	write(os.path.join(pages, "style.css"), "body {color:red}")
+	site, files = build(root, SITEMAP=True, COMPRESS=True)
+	assert not os.path.exists(os.path.join(output, "docs"))
+	assert not files.has_key("docs/old.html") and not files.has_key("docs/old.html.gz")
+	assert os.path.exists(os.path.join(output, "robots.txt"))
+	assert os.path.exists(os.path.join(output, "robots.txt.gz"))
+	assert files["robots.txt.gz"]["source"] == "Site/Local/robots.txt"
+	assert not files.has_key("robots.txt")
+	# Manifests can be compared
+	updated, removed = manifest.diff(previous, files)
+	assert updated == ["robots.txt.gz", "sitemap.xml", "sitemap.xml.gz", "style.css", "style.css.gz"], updated
+	assert removed == ["docs/images/logo.png", "docs/old.html", "docs/old.html.gz"], removed
+	# Sidecars are orphans when compression is disabled
+	site, files = build(root, SITEMAP=True)
+	assert not os.path.exists(os.path.join(output, "index.html.gz"))
+	assert not os.path.exists(os.path.join(output, "robots.txt.gz"))
+	assert os.path.exists(os.path.join(output, "robots.txt"))
+	# Partial builds do not remove anything
+	write(os.path.join(pages, "news.html.tmpl"), "News")
+	os.unlink(os.path.join(pages, "style.css"))
+	site, files = build(root, [os.path.join(pages, "news.html.tmpl")], SITEMAP=True)
+	assert files.has_key("news.html") and files.has_key("style.css")
+	assert os.path.exists(os.path.join(output, "style.css"))
+	site, files = build(root, SITEMAP=True)
+	assert not files.has_key("style.css")
+	assert not os.path.exists(os.path.join(output, "style.css"))
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
+import TahcheeTest
+from TahcheeTest import write, read, create
+from tahchee import main
+
+__doc__ = """Ensures that the local and remote modes can be built in one pass,
+sharing the hashing and compilation, with resources linked between modes."""
+
+HASHED   = []
+COMPILED = []
+
+def hashFile( path, algorithm="sha1", _hashFile=main.hashFile ):
+	HASHED.append(path)
+	return _hashFile(path, algorithm)
+
+def Compiler( _Compiler=main.Compiler, **kwargs ):
+	COMPILED.append(kwargs["file"])
+	return _Compiler(**kwargs)
+
+def build( root, modes=None, **options ):
+	"""Builds the site, returning the builder and the sources that were
+	hashed."""
+	del HASHED[:]
+	b = TahcheeTest.build(root, None, modes, **options)
+	return b, filter(lambda p:p.startswith(os.path.join(root, "Pages")), HASHED)
+
+if __name__ == "__main__":
+	main.hashFile = hashFile
+	main.Compiler = Compiler
+	root = os.path.abspath(__file__ + ".test")
+	create(root)
+	pages  = os.path.join(root, "Pages")
+	local  = os.path.join(root, "Site", "Local")
+	remote = os.path.join(root, "Site", "Remote")
+	write(os.path.join(root, "Templates", "Page.tmpl"), "#def content\n#end def\n<p>$content</p>\n")
+	write(os.path.join(pages, "index.html.tmpl"), "#extends Templates.Page\n#def content\n$site.mode()\n#end def\n")
+	write(os.path.join(pages, "logo.png"), "PNG")
+	write(os.path.join(pages, "js/a.js"), "var a = 1;")
+	# Pages are rendered for each mode, while the templates are compiled and
+	# the resources hashed once
+	b, hashed = build(root, ("local", "remote"), CHANGE="signature")
+	assert b.site.mode() == "local"
+	assert "".join(read(os.path.join(local, "index.html")).split()) == "<p>local</p>"
+	assert "".join(read(os.path.join(remote, "index.html")).split()) == "<p>remote</p>"
+	assert len(COMPILED) == 1, COMPILED
+	# (while they are copied for the first mode)
+	assert hashed == [], hashed
+	# Resources are copied once and linked in the other mode
+	for name in ("logo.png", "js/a.js"):
+		assert os.path.samefile(os.path.join(local, name), os.path.join(remote, name))
+	assert os.path.exists(local + ".manifest") and os.path.exists(remote + ".manifest")
+	# Each mode keeps its checksums, so that it can also be built alone
+	del COMPILED[:]
+	b, hashed = build(root, ["remote"], CHANGE="signature")
+	assert filter(lambda p:b.changed[p], b.changed.keys()) == []
+	b, hashed = build(root, None, CHANGE="signature")
+	assert filter(lambda p:b.changed[p], b.changed.keys()) == []
+	assert not COMPILED
+	# Changed resources are copied for each mode, and a mode built alone
+	# does not change the files of the other mode
+	write(os.path.join(pages, "logo.png"), "PNG changed")
+	b, hashed = build(root, ("local", "remote"), CHANGE="signature")
+	hashed.sort()
+	assert hashed == [os.path.join(pages, "js/a.js"), os.path.join(pages, "logo.png")], hashed
+	assert read(os.path.join(remote, "logo.png")) == "PNG changed"
+	assert os.path.samefile(os.path.join(local, "logo.png"), os.path.join(remote, "logo.png"))
+	write(os.path.join(pages, "logo.png"), "PNG local")
+	b, hashed = build(root, None, CHANGE="signature")
+	assert read(os.path.join(local, "logo.png")) == "PNG local"
+	assert read(os.path.join(remote, "logo.png")) == "PNG changed"
+	# Missing outputs of the other modes are restored
+	os.unlink(os.path.join(remote, "js/a.js"))
+	b, hashed = build(root, ("local", "remote"), CHANGE="signature")
+	assert read(os.path.join(remote, "js/a.js")) == "var a = 1;"
+	assert read(os.path.join(remote, "logo.png")) == "PNG local"
+	# Resources that were not copied for the first mode are copied
+	assert not os.path.samefile(os.path.join(local, "logo.png"), os.path.join(remote, "logo.png"))
+	# The same goes when changes are detected by modification time
+	write(os.path.join(pages, "js/a.js"), "var a = 2;")
+	os.utime(os.path.join(pages, "js/a.js"), (0, 0))
+	b, hashed = build(root, ("remote", "local"), CHANGE="date")
+	assert b.site.mode() == "local"
+	assert read(os.path.join(local, "js/a.js")) == "var a = 2;"
+	assert os.path.samefile(os.path.join(local, "js/a.js"), os.path.join(remote, "js/a.js"))
+	# A linked resource that becomes a page does not change the other mode
+	for name in ("data.txt", "data.html"):
+		write(os.path.join(pages, name), "DATA")
+	b, hashed = build(root, ("local", "remote"), CHANGE="signature")
+	for name in ("data.txt", "data.html"):
+		assert os.path.samefile(os.path.join(local, name), os.path.join(remote, name))
+		os.unlink(os.path.join(pages, name))
+		write(os.path.join(pages, name + ".tmpl"), "$site.mode()")
+	b, hashed = build(root, ["remote"], CHANGE="signature")
+	for name in ("data.txt", "data.html"):
+		assert read(os.path.join(remote, name)).strip() == "remote"
+		assert read(os.path.join(local, name)) == "DATA"
+	shutil.rmtree(root)
+	print "OK"
+
+# EOF
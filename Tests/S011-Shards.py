@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# vim: tw=80 ts=4 sw=4 noet
+# -----------------------------------------------------------------------------
+# Project   : Tahchee
+# -----------------------------------------------------------------------------
+
+import sys, os, shutil, json, subprocess
+sources = os.path.dirname(os.path.abspath(__file__)) + "/../Sources"
+sys.path.insert(0, sources)
+import TahcheeTest
+from TahcheeTest import write, read
+from tahchee import main, sharding
+
+__doc__ = """Ensures that a site built in shards, by several processes and in
+several directories, gives the same result as a site built at once."""
+
+OPTIONS = """
+SHOW_MAIN   = False
+SITEMAP     = True
+FINGERPRINT = ["*.css"]
+"""
+
+def create( root ):
+	"""Creates a site with pages extending two templates in several
+	directories, and resources."""
+	TahcheeTest.create(root)
+	write(os.path.join(root, "build.py"), main.BUILD_PY_TEMPLATE % (
+		main.BUILD_PY_DEFAULTS % (TahcheeTest.URL) + OPTIONS))
+	templates = os.path.join(root, "Templates")
+	write(os.path.join(templates, "Page.tmpl"), "#def content\n#end def\n<p>$content</p>\n")
+	write(os.path.join(templates, "News.tmpl"), "#extends Templates.Page\n#def content\nNews\n#end def\n")
+	pages = os.path.join(root, "Pages")
+	write(os.path.join(pages, "index.html.tmpl"), "#extends Templates.Page\n#def content\n<a href=\"$linking.link($page.path, 'screen.css')\">CSS</a>\n#end def\n")
+	write(os.path.join(pages, "screen.css"), "body {}")
+	for i in range(12):
+		write(os.path.join(pages, "docs/%d.html.tmpl" % (i)), "#extends Templates.Page\n#def content\nDoc %d\n#end def\n" % (i))
+		write(os.path.join(pages, "news/%d.html.tmpl" % (i)), "#extends Templates.News\n")
+		write(os.path.join(pages, "images/%d.png" % (i)), "PNG %d" % (i))
+
+def run( root, *args ):
+	"""Starts build.py with the given arguments in the given directory."""
+	env = dict(os.environ)
+	env["PYTHONPATH"] = os.path.abspath(sources)
+	out = open(os.path.join(root, "build.log"), "ab")
+	return subprocess.Popen([sys.executable, "build.py"] + list(args), cwd=root,
+	env=env, stdout=out, stderr=subprocess.STDOUT)
+
+def wait( processes ):
+	for process in processes: assert process.wait() == 0
+
+def outputs( root ):
+	"""Returns the files of the site output with their content."""
+	res    = {}
+	output = os.path.join(root, "Site", "Local")
+	for directory, dirs, files in os.walk(output):
+		for name in files:
+			path = os.path.join(directory, name)
+			res[path[len(output)+1:]] = read(path)
+	return res
+
+def manifest( root ):
+	return json.loads(read(os.path.join(root, "Site", "Local.manifest")))["files"]
+
+def gather( root, shards ):
+	"""Copies the checksums delta, partial manifest and outputs of each of the
+	given shard directories to the given site directory."""
+	for i in range(len(shards)):
+		suffix  = sharding.suffix(i + 1, len(shards))
+		partial = os.path.join("Site", "Local.manifest" + suffix)
+		paths   = ["site.checksums" + suffix, partial]
+		for path in json.loads(read(os.path.join(shards[i], partial)))["files"].keys():
+			paths.append(os.path.join("Site", "Local", path))
+		for path in paths:
+			if not os.path.exists(os.path.dirname(os.path.join(root, path))):
+				os.makedirs(os.path.dirname(os.path.join(root, path)))
+			shutil.copy2(os.path.join(shards[i], path), os.path.join(root, path))
+
+def rebuilt( root ):
+	"""Builds the site in this process, returning the files that changed."""
+	return TahcheeTest.changed(TahcheeTest.build(root, SITEMAP=True, FINGERPRINT=["*.css"]))
+
+if __name__ == "__main__":
+	base = os.path.abspath(__file__ + ".test")
+	if os.path.exists(base): shutil.rmtree(base)
+	root      = os.path.join(base, "Sharded")
+	reference = os.path.join(base, "Reference")
+	create(root)
+	# Shards are given as INDEX/COUNT
+	assert sharding.parse("2/3") == (2, 3)
+	for text in ("0/3", "4/3", "3", "a/b"):
+		try:
+			sharding.parse(text)
+			assert False, text
+		except ValueError:
+			pass
+	# Every file has one shard, and pages that share their template and
+	# directory share their shard, unless their group is too large
+	pages     = map(lambda i:("docs/%d.html" % (i), "Templates.Page"), range(4))
+	pages    += map(lambda i:("news/%d.html" % (i), "Templates.News"), range(4))
+	pages    += map(lambda i:("%d/index.html" % (i), "Templates.Page"), range(16))
+	resources = map(lambda i:"images/%d.png" % (i), range(20))
+	shards    = sharding.partition(pages, resources, 2)
+	assert shards == sharding.partition(pages, resources, 2)
+	assert len(shards) == 44 and not filter(lambda i:i not in (1, 2), shards.values())
+	assert len(dict.fromkeys(map(lambda p:shards[p[0]], pages[:4]))) == 1
+	assert len(dict.fromkeys(map(lambda p:shards[p[0]], pages[4:8]))) == 1
+	assert len(dict.fromkeys(map(lambda p:shards[p], resources))) == 2
+	shards = sharding.partition(pages[:4] * 10, [], 2)
+	assert len(dict.fromkeys(shards.values())) == 2
+	# Deltas are applied to nested dictionaries, and keep the changes of the
+	# other deltas
+	previous = {"a":{"x":1, "y":2}, "b":{}}
+	current  = {"a":{"x":1, "z":3}, "b":{"w":4}}
+	changes  = sharding.delta(sharding.flatten(previous), sharding.flatten(current))
+	assert sharding.apply({"a":{"x":1, "y":2}, "b":{"v":5}}, changes) == \
+	{"a":{"x":1, "z":3}, "b":{"v":5, "w":4}}
+	# The shards are built by parallel processes in the same directory, and
+	# give the same site as a build at once
+	shutil.copytree(root, reference)
+	wait([run(reference, "local")])
+	wait(map(lambda i:run(root, "local", "--shard", "%d/3" % (i)), range(1, 4)))
+	assert not os.path.exists(os.path.join(root, "site.checksums"))
+	files = {}
+	for i in range(1, 4):
+		partial = json.loads(read(os.path.join(root, "Site", "Local.manifest.%d-3" % (i))))["files"]
+		assert partial, i
+		for path in partial.keys():
+			assert not files.has_key(path), path
+			files[path] = i
+	wait([run(root, "local", "--merge", "3")])
+	assert outputs(root) == outputs(reference)
+	assert manifest(root) == manifest(reference)
+	assert not filter(lambda n:n.find(".manifest.") != -1 or n.startswith("site.checksums."),
+	os.listdir(root) + os.listdir(os.path.join(root, "Site")))
+	assert rebuilt(root) == []
+	# Shards built in other directories (like on other machines) are merged
+	# once gathered in the site directory, and removed files are removed
+	write(os.path.join(root, "Pages", "docs/1.html.tmpl"), "#extends Templates.Page\n#def content\nChanged\n#end def\n")
+	write(os.path.join(root, "Pages", "screen.css"), "body {color:red}")
+	os.unlink(os.path.join(root, "Pages", "news/2.html.tmpl"))
+	os.unlink(os.path.join(root, "Pages", "images/3.png"))
+	machines = map(lambda i:os.path.join(base, "Machine%d" % (i)), range(1, 4))
+	for i in range(3):
+		shutil.copytree(root, machines[i])
+		wait([run(machines[i], "local", "--shard", "%d/3" % (i + 1))])
+	gather(root, machines)
+	wait([run(root, "local", "--merge", "3")])
+	shutil.rmtree(reference)
+	shutil.copytree(os.path.join(root, "Pages"), os.path.join(reference, "Pages"))
+	shutil.copytree(os.path.join(root, "Templates"), os.path.join(reference, "Templates"))
+	os.makedirs(os.path.join(reference, "Site", "Local"))
+	shutil.copy(os.path.join(root, "build.py"), reference)
+	wait([run(reference, "local")])
+	assert outputs(root) == outputs(reference)
+	assert not outputs(root).has_key("news/2.html") and not outputs(root).has_key("images/3.png")
+	assert outputs(root)["docs/1.html"].find("Changed") != -1
+	assert rebuilt(root) == []
+	# Merging requires every shard
+	process = run(root, "local", "--merge", "2")
+	assert process.wait() != 0
+	shutil.rmtree(base)
+	print "OK"
+
+# EOF
@@ -10,11 +10,72 @@
 #             20-Feb-2006 - First implementation
 # -----------------------------------------------------------------------------
 
-import os, re, time
+import sys, os, re, time, shutil
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + "/../Sources")
 
 TEST_FILE  = re.compile("^([A-Z][0-9]+)\-(\w+)\.py$")
 TEST_FILES = {}
 
+# The URL of the sites built by the tests
+URL        = "http://www.pouet.org"
+
+#------------------------------------------------------------------------------
+#
+#  Fixtures
+#
+#------------------------------------------------------------------------------
+
+def write( path, content, mtime=None ):
+	"""Writes the given content to the file with the given path, creating its
+	directory, and sets its modification time when given."""
+	if not os.path.exists(os.path.dirname(path)): os.makedirs(os.path.dirname(path))
+	f = open(path, "wb")
+	f.write(content)
+	f.close()
+	if mtime: os.utime(path, (mtime, mtime))
+
+def read( path ):
+	f = open(path, "rb")
+	res = f.read()
+	f.close()
+	return res
+
+def output( site, path ):
+	"""Returns the content of the file with the given path in the output of
+	the given site."""
+	return read(os.path.join(site.output(), path))
+
+def create( root ):
+	"""Creates the directories of an empty site project in the given
+	directory, removing it first if it exists."""
+	if os.path.exists(root): shutil.rmtree(root)
+	for path in ("Pages", "Templates", "Site/Local", "Site/Remote"):
+		os.makedirs(os.path.join(root, path))
+	return root
+
+def build( root, paths=None, modes=None, **options ):
+	"""Builds the site project in the given directory with the given options
+	(see `Site`), returning the builder. The main page is not shown, unless
+	the options say otherwise."""
+	from tahchee.main import Site, SiteBuilder
+	options.setdefault("SHOW_MAIN", False)
+	b = SiteBuilder(Site(URL, root=root, **options))
+	b.build(paths, modes)
+	return b
+
+def changed( builder ):
+	"""Returns the sorted list of the files that changed in the last build of
+	the given builder."""
+	res = filter(lambda p:builder.changed[p], builder.changed.keys())
+	res.sort()
+	return res
+
+#------------------------------------------------------------------------------
+#
+#  Runner
+#
+#------------------------------------------------------------------------------
+
 def do():
 	# We populate the test files hash table
 	this_dir = os.path.abspath(os.path.dirname(__file__))